@@ -0,0 +1,581 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-memory stand-ins for the Google Cloud services used by the samples.
+
+They implement only the calls the benchmarked code paths make, keep every
+object in memory and record each call, so benchmarks run without network
+access or credentials.
+"""
+
+from collections import Counter
+import copy
+from datetime import datetime
+from datetime import timezone
+import functools
+import io
+import itertools
+import operator
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+
+from google.api_core.exceptions import AlreadyExists
+from google.api_core.exceptions import InvalidArgument
+from google.api_core.exceptions import NotFound
+
+
+class FakeGcs:
+    """Object store shared by all the fake storage clients created from it."""
+
+    def __init__(self):
+        self.objects: Dict[Tuple[str, str], "FakeBlob"] = {}
+        self.calls: Counter = Counter()
+        self._generations = itertools.count(1)
+
+    def module(self) -> SimpleNamespace:
+        """Returns a replacement for the `google.cloud.storage` module."""
+        gcs = self
+
+        class Blob(FakeBlob):
+            @classmethod
+            def from_string(cls, uri: str, client: Optional["FakeStorageClient"]):
+                bucket_name, name = uri.replace("gs://", "").split("/", 1)
+                return FakeBlob(name, FakeBucket(gcs, bucket_name))
+
+        return SimpleNamespace(
+            Client=lambda *args, **kwargs: FakeStorageClient(self),
+            Blob=Blob,
+        )
+
+    def put(
+        self,
+        bucket_name: str,
+        name: str,
+        data: bytes,
+        content_type: str = "application/octet-stream",
+    ) -> "FakeBlob":
+        """Stores an object without recording an upload call."""
+        blob = FakeBlob(name, FakeBucket(self, bucket_name))
+        blob.data = data
+        blob.content_type = content_type
+        blob.generation = next(self._generations)
+        self.objects[(bucket_name, name)] = blob
+        return blob
+
+    def list(self, bucket_name: str, prefix: str = "") -> List["FakeBlob"]:
+        return [
+            blob
+            for (bucket, name), blob in sorted(self.objects.items())
+            if bucket == bucket_name and name.startswith(prefix)
+        ]
+
+
+class FakeBlob:
+    def __init__(self, name: str, bucket: "FakeBucket"):
+        self.name = name
+        self.bucket = bucket
+        self.data: Optional[bytes] = None
+        self.content_type: Optional[str] = None
+        self.cache_control: Optional[str] = None
+        self.metadata: Optional[Dict[str, str]] = None
+        self.generation: Optional[int] = None
+
+    @property
+    def size(self) -> Optional[int]:
+        return None if self.data is None else len(self.data)
+
+    def _stored(self) -> "FakeBlob":
+        blob = self.bucket.gcs.objects.get((self.bucket.name, self.name))
+        if blob is None:
+            raise FileNotFoundError(f"gs://{self.bucket.name}/{self.name}")
+        return blob
+
+    def upload_from_string(self, data, content_type: Optional[str] = None, **_):
+        self.bucket.gcs.calls["upload"] += 1
+        self.data = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        self.content_type = content_type or self.content_type
+        self.generation = next(self.bucket.gcs._generations)
+        self.bucket.gcs.objects[(self.bucket.name, self.name)] = self
+
+    def upload_from_filename(self, filename: str, content_type=None, **_):
+        with open(filename, "rb") as file:
+            self.upload_from_string(file.read(), content_type=content_type)
+
+    def download_as_bytes(self, start=None, end=None, **_) -> bytes:
+        self.bucket.gcs.calls["download"] += 1
+        data = self._stored().data or b""
+        if start is not None or end is not None:
+            data = data[start or 0 : None if end is None else end + 1]
+        self.bucket.gcs.calls["downloaded_bytes"] += len(data)
+        return data
+
+    def download_as_text(self, **kwargs) -> str:
+        return self.download_as_bytes(**kwargs).decode("utf-8")
+
+    def download_to_filename(self, filename: str, **kwargs):
+        with open(filename, "wb") as file:
+            file.write(self.download_as_bytes(**kwargs))
+
+    def open(self, mode: str = "rb", **_) -> io.BytesIO:
+        return io.BytesIO(self.download_as_bytes())
+
+    def exists(self, **_) -> bool:
+        return (self.bucket.name, self.name) in self.bucket.gcs.objects
+
+    def patch(self, **_):
+        self.bucket.gcs.calls["patch"] += 1
+        self._stored().metadata = self.metadata
+
+
+class FakeBucket:
+    def __init__(self, gcs: FakeGcs, name: str):
+        self.gcs = gcs
+        self.name = name
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(name, self)
+
+    def get_blob(self, name: str) -> Optional[FakeBlob]:
+        self.gcs.calls["get_blob"] += 1
+        return self.gcs.objects.get((self.name, name))
+
+    def list_blobs(self, prefix: str = "", **_) -> Iterator[FakeBlob]:
+        self.gcs.calls["list"] += 1
+        return iter(self.gcs.list(self.name, prefix))
+
+
+class FakeStorageClient:
+    def __init__(self, gcs: FakeGcs):
+        self.gcs = gcs
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self.gcs, bucket_name)
+
+    def get_bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self.gcs, bucket_name)
+
+    def list_blobs(self, bucket_name: str, prefix: str = "", **_):
+        return self.bucket(bucket_name).list_blobs(prefix=prefix)
+
+
+class FakeBigQuery:
+    """
+    Records streaming inserts.
+
+    Implements the write_records() method of the bq-connector StorageManager,
+    so it can back a BufferedWriter directly.
+    """
+
+    def __init__(self, errors_per_row: Optional[List[dict]] = None):
+        self.rows: Dict[str, List[dict]] = {}
+        self.calls: Counter = Counter()
+        self.errors_per_row = errors_per_row or []
+
+    def write_records(self, table_id: str, records: List[dict]) -> List[dict]:
+        self.calls["insert_rows_json"] += 1
+        self.rows.setdefault(table_id, []).extend(records)
+        if not self.errors_per_row:
+            return []
+        return [
+            {"index": index, "errors": self.errors_per_row}
+            for index in range(len(records))
+        ]
+
+    def insert_rows_json(self, table, json_rows: List[dict], **_) -> List[dict]:
+        return self.write_records(str(table), json_rows)
+
+
+class FakePubSub:
+    """Records the messages published through the fake publisher clients."""
+
+    def __init__(self):
+        self.messages: Dict[str, List[bytes]] = {}
+        self.calls: Counter = Counter()
+
+    def module(self) -> SimpleNamespace:
+        """Returns a replacement for the `google.cloud.pubsub_v1` module."""
+        return SimpleNamespace(PublisherClient=lambda *args, **kwargs: self)
+
+    def topic_path(self, project: str, topic: str) -> str:
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic: str, data: bytes, **_) -> SimpleNamespace:
+        self.calls["publish"] += 1
+        self.messages.setdefault(topic, []).append(data)
+        message_id = str(self.calls["publish"])
+        return SimpleNamespace(result=lambda *args, **kwargs: message_id)
+
+
+FIRESTORE_MAX_WRITES = 500
+
+_FIRESTORE_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, values: value in values,
+    "not-in": lambda value, values: value not in values,
+    "array_contains": lambda value, item: isinstance(value, list) and item in value,
+}
+
+
+def _firestore_value(value: Any) -> Any:
+    """Stores datetimes as timezone aware UTC values, as Firestore returns them."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    if isinstance(value, dict):
+        return {key: _firestore_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_firestore_value(item) for item in value]
+    return value
+
+
+def _firestore_comparable(value: Any, other: Any) -> bool:
+    """Filters only match values of the same type, None only matches ==/!=."""
+    if value is None or other is None:
+        return False
+    if isinstance(value, (int, float)) and isinstance(other, (int, float)):
+        return True
+    return type(value) is type(other)
+
+
+class FakeFirestore:
+    """Collections shared by all the fake Firestore clients created from it."""
+
+    def __init__(self):
+        self.collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.calls: Counter = Counter()
+
+    def module(self) -> SimpleNamespace:
+        """Returns a replacement for the `google.cloud.firestore` module."""
+        return SimpleNamespace(
+            Client=lambda *args, **kwargs: FakeFirestoreClient(self),
+            transactional=fake_transactional,
+            Transaction=FakeTransaction,
+            Query=FakeQuery,
+            DocumentReference=FakeDocumentReference,
+            DocumentSnapshot=FakeDocumentSnapshot,
+        )
+
+    def documents(self, collection: str) -> Dict[str, Dict[str, Any]]:
+        """Returns the stored documents of a collection, keyed by ID."""
+        return self.collections.setdefault(collection, {})
+
+    def _write(self, kind: str, reference: "FakeDocumentReference", data=None):
+        documents = self.documents(reference.collection)
+        if kind == "create" and reference.id in documents:
+            raise AlreadyExists(f"Document already exists: {reference.path}")
+        if kind == "update":
+            if reference.id not in documents:
+                raise NotFound(f"No document to update: {reference.path}")
+            documents[reference.id].update(_firestore_value(copy.deepcopy(data)))
+        elif kind == "delete":
+            documents.pop(reference.id, None)
+        elif kind == "merge":
+            documents.setdefault(reference.id, {}).update(
+                _firestore_value(copy.deepcopy(data))
+            )
+        else:
+            documents[reference.id] = _firestore_value(copy.deepcopy(data))
+        self.calls["write"] += 1
+
+
+class FakeFirestoreClient:
+    def __init__(self, store: FakeFirestore):
+        self.store = store
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self.store, name)
+
+    def batch(self) -> "FakeWriteBatch":
+        return FakeWriteBatch(self.store)
+
+    def transaction(self, **_) -> "FakeTransaction":
+        return FakeTransaction(self.store)
+
+    def get_all(self, references: Iterable["FakeDocumentReference"], **_):
+        for reference in references:
+            yield reference.get()
+
+
+class FakeDocumentSnapshot:
+    def __init__(
+        self, reference: "FakeDocumentReference", data: Optional[Dict[str, Any]]
+    ):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str) -> Any:
+        return (self._data or {}).get(field_path)
+
+
+class FakeDocumentReference:
+    def __init__(self, store: FakeFirestore, collection: str, document_id: str):
+        self.store = store
+        self.collection = collection
+        self.id = document_id
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection}/{self.id}"
+
+    def get(self, **_) -> FakeDocumentSnapshot:
+        self.store.calls["read"] += 1
+        return FakeDocumentSnapshot(
+            self, self.store.documents(self.collection).get(self.id)
+        )
+
+    def create(self, data: Dict[str, Any]):
+        self.store._write("create", self, data)
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self.store._write("merge" if merge else "set", self, data)
+
+    def update(self, data: Dict[str, Any]):
+        self.store._write("update", self, data)
+
+    def delete(self):
+        self.store._write("delete", self)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeDocumentReference) and self.path == other.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+
+class FakeQuery:
+    def __init__(
+        self,
+        store: FakeFirestore,
+        collection: str,
+        filters: Tuple[Tuple[str, str, Any], ...] = (),
+        orders: Tuple[Tuple[str, str], ...] = (),
+        limit: Optional[int] = None,
+    ):
+        self.store = store
+        self.collection = collection
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit
+
+    def _copy(
+        self,
+        filters: Optional[Tuple[Tuple[str, str, Any], ...]] = None,
+        orders: Optional[Tuple[Tuple[str, str], ...]] = None,
+        limit: Optional[int] = None,
+    ) -> "FakeQuery":
+        return FakeQuery(
+            self.store,
+            self.collection,
+            self._filters if filters is None else filters,
+            self._orders if orders is None else orders,
+            self._limit if limit is None else limit,
+        )
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = (
+                filter.field_path,
+                filter.op_string,
+                filter.value,
+            )
+        if op_string not in _FIRESTORE_OPERATORS:
+            raise ValueError(f"Unsupported operator: {op_string}")
+        condition = (field_path, op_string, _firestore_value(value))
+        return self._copy(filters=self._filters + (condition,))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def _matches(self, data: Dict[str, Any]) -> bool:
+        for field_path, op_string, value in self._filters:
+            if field_path not in data:
+                return False
+            field_value = data[field_path]
+            if op_string in ("==", "!="):
+                if op_string == "==" and field_value != value:
+                    return False
+                if op_string == "!=" and (field_value is None or field_value == value):
+                    return False
+            elif op_string in ("in", "not-in", "array_contains"):
+                if not _FIRESTORE_OPERATORS[op_string](field_value, value):
+                    return False
+            elif not _firestore_comparable(field_value, value) or not (
+                _FIRESTORE_OPERATORS[op_string](field_value, value)
+            ):
+                return False
+        # Documents without an ordered field are left out of the results
+        return all(field_path in data for field_path, _ in self._orders)
+
+    def stream(self, transaction: Optional["FakeTransaction"] = None, **_):
+        if transaction is not None:
+            transaction._check_read()
+        documents = self.store.documents(self.collection)
+        matches = [
+            (document_id, data)
+            for document_id, data in sorted(documents.items())
+            if self._matches(data)
+        ]
+        for field_path, direction in reversed(self._orders):
+            matches.sort(
+                key=lambda item: item[1][field_path],
+                reverse=direction == "DESCENDING",
+            )
+        if self._limit is not None:
+            matches = matches[: self._limit]
+        self.store.calls["query"] += 1
+        self.store.calls["read"] += max(1, len(matches))
+        for document_id, data in matches:
+            reference = FakeDocumentReference(self.store, self.collection, document_id)
+            yield FakeDocumentSnapshot(reference, copy.deepcopy(data))
+
+    def get(self, transaction: Optional["FakeTransaction"] = None, **_):
+        return list(self.stream(transaction=transaction))
+
+    def count(self, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return FakeAggregationQuery(self, alias or "count")
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, store: FakeFirestore, name: str):
+        super().__init__(store, name)
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(
+            self.store, self.collection, document_id or uuid.uuid4().hex
+        )
+
+    def add(self, data: Dict[str, Any]) -> Tuple[datetime, FakeDocumentReference]:
+        reference = self.document()
+        reference.set(data)
+        return datetime.now(timezone.utc), reference
+
+
+class FakeAggregationQuery:
+    def __init__(self, query: FakeQuery, alias: str):
+        self.query = query
+        self.alias = alias
+
+    def stream(self, transaction: Optional["FakeTransaction"] = None, **_):
+        if transaction is not None:
+            transaction._check_read()
+        documents = self.query.store.documents(self.query.collection)
+        count = sum(1 for data in documents.values() if self.query._matches(data))
+        if self.query._limit is not None:
+            count = min(count, self.query._limit)
+        self.query.store.calls["aggregation"] += 1
+        yield [SimpleNamespace(alias=self.alias, value=count)]
+
+    def get(self, transaction: Optional["FakeTransaction"] = None, **_):
+        return list(self.stream(transaction=transaction))
+
+
+class FakeWriteBatch:
+    def __init__(self, store: FakeFirestore):
+        self.store = store
+        self._writes: List[Tuple[str, FakeDocumentReference, Any]] = []
+
+    def _add(self, kind: str, reference: FakeDocumentReference, data=None):
+        self._writes.append((kind, reference, data))
+
+    def create(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._add("create", reference, data)
+
+    def set(self, reference: FakeDocumentReference, data, merge: bool = False):
+        self._add("merge" if merge else "set", reference, data)
+
+    def update(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._add("update", reference, data)
+
+    def delete(self, reference: FakeDocumentReference):
+        self._add("delete", reference)
+
+    def commit(self):
+        """Applies every write, or none of them if one would fail."""
+        writes, self._writes = self._writes, []
+        if len(writes) > FIRESTORE_MAX_WRITES:
+            raise InvalidArgument(f"At most {FIRESTORE_MAX_WRITES} writes per commit")
+        self.store.calls["commit"] += 1
+        existing: Dict[FakeDocumentReference, bool] = {}
+        for kind, reference, _ in writes:
+            exists = existing.get(
+                reference, reference.id in self.store.documents(reference.collection)
+            )
+            if kind == "create" and exists:
+                raise AlreadyExists(f"Document already exists: {reference.path}")
+            if kind == "update" and not exists:
+                raise NotFound(f"No document to update: {reference.path}")
+            existing[reference] = kind != "delete"
+        for kind, reference, data in writes:
+            self.store._write(kind, reference, data)
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Reads directly from the store and buffers writes until commit. Like
+    Firestore, it rejects reads issued after the first write.
+    """
+
+    def _check_read(self):
+        if self._writes:
+            raise ValueError(
+                "Transactions require all reads to be executed before all writes."
+            )
+
+    def get(self, reference_or_query, **_):
+        # Aggregation queries are not accepted, they run in the transaction
+        # through their own get
+        if isinstance(reference_or_query, FakeDocumentReference):
+            return self.get_all([reference_or_query])
+        if isinstance(reference_or_query, FakeQuery):
+            return reference_or_query.stream(transaction=self)
+        raise ValueError(
+            'Value for argument "ref_or_query" must be a DocumentReference or a Query.'
+        )
+
+    def get_all(self, references: Iterable[FakeDocumentReference], **_):
+        self._check_read()
+        return iter([reference.get() for reference in references])
+
+
+def fake_transactional(function: Callable) -> Callable:
+    """Replacement for `firestore.transactional`, committing once the function
+    returns. Transactions never conflict, so they are not retried."""
+
+    @functools.wraps(function)
+    def run(transaction: FakeTransaction, *args, **kwargs):
+        result = function(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+
+    return run
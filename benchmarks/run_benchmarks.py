@@ -0,0 +1,506 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline benchmarks for the hot paths of the samples.
+
+Every benchmark runs against synthetic Document AI output and in-memory fakes
+of Cloud Storage, BigQuery, Firestore and Pub/Sub, so results are reproducible
+and need neither network access nor credentials. For each benchmark the harness
+reports the throughput, the latency percentiles and the peak Python heap of one
+run. The heap is traced with tracemalloc, which does not see memory allocated
+by native libraries such as Pillow or pdfium.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--pages 20] [--shards 4] [name ...]
+"""
+
+import argparse
+import contextlib
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+import importlib.util
+import io
+import json
+from pathlib import Path
+import random
+import sys
+import time
+import tracemalloc
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fakes import FakeBigQuery
+from fakes import FakeFirestore
+from fakes import FakeGcs
+from fakes import FakePubSub
+import synthetic
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class BenchmarkConfig:
+    pages: int = 20
+    tokens_per_page: int = 300
+    entities: int = 100
+    entity_types: int = 10
+    shards: int = 4
+    folders: int = 3
+    queue_documents: int = 500
+    iterations: int = 10
+    warmup: int = 1
+    seed: int = 0
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    unit: str
+    units_per_run: int
+    latencies: List[float] = field(default_factory=list)
+    # Peak of the Python heap, native allocations are not included
+    peak_python_heap: int = 0
+
+    def percentile(self, percent: float) -> float:
+        """Returns the latency percentile, using the nearest-rank method."""
+        ordered = sorted(self.latencies)
+        rank = max(1, round(percent / 100 * len(ordered)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    @property
+    def throughput(self) -> float:
+        total = sum(self.latencies)
+        return self.units_per_run * len(self.latencies) / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = asdict(self)
+        result.update(
+            throughput=self.throughput,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+        )
+        return result
+
+
+# A benchmark setup builds its inputs and returns the function to time, the
+# number of units processed by one call and the name of the unit.
+BenchmarkSetup = Callable[[BenchmarkConfig], Tuple[Callable[[], Any], int, str]]
+
+BENCHMARKS: Dict[str, BenchmarkSetup] = {}
+
+
+def benchmark(name: str) -> Callable[[BenchmarkSetup], BenchmarkSetup]:
+    def register(setup: BenchmarkSetup) -> BenchmarkSetup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def load_module(name: str, path: str, search_path: Optional[str] = None) -> ModuleType:
+    """Imports a sample module from its file, under a unique module name."""
+    if search_path is not None and str(REPO_ROOT / search_path) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT / search_path))
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, REPO_ROOT / path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+@contextlib.contextmanager
+def replaced_cloud_modules(**modules: Any) -> Iterator[None]:
+    """Replaces `google.cloud` client modules while sample modules are imported."""
+    # pylint: disable=import-outside-toplevel
+    import google.cloud
+
+    saved = {}
+    for name, module in modules.items():
+        saved[name] = (
+            sys.modules.get(f"google.cloud.{name}"),
+            getattr(google.cloud, name, None),
+        )
+        sys.modules[f"google.cloud.{name}"] = module
+        setattr(google.cloud, name, module)
+    try:
+        yield
+    finally:
+        for name, (module, attribute) in saved.items():
+            if module is None:
+                sys.modules.pop(f"google.cloud.{name}", None)
+            else:
+                sys.modules[f"google.cloud.{name}"] = module
+            if attribute is None:
+                delattr(google.cloud, name)
+            else:
+                setattr(google.cloud, name, attribute)
+
+
+def make_document(config: BenchmarkConfig, **kwargs) -> Dict[str, Any]:
+    kwargs.setdefault("entity_types", config.entity_types)
+    return synthetic.make_document(
+        pages=config.pages,
+        tokens_per_page=config.tokens_per_page,
+        entities=config.entities,
+        seed=config.seed,
+        **kwargs,
+    )
+
+
+@benchmark("bq_document_mapper")
+def bq_document_mapper(config: BenchmarkConfig):
+    if str(REPO_ROOT / "bq-connector") not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT / "bq-connector"))
+    # pylint: disable=import-outside-toplevel
+    from docai_bq_connector.bigquery.BufferedWriter import BufferedWriter
+    from docai_bq_connector.bigquery.SchemaIndex import SchemaIndex
+    from docai_bq_connector.connector.BqDocumentMapper import BqDocumentMapper
+    from docai_bq_connector.connector.BqMetadataMapper import BqMetadataMapper
+    from docai_bq_connector.doc_ai_processing.ProcessedDocument import (
+        ProcessedDocument,
+    )
+    from google.cloud.bigquery import SchemaField
+    from google.cloud.documentai_v1 import Document
+
+    # Every entity maps to its own column, as with a custom extractor schema
+    document_dict = make_document(config, entity_types=None, with_images=False)
+    document = Document.from_json(json.dumps(document_dict))
+    processed_document = ProcessedDocument(document, document_dict)
+    schema_index = SchemaIndex(
+        [SchemaField(entity["type"], "STRING") for entity in document_dict["entities"]]
+        + [SchemaField("raw_entities", "JSON")]
+    )
+    bigquery = FakeBigQuery()
+    writer = BufferedWriter(bigquery)
+
+    def run():
+        mapper = BqDocumentMapper(
+            document=processed_document,
+            bq_schema=schema_index,
+            metadata_mapper=BqMetadataMapper({}),
+        )
+        writer.write_record("benchmark", mapper.to_bq_row())
+        writer.flush()
+
+    return run, len(document_dict["entities"]), "entities"
+
+
+@benchmark("parse_results_merge")
+def parse_results_merge(config: BenchmarkConfig):
+    parse_results = load_module(
+        "parse_results_main",
+        "document-processing-workflows/src/functions/parse-results/main.py",
+    )
+    gcs = FakeGcs()
+    setattr(parse_results, "storage", gcs.module())
+
+    document = make_document(config)
+    for shard in synthetic.shard_document(document, config.shards):
+        shard_index = shard["shardInfo"]["shardIndex"]
+        gcs.put(
+            "results",
+            f"output/0/document-{shard_index}.json",
+            json.dumps(shard).encode("utf-8"),
+            content_type="application/json",
+        )
+    blobs = gcs.list("results", "output/")
+
+    def run():
+        parse_results.merge_sharded_results(
+            blobs, "input", "document.pdf", "results", "output/", io.StringIO()
+        )
+
+    return run, config.pages, "pages"
+
+
+def pix2info_setup(config: BenchmarkConfig, cached: bool):
+    sys.path.insert(0, str(REPO_ROOT / "web-app-pix2info-python/src"))
+    try:
+        # pylint: disable=import-outside-toplevel
+        from backend import documents
+        from backend import render
+    finally:
+        sys.path.pop(0)
+
+    document_json = json.dumps(make_document(config))
+    options_json = json.dumps(
+        {
+            "page": 1,
+            "blocks": True,
+            "paragraphs": False,
+            "lines": True,
+            "tokens": True,
+            "tables": False,
+            "barcodes": False,
+            "fields": False,
+            "entities": True,
+            "animated": False,
+            "cropped": False,
+            "confidence": True,
+            "normalized": False,
+            "format": "png",
+        }
+    )
+
+    def run():
+        if not cached:
+            documents.DOCUMENT_CACHE.documents.clear()
+        render.render(document_json, options_json)
+
+    return run, 1, "pages"
+
+
+@benchmark("pix2info_render")
+def pix2info_render(config: BenchmarkConfig):
+    return pix2info_setup(config, cached=False)
+
+
+@benchmark("pix2info_render_cached")
+def pix2info_render_cached(config: BenchmarkConfig):
+    return pix2info_setup(config, cached=True)
+
+
+@benchmark("hitl_comparison")
+def hitl_comparison(config: BenchmarkConfig):
+    utilities = load_module(
+        "best_practices_utilities",
+        "incubator-tools/best-practices/utilities/utilities.py",
+    )
+    # pylint: disable=import-outside-toplevel
+    from google.cloud import documentai_v1beta3 as documentai
+
+    pre_hitl = make_document(config, with_images=False)
+    post_hitl = json.loads(json.dumps(pre_hitl))
+
+    # Reviewers fix some values, drop some entities and add a few
+    rng = random.Random(config.seed)
+    post_entities = []
+    for entity in post_hitl["entities"]:
+        if rng.random() < 0.05:
+            continue
+        if rng.random() < 0.2:
+            entity["mentionText"] = rng.choice(synthetic.WORDS)
+        post_entities.append(entity)
+    extra = make_document(config, with_images=False)["entities"]
+    post_entities.extend(extra[: max(1, len(extra) // 20)])
+    post_hitl["entities"] = post_entities
+
+    file1 = documentai.Document.from_json(json.dumps(pre_hitl))
+    file2 = documentai.Document.from_json(json.dumps(post_hitl))
+
+    def run():
+        utilities.compare_pre_hitl_and_post_hitl_output(file1, file2)
+
+    return run, len(pre_hitl["entities"]), "entities"
+
+
+@benchmark("json_consistency")
+def json_consistency(config: BenchmarkConfig):
+    comparison = load_module(
+        "test_harness_json_folder_comparison",
+        "incubator-tools/test_harness_tool_v2/json_folder_comparison.py",
+    )
+    document = make_document(config, with_images=False)
+    data = synthetic.make_consistency_data(document, config.folders, config.seed)
+
+    def run():
+        comparison.calculate_consistency(data, config.folders)
+
+    return run, len(data), "entities"
+
+
+@benchmark("document_queue")
+def document_queue(config: BenchmarkConfig):
+    gcs = FakeGcs()
+    firestore = FakeFirestore()
+    with replaced_cloud_modules(
+        storage=gcs.module(),
+        firestore=firestore.module(),
+        pubsub_v1=FakePubSub().module(),
+    ):
+        load_queue = load_module(
+            "pipeline_load_queue",
+            "incubator-tools/docai_document_processing_pipeline/src/load_queue_cf/main.py",
+        )
+        process_batch = load_module(
+            "pipeline_process_batch",
+            "incubator-tools/docai_document_processing_pipeline/src/process_batch_cf/main.py",
+        )
+    setattr(load_queue, "FIRESTORE_COLLECTION", "queue")
+    setattr(process_batch, "FIRESTORE_COLLECTION", "queue")
+
+    # Every document is large enough to be processed in batch mode
+    pdf = synthetic.make_pdf(pages=20)
+    file_paths = []
+    for index in range(config.queue_documents):
+        gcs.put("input", f"documents/{index:05d}.pdf", pdf, "application/pdf")
+        file_paths.append(f"gs://input/documents/{index:05d}.pdf")
+
+    def run():
+        firestore.collections.clear()
+        load_queue.populate_queue(file_paths)
+        # Drain the queue as batch completions do: claim the free slots, then
+        # report every claimed document as completed
+        while True:
+            claimed = process_batch.claim_pending_items(
+                process_batch.db.transaction(), process_batch.MAX_CONCURRENT_BATCHES
+            )
+            if not claimed:
+                break
+            for _, file_path in claimed:
+                process_batch.update_queue_status(file_path, "completed")
+
+    return run, len(file_paths), "documents"
+
+
+def measure(
+    name: str, setup: BenchmarkSetup, config: BenchmarkConfig
+) -> BenchmarkResult:
+    """Runs a benchmark, timing every iteration and tracing one extra run."""
+    # The samples print progress, which would dominate the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        run, units_per_run, unit = setup(config)
+        result = BenchmarkResult(name, unit, units_per_run)
+
+        for _ in range(config.warmup):
+            run()
+
+        for _ in range(config.iterations):
+            start = time.perf_counter()
+            run()
+            result.latencies.append(time.perf_counter() - start)
+
+        # Tracing slows allocations down, so memory is measured separately
+        tracemalloc.start()
+        try:
+            run()
+            _, result.peak_python_heap = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def print_results(results: List[BenchmarkResult]) -> None:
+    header = (
+        f"{'benchmark':<24} {'throughput':>22} {'p50 ms':>10} {'p90 ms':>10} "
+        f"{'p99 ms':>10} {'heap MiB':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        throughput = f"{result.throughput:,.1f} {result.unit}/s"
+        print(
+            f"{result.name:<24} {throughput:>22} "
+            f"{result.percentile(50) * 1000:>10.2f} "
+            f"{result.percentile(90) * 1000:>10.2f} "
+            f"{result.percentile(99) * 1000:>10.2f} "
+            f"{result.peak_python_heap / 2**20:>10.2f}"
+        )
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"Benchmarks to run, among {', '.join(sorted(BENCHMARKS))} (default: all)",
+    )
+    parser.add_argument("--pages", type=int, default=defaults.pages)
+    parser.add_argument("--tokens-per-page", type=int, default=defaults.tokens_per_page)
+    parser.add_argument("--entities", type=int, default=defaults.entities)
+    parser.add_argument(
+        "--entity-types",
+        type=int,
+        default=defaults.entity_types,
+        help="Number of distinct entity types",
+    )
+    parser.add_argument("--shards", type=int, default=defaults.shards)
+    parser.add_argument(
+        "--folders",
+        type=int,
+        default=defaults.folders,
+        help="Number of folders compared by json_consistency",
+    )
+    parser.add_argument(
+        "--queue-documents",
+        type=int,
+        default=defaults.queue_documents,
+        help="Number of documents queued by document_queue",
+    )
+    parser.add_argument("--iterations", type=int, default=defaults.iterations)
+    parser.add_argument("--warmup", type=int, default=defaults.warmup)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    unknown = sorted(set(args.benchmarks) - set(BENCHMARKS))
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    return args
+
+
+def main() -> int:
+    args = parse_args()
+    config = BenchmarkConfig(
+        pages=args.pages,
+        tokens_per_page=args.tokens_per_page,
+        entities=args.entities,
+        entity_types=args.entity_types,
+        shards=args.shards,
+        folders=args.folders,
+        queue_documents=args.queue_documents,
+        iterations=args.iterations,
+        warmup=args.warmup,
+        seed=args.seed,
+    )
+    print(f"Configuration: {config}")
+
+    results = []
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        try:
+            results.append(measure(name, BENCHMARKS[name], config))
+        except ImportError as e:
+            print(f"Skipping {name}: missing dependency {e.name or e}")
+
+    print()
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "config": asdict(config),
+                    "results": [result.to_dict() for result in results],
+                },
+                file,
+                indent=2,
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
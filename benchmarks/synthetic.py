@@ -0,0 +1,361 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generators for synthetic Document AI output.
+
+Documents are produced as the JSON dictionaries written by Document AI
+(camelCase keys, int64 values as strings), so they can be serialized and fed
+to the samples exactly like real processor output.
+"""
+
+import base64
+from functools import lru_cache
+import io
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+PAGE_WIDTH = 850
+PAGE_HEIGHT = 1100
+TOKENS_PER_LINE = 10
+LINES_PER_BLOCK = 5
+
+WORDS = [
+    "invoice",
+    "total",
+    "amount",
+    "date",
+    "due",
+    "supplier",
+    "address",
+    "tax",
+    "net",
+    "payment",
+    "reference",
+    "order",
+    "quantity",
+    "price",
+    "description",
+    "account",
+]
+
+
+@lru_cache(maxsize=4)
+def page_image_content(width: int = PAGE_WIDTH, height: int = PAGE_HEIGHT) -> str:
+    """Returns a base64 encoded blank PNG page image."""
+    image = Image.new("RGB", (width, height), "white")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def make_pdf(pages: int = 1) -> bytes:
+    """Returns a PDF of blank pages."""
+    images = [Image.new("1", (PAGE_WIDTH, PAGE_HEIGHT), 1) for _ in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+def _text_anchor(start_index: int, end_index: int) -> Dict[str, Any]:
+    return {
+        "textSegments": [{"startIndex": str(start_index), "endIndex": str(end_index)}]
+    }
+
+
+def _bounding_poly(x_min: float, y_min: float, x_max: float, y_max: float) -> Dict:
+    normalized = [
+        {"x": x_min, "y": y_min},
+        {"x": x_max, "y": y_min},
+        {"x": x_max, "y": y_max},
+        {"x": x_min, "y": y_max},
+    ]
+    vertices = [
+        {"x": int(v["x"] * PAGE_WIDTH), "y": int(v["y"] * PAGE_HEIGHT)}
+        for v in normalized
+    ]
+    return {"vertices": vertices, "normalizedVertices": normalized}
+
+
+def _layout(
+    start_index: int, end_index: int, box: List[float], confidence: float
+) -> Dict:
+    return {
+        "textAnchor": _text_anchor(start_index, end_index),
+        "confidence": confidence,
+        "boundingPoly": _bounding_poly(*box),
+        "orientation": "PAGE_UP",
+    }
+
+
+def make_document(
+    pages: int = 10,
+    tokens_per_page: int = 300,
+    entities: int = 50,
+    entity_types: Optional[int] = None,
+    with_images: bool = True,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Builds a synthetic Document AI document.
+
+    Args:
+        pages: Number of pages
+        tokens_per_page: Number of tokens on each page, laid out in lines of
+            TOKENS_PER_LINE tokens grouped into blocks of LINES_PER_BLOCK lines
+        entities: Number of entities, each one anchored to a single token
+        entity_types: Number of distinct entity types, every entity has its own
+            type if not set
+        with_images: Whether every page carries an inline PNG image
+        seed: Seed of the random generator, for reproducible documents
+
+    Returns:
+        The document as a Document AI JSON dictionary
+    """
+    rng = random.Random(seed)
+    text_parts: List[str] = []
+    text_length = 0
+    document_pages = []
+    all_tokens = []
+
+    lines_per_page = max(1, -(-tokens_per_page // TOKENS_PER_LINE))
+    line_height = 0.9 / lines_per_page
+    token_width = 0.9 / TOKENS_PER_LINE
+
+    for page_index in range(pages):
+        page_start = text_length
+        tokens, lines, blocks = [], [], []
+        for line_index in range(lines_per_page):
+            line_start = text_length
+            y_min = 0.05 + line_index * line_height
+            y_max = y_min + line_height * 0.8
+            line_tokens = min(
+                TOKENS_PER_LINE, tokens_per_page - line_index * TOKENS_PER_LINE
+            )
+            for token_index in range(line_tokens):
+                word = rng.choice(WORDS)
+                separator = "\n" if token_index == line_tokens - 1 else " "
+                x_min = 0.05 + token_index * token_width
+                box = [x_min, y_min, x_min + token_width * 0.8, y_max]
+                token = {
+                    "layout": _layout(
+                        text_length,
+                        text_length + len(word) + 1,
+                        box,
+                        round(rng.uniform(0.8, 1.0), 4),
+                    ),
+                    "detectedBreak": {"type": "SPACE"},
+                }
+                tokens.append(token)
+                all_tokens.append((page_index, word, token))
+                text_parts.append(word + separator)
+                text_length += len(word) + 1
+            line_box = [0.05, y_min, 0.95, y_max]
+            lines.append({"layout": _layout(line_start, text_length, line_box, 1.0)})
+        for block_start in range(0, len(lines), LINES_PER_BLOCK):
+            block_lines = lines[block_start : block_start + LINES_PER_BLOCK]
+            first = block_lines[0]["layout"]
+            last = block_lines[-1]["layout"]
+            start_index = int(first["textAnchor"]["textSegments"][0]["startIndex"])
+            end_index = int(last["textAnchor"]["textSegments"][0]["endIndex"])
+            y_min = first["boundingPoly"]["normalizedVertices"][0]["y"]
+            y_max = last["boundingPoly"]["normalizedVertices"][2]["y"]
+            box = [0.05, y_min, 0.95, y_max]
+            blocks.append({"layout": _layout(start_index, end_index, box, 1.0)})
+
+        page = {
+            "pageNumber": page_index + 1,
+            "dimension": {
+                "width": PAGE_WIDTH,
+                "height": PAGE_HEIGHT,
+                "unit": "pixels",
+            },
+            "layout": _layout(page_start, text_length, [0.0, 0.0, 1.0, 1.0], 1.0),
+            "blocks": blocks,
+            "paragraphs": [dict(block) for block in blocks],
+            "lines": lines,
+            "tokens": tokens,
+        }
+        if with_images:
+            page["image"] = {
+                "content": page_image_content(),
+                "mimeType": "image/png",
+                "width": PAGE_WIDTH,
+                "height": PAGE_HEIGHT,
+            }
+        document_pages.append(page)
+
+    document_entities = []
+    type_count = entity_types or max(1, entities)
+    if all_tokens:
+        for entity_index in range(entities):
+            page_index, word, token = rng.choice(all_tokens)
+            layout = token["layout"]
+            segment = layout["textAnchor"]["textSegments"][0]
+            document_entities.append(
+                {
+                    "type": f"field_{entity_index % type_count:04d}",
+                    "mentionText": word,
+                    "confidence": round(rng.uniform(0.5, 1.0), 4),
+                    "textAnchor": {
+                        "textSegments": [dict(segment)],
+                        "content": word,
+                    },
+                    "pageAnchor": {
+                        "pageRefs": [
+                            {
+                                "page": str(page_index),
+                                "boundingPoly": {
+                                    "normalizedVertices": layout["boundingPoly"][
+                                        "normalizedVertices"
+                                    ]
+                                },
+                            }
+                        ]
+                    },
+                    "id": str(entity_index),
+                }
+            )
+
+    return {
+        "mimeType": "application/pdf",
+        "text": "".join(text_parts),
+        "pages": document_pages,
+        "entities": document_entities,
+    }
+
+
+def _rebase_text_segments(value: Any, offset: int) -> None:
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == "textSegments":
+                for segment in child:
+                    for index_key in ("startIndex", "endIndex"):
+                        if index_key in segment:
+                            segment[index_key] = str(int(segment[index_key]) - offset)
+            else:
+                _rebase_text_segments(child, offset)
+    elif isinstance(value, list):
+        for item in value:
+            _rebase_text_segments(item, offset)
+
+
+def shard_document(document: Dict[str, Any], shards: int) -> List[Dict[str, Any]]:
+    """
+    Splits a document the way Document AI shards batch output.
+
+    Each shard holds a contiguous range of pages, the text of those pages and
+    the entities anchored to them. Text anchors are relative to the shard text
+    and entity page references relative to the first page of the shard, with
+    shardInfo carrying the offsets needed to merge them back.
+
+    Args:
+        document: Document built by make_document()
+        shards: Number of shards, at most the number of pages
+
+    Returns:
+        The shards as Document AI JSON dictionaries, in shard order
+    """
+    pages = document["pages"]
+    shards = max(1, min(shards, len(pages)))
+    pages_per_shard = -(-len(pages) // shards)
+    shard_count = -(-len(pages) // pages_per_shard)
+
+    result = []
+    for shard_index in range(shard_count):
+        first_page = shard_index * pages_per_shard
+        shard_pages = json.loads(
+            json.dumps(pages[first_page : first_page + pages_per_shard])
+        )
+        start_index = int(
+            shard_pages[0]["layout"]["textAnchor"]["textSegments"][0]["startIndex"]
+        )
+        end_index = int(
+            shard_pages[-1]["layout"]["textAnchor"]["textSegments"][0]["endIndex"]
+        )
+        last_page = first_page + len(shard_pages)
+
+        shard_entities = []
+        for entity in document["entities"]:
+            page_ref = entity["pageAnchor"]["pageRefs"][0]
+            if first_page <= int(page_ref["page"]) < last_page:
+                entity = json.loads(json.dumps(entity))
+                page_ref = entity["pageAnchor"]["pageRefs"][0]
+                page_ref["page"] = str(int(page_ref["page"]) - first_page)
+                shard_entities.append(entity)
+
+        shard = {
+            "mimeType": document["mimeType"],
+            "text": document["text"][start_index:end_index],
+            "pages": shard_pages,
+            "entities": shard_entities,
+        }
+        _rebase_text_segments(shard["pages"], start_index)
+        _rebase_text_segments(shard["entities"], start_index)
+        shard["shardInfo"] = {
+            "shardIndex": str(shard_index),
+            "shardCount": str(shard_count),
+            "textOffset": str(start_index),
+        }
+        result.append(shard)
+
+    return result
+
+
+def make_consistency_data(
+    document: Dict[str, Any], folders: int = 3, seed: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Builds the entity rows compared by the test harness consistency report.
+
+    Every folder holds the same document, with slightly shifted bounding boxes
+    and an occasional differing mention text.
+
+    Args:
+        document: Document built by make_document()
+        folders: Number of folders being compared
+        seed: Seed of the random generator, for reproducible rows
+
+    Returns:
+        Entity rows as expected by calculate_consistency()
+    """
+    rng = random.Random(seed)
+    data = []
+    for folder_index in range(1, folders + 1):
+        for entity in document["entities"]:
+            page_ref = entity["pageAnchor"]["pageRefs"][0]
+            vertices = page_ref["boundingPoly"]["normalizedVertices"]
+            jitter = rng.uniform(-0.002, 0.002)
+            text = entity["mentionText"]
+            if rng.random() < 0.1:
+                text = rng.choice(WORDS)
+            data.append(
+                {
+                    "Entity_name": entity["type"],
+                    "Text": text,
+                    "Page_Number": int(page_ref["page"]) + 1,
+                    "Bounding_Box": [
+                        vertices[0]["x"] + jitter,
+                        vertices[0]["y"] + jitter,
+                        vertices[2]["x"] + jitter,
+                        vertices[2]["y"] + jitter,
+                    ],
+                    "filename": "document.json",
+                    "folder_index": folder_index,
+                }
+            )
+    return data
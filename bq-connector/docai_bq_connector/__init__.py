@@ -17,5 +17,7 @@
 # limitations under the License.
 #
 
+from .bigquery.BufferedWriter import BufferedWriter  # noqa: F401
 from .connector.BqMetadataMapper import BqMetadataMappingInfo  # noqa: F401
+from .connector.ConnectorPool import ConnectorPool  # noqa: F401
 from .connector.DocAIBQConnector import DocAIBQConnector  # noqa: F401
@@ -0,0 +1,166 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from docai_bq_connector.bigquery.StorageManager import StorageManager
+
+# BigQuery recommends at most 500 rows per streaming insert request, and
+# rejects HTTP requests larger than 10 MB.
+DEFAULT_MAX_BATCH_ROWS = 500
+DEFAULT_MAX_BATCH_BYTES = 5 * 1024 * 1024
+
+InsertCallback = Callable[[List[dict]], None]
+
+
+class BufferedWriter:
+    """
+    Accumulates rows across documents and streams them to BigQuery in batches
+    bounded by row count and payload size.
+
+    If inserting a batch raises, its rows are put back at the front of the
+    buffer before the exception is propagated, so no row is lost.
+
+    Insert errors are reported back per row through the callback supplied in
+    `write_record`, in the same shape as a single-row
+    `StorageManager.write_record` call (i.e. `[{"index": 0, "errors": [...]}]`),
+    so they can be fed directly to `BqDocumentMapper.process_insert_errors`.
+
+    A writer can be shared by connectors running on several threads. Batches
+    are taken from the buffer under a lock and inserted outside of it.
+    """
+
+    def __init__(
+        self,
+        storage_manager: StorageManager,
+        max_batch_rows: int = DEFAULT_MAX_BATCH_ROWS,
+        max_batch_bytes: int = DEFAULT_MAX_BATCH_BYTES,
+    ):
+        self.storage_manager = storage_manager
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_bytes = max_batch_bytes
+        # table_id -> list of (record, size in bytes, callback)
+        self._buffers: Dict[str, List[Tuple[dict, int, Optional[InsertCallback]]]] = {}
+        self._buffer_bytes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def write_record(
+        self, table_id: str, record: dict, callback: Optional[InsertCallback] = None
+    ):
+        record_size = len(json.dumps(record, default=str))
+        full_batches = []
+        with self._lock:
+            buffer = self._buffers.setdefault(table_id, [])
+            if (
+                len(buffer) > 0
+                and self._buffer_bytes.get(table_id, 0) + record_size
+                > self.max_batch_bytes
+            ):
+                full_batches.append(self._take_batch(table_id))
+                buffer = self._buffers.setdefault(table_id, [])
+            buffer.append((record, record_size, callback))
+            self._buffer_bytes[table_id] = (
+                self._buffer_bytes.get(table_id, 0) + record_size
+            )
+            if len(buffer) >= self.max_batch_rows:
+                full_batches.append(self._take_batch(table_id))
+        for batch in full_batches:
+            self._insert_batch(table_id, batch)
+
+    def pending_count(self, table_id: Optional[str] = None) -> int:
+        with self._lock:
+            if table_id is not None:
+                return len(self._buffers.get(table_id, []))
+            return sum(len(buffer) for buffer in self._buffers.values())
+
+    def _take_batch(self, table_id: str):
+        buffer = self._buffers.get(table_id, [])
+        batch_size = 0
+        batch_bytes = 0
+        for _, record_size, _ in buffer:
+            if batch_size >= self.max_batch_rows or (
+                batch_size > 0 and batch_bytes + record_size > self.max_batch_bytes
+            ):
+                break
+            batch_size += 1
+            batch_bytes += record_size
+        batch = buffer[:batch_size]
+        if batch_size == len(buffer):
+            self._buffers.pop(table_id, None)
+            self._buffer_bytes.pop(table_id, None)
+        else:
+            self._buffers[table_id] = buffer[batch_size:]
+            self._buffer_bytes[table_id] -= batch_bytes
+        return batch
+
+    def _requeue_batch(self, table_id: str, batch):
+        with self._lock:
+            self._buffers[table_id] = batch + self._buffers.get(table_id, [])
+            self._buffer_bytes[table_id] = self._buffer_bytes.get(table_id, 0) + sum(
+                record_size for _, record_size, _ in batch
+            )
+
+    def _insert_batch(self, table_id: str, batch):
+        if len(batch) == 0:
+            return
+        logging.debug(f"Flushing {len(batch)} buffered rows to table {table_id}")
+        try:
+            errors = self.storage_manager.write_records(
+                table_id, [record for record, _, _ in batch]
+            )
+        except Exception:
+            # Keep the rows buffered so that a later flush can insert them
+            self._requeue_batch(table_id, batch)
+            raise
+        errors_by_index: Dict[int, List[dict]] = {}
+        for row_errors in errors or []:
+            errors_by_index.setdefault(row_errors.get("index"), []).extend(
+                row_errors.get("errors") or []
+            )
+        for idx, (_, _, callback) in enumerate(batch):
+            if callback is None:
+                continue
+            row_errors = errors_by_index.get(idx)
+            callback([{"index": 0, "errors": row_errors}] if row_errors else [])
+
+    def flush_table(self, table_id: str):
+        while True:
+            with self._lock:
+                batch = self._take_batch(table_id)
+            if len(batch) == 0:
+                return
+            self._insert_batch(table_id, batch)
+
+    def flush(self):
+        # Other threads may keep buffering rows while flushing, so loop until
+        # drained. Retries issued by callbacks bypass the buffer.
+        while self.pending_count() > 0:
+            with self._lock:
+                table_ids = list(self._buffers.keys())
+            for table_id in table_ids:
+                self.flush_table(table_id)
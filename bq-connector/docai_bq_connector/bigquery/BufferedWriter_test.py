@@ -0,0 +1,141 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Unit tests for BufferedWriter"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import List, Tuple
+import unittest
+
+from docai_bq_connector.bigquery.BufferedWriter import BufferedWriter
+
+
+class FakeStorageManager:
+    """Records the batches inserted, failing the first `failures` inserts"""
+
+    def __init__(self, failures: int = 0, errors=None):
+        self.project_id = "project"
+        self.dataset_id = "dataset"
+        self.batches: List[Tuple[str, list]] = []
+        self.failures = failures
+        self.errors = errors or []
+        self.lock = threading.Lock()
+
+    def write_records(self, table_id: str, records: list):
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("insert failed")
+            self.batches.append((table_id, list(records)))
+        return self.errors
+
+
+class TestBufferedWriter(unittest.TestCase):
+    def test_batches_by_row_count(self):
+        storage_manager = FakeStorageManager()
+        writer = BufferedWriter(storage_manager, max_batch_rows=2)
+
+        for idx in range(5):
+            writer.write_record("table", {"id": idx})
+
+        self.assertEqual(len(storage_manager.batches), 2)
+        self.assertEqual(writer.pending_count("table"), 1)
+        writer.flush()
+        self.assertEqual(
+            [[row["id"] for row in rows] for _, rows in storage_manager.batches],
+            [[0, 1], [2, 3], [4]],
+        )
+        self.assertEqual(writer.pending_count(), 0)
+
+    def test_batches_by_size(self):
+        storage_manager = FakeStorageManager()
+        # Each record is 10 bytes of JSON, so two fit in a batch
+        writer = BufferedWriter(storage_manager, max_batch_bytes=25)
+
+        for idx in range(10, 15):
+            writer.write_record("table", {"id": idx})
+        writer.flush()
+
+        self.assertEqual([len(rows) for _, rows in storage_manager.batches], [2, 2, 1])
+
+    def test_callbacks_receive_row_errors(self):
+        row_errors = [{"reason": "invalid", "location": "name"}]
+        storage_manager = FakeStorageManager(
+            errors=[{"index": 1, "errors": row_errors}]
+        )
+        writer = BufferedWriter(storage_manager)
+        received = {}
+
+        for idx in range(3):
+            writer.write_record(
+                "table",
+                {"id": idx},
+                callback=lambda errors, idx=idx: received.update({idx: errors}),
+            )
+        writer.flush()
+
+        self.assertEqual(
+            received, {0: [], 1: [{"index": 0, "errors": row_errors}], 2: []}
+        )
+
+    def test_failed_batch_is_requeued(self):
+        storage_manager = FakeStorageManager(failures=1)
+        writer = BufferedWriter(storage_manager)
+        for idx in range(3):
+            writer.write_record("table", {"id": idx})
+
+        with self.assertRaises(ConnectionError):
+            writer.flush()
+        self.assertEqual(writer.pending_count("table"), 3)
+
+        writer.write_record("table", {"id": 3})
+        writer.flush()
+        self.assertEqual(
+            [[row["id"] for row in rows] for _, rows in storage_manager.batches],
+            [[0, 1, 2, 3]],
+        )
+
+    def test_concurrent_writes_and_flushes(self):
+        storage_manager = FakeStorageManager()
+        writer = BufferedWriter(storage_manager, max_batch_rows=7)
+
+        def write(thread_idx: int):
+            for idx in range(100):
+                writer.write_record(f"table_{idx % 3}", {"id": (thread_idx, idx)})
+                if idx % 10 == 0:
+                    writer.flush()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(write, range(8)))
+        writer.flush()
+
+        inserted = [
+            tuple(row["id"]) for _, rows in storage_manager.batches for row in rows
+        ]
+        self.assertEqual(len(inserted), 800)
+        self.assertEqual(len(set(inserted)), 800)
+        for table_id, rows in storage_manager.batches:
+            self.assertLessEqual(len(rows), 7)
+            for row in rows:
+                self.assertEqual(table_id, f"table_{row['id'][1] % 3}")
+
+
+if __name__ == "__main__":
+    unittest.main()
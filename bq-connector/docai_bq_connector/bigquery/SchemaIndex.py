@@ -0,0 +1,50 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from typing import Dict, List, Optional, Sequence
+
+from google.cloud.bigquery import SchemaField
+
+
+class SchemaIndex:
+    """
+    Name based index over a BigQuery table schema. Nested (RECORD) fields are
+    indexed recursively so lookups at any depth are O(1).
+    """
+
+    def __init__(self, fields: Sequence[SchemaField]):
+        self.fields: List[SchemaField] = list(fields)
+        self._fields_by_name: Dict[str, SchemaField] = {}
+        self._children: Dict[str, SchemaIndex] = {}
+        for field in self.fields:
+            # Keep the first definition, matching a linear search over the schema
+            if field.name in self._fields_by_name:
+                continue
+            self._fields_by_name[field.name] = field
+            if len(field.fields) > 0:
+                self._children[field.name] = SchemaIndex(field.fields)
+
+    def get(self, name: str) -> Optional[SchemaField]:
+        return self._fields_by_name.get(name)
+
+    def children(self, name: str) -> "SchemaIndex":
+        return self._children.get(name) or SchemaIndex([])
+
+    def __len__(self):
+        return len(self.fields)
@@ -0,0 +1,78 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Unit tests for SchemaIndex"""
+
+import unittest
+
+from docai_bq_connector.bigquery.SchemaIndex import SchemaIndex
+from google.cloud.bigquery import SchemaField
+
+SCHEMA = [
+    SchemaField("invoice_id", "STRING"),
+    SchemaField(
+        "line_item",
+        "RECORD",
+        mode="REPEATED",
+        fields=[
+            SchemaField("amount", "NUMERIC"),
+            SchemaField(
+                "product",
+                "RECORD",
+                fields=[SchemaField("code", "STRING"), SchemaField("name", "STRING")],
+            ),
+        ],
+    ),
+    SchemaField("invoice_id", "INTEGER"),
+]
+
+
+class TestSchemaIndex(unittest.TestCase):
+    def test_nested_lookup(self):
+        index = SchemaIndex(SCHEMA)
+
+        self.assertEqual(index.get("line_item").mode, "REPEATED")
+        line_item = index.children("line_item")
+        self.assertEqual(line_item.get("amount").field_type, "NUMERIC")
+        self.assertEqual(
+            line_item.children("product").get("code"),
+            SchemaField("code", "STRING"),
+        )
+        self.assertIsNone(line_item.get("code"))
+
+    def test_first_definition_wins(self):
+        index = SchemaIndex(SCHEMA)
+
+        self.assertEqual(index.get("invoice_id").field_type, "STRING")
+        # all definitions are kept in the field list
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.fields, SCHEMA)
+
+    def test_missing_names(self):
+        index = SchemaIndex(SCHEMA)
+
+        self.assertIsNone(index.get("total"))
+        self.assertEqual(len(index.children("total")), 0)
+        # fields without children have an empty index
+        self.assertEqual(len(index.children("invoice_id")), 0)
+        self.assertIsNone(index.children("invoice_id").get("amount"))
+
+
+if __name__ == "__main__":
+    unittest.main()
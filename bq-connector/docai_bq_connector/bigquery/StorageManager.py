@@ -18,22 +18,36 @@
 #
 
 import logging
+import threading
+from typing import Dict
 
+from docai_bq_connector.bigquery.SchemaIndex import SchemaIndex
+from docai_bq_connector.helper.client_util import get_bigquery_client
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
 
+# Table schemas are fetched once per process and shared by all StorageManager
+# instances, so by all connectors. Entries are keyed by fully qualified table id
+# and kept for the life of the process, until invalidate_table_schema or
+# clear_table_schemas drops them.
+_schema_cache: Dict[str, SchemaIndex] = {}
+_schema_cache_lock = threading.Lock()
+
+
+def clear_table_schemas():
+    # Drops every cached schema, e.g. between tests
+    with _schema_cache_lock:
+        _schema_cache.clear()
+
 
 class StorageManager:
     def __init__(self, project_id: str, dataset_id: str):
         self.project_id = project_id
         self.dataset_id = dataset_id
 
-        self.client: bigquery.client.Client = None
+        self.client: bigquery.client.Client = get_bigquery_client(project_id)
         if project_id is None:
-            self.client = bigquery.Client()
             self.project_id = self.client.project
-        else:
-            self.client = bigquery.Client(project=project_id)
 
         self.dataset_ref = bigquery.DatasetReference(self.project_id, self.dataset_id)
 
@@ -46,19 +60,35 @@ class StorageManager:
             logging.debug("Dataset %s is not found", dataset_ref)
             return False
 
+    def _get_table_cache_key(self, table_id: str) -> str:
+        return f"{self.project_id}.{self.dataset_id}.{table_id}"
+
+    def _fetch_table_schema(self, table_id: str) -> SchemaIndex:
+        table_ref = bigquery.TableReference(self.dataset_ref, table_id)
+        table = self.client.get_table(table_ref)
+        schema_index = SchemaIndex(table.schema)
+        with _schema_cache_lock:
+            _schema_cache[self._get_table_cache_key(table_id)] = schema_index
+        return schema_index
+
     def does_table_exist(self, name):
-        table_ref = bigquery.TableReference(self.dataset_ref, name)
+        if self._get_table_cache_key(name) in _schema_cache:
+            return True
         try:
-            self.client.get_table(table_ref)
-            logging.debug("Table %s already exists.", table_ref.table_id)
+            self._fetch_table_schema(name)
+            logging.debug("Table %s already exists.", name)
             return True
         except NotFound:
-            logging.debug("Table %s is not found.", table_ref.table_id)
+            logging.debug("Table %s is not found.", name)
             return False
 
     def write_record(self, table_id: str, record):
+        return self.write_records(table_id, [record])
+
+    def write_records(self, table_id: str, records: list):
+        # Errors returned by BQ reference rows by their position in `records`
         table_ref = bigquery.TableReference(self.dataset_ref, table_id)
-        errors = self.client.insert_rows_json(table_ref, [record])
+        errors = self.client.insert_rows_json(table_ref, records)
         if errors:
             logging.error("Encountered errors while inserting rows: %s", errors)
         return errors
@@ -116,6 +146,17 @@ class StorageManager:
         return records
 
     def get_table_schema(self, table_id: str):
-        table_ref = bigquery.TableReference(self.dataset_ref, table_id)
-        table = self.client.get_table(table_ref)
-        return table.schema
+        return self.get_table_schema_index(table_id).fields
+
+    def get_table_schema_index(self, table_id: str) -> SchemaIndex:
+        schema_index = _schema_cache.get(self._get_table_cache_key(table_id))
+        if schema_index is None:
+            schema_index = self._fetch_table_schema(table_id)
+        return schema_index
+
+    def invalidate_table_schema(self, table_id: str):
+        # Forces the next lookup to fetch the schema again, e.g. after the
+        # table was altered
+        logging.debug("Invalidating cached schema for table %s", table_id)
+        with _schema_cache_lock:
+            _schema_cache.pop(self._get_table_cache_key(table_id), None)
@@ -0,0 +1,151 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Unit tests for the table schema cache of StorageManager"""
+
+from collections import Counter
+from types import SimpleNamespace
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from docai_bq_connector.bigquery import StorageManager as storage_manager
+from docai_bq_connector.connector.DocAIBQConnector import DocAIBQConnector
+from google.cloud.bigquery import SchemaField
+from google.cloud.exceptions import NotFound
+
+
+class FakeBigQueryClient:
+    """Serves table schemas keyed by table id, counting the fetches"""
+
+    def __init__(self, schemas: dict):
+        self.project = "project"
+        self.schemas = schemas
+        self.fetches: Counter = Counter()
+
+    def get_table(self, table_ref):
+        table_id = f"{table_ref.dataset_id}.{table_ref.table_id}"
+        self.fetches[table_id] += 1
+        if table_id not in self.schemas:
+            raise NotFound(f"Table {table_id} not found")
+        return SimpleNamespace(schema=self.schemas[table_id])
+
+
+class TestStorageManagerSchemaCache(unittest.TestCase):
+    def setUp(self):
+        # The cache lives as long as the process, start and end each test empty
+        storage_manager.clear_table_schemas()
+        self.addCleanup(storage_manager.clear_table_schemas)
+        self.client = FakeBigQueryClient(
+            {
+                "dataset.invoices": [SchemaField("invoice_id", "STRING")],
+                "other.invoices": [SchemaField("total", "NUMERIC")],
+            }
+        )
+        patcher = patch.object(
+            storage_manager, "get_bigquery_client", return_value=self.client
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_schema_shared_across_instances(self):
+        first = storage_manager.StorageManager("project", "dataset")
+        second = storage_manager.StorageManager("project", "dataset")
+
+        self.assertTrue(first.does_table_exist("invoices"))
+        index = first.get_table_schema_index("invoices")
+
+        self.assertIs(second.get_table_schema_index("invoices"), index)
+        self.assertTrue(second.does_table_exist("invoices"))
+        self.assertEqual(self.client.fetches, {"dataset.invoices": 1})
+
+    def test_schema_cached_per_dataset(self):
+        other = storage_manager.StorageManager("project", "other")
+        storage_manager.StorageManager("project", "dataset").get_table_schema(
+            "invoices"
+        )
+
+        self.assertEqual(
+            other.get_table_schema("invoices"), [SchemaField("total", "NUMERIC")]
+        )
+        self.assertEqual(
+            self.client.fetches, {"dataset.invoices": 1, "other.invoices": 1}
+        )
+
+    def test_missing_table_not_cached(self):
+        manager = storage_manager.StorageManager("project", "dataset")
+
+        self.assertFalse(manager.does_table_exist("receipts"))
+        self.client.schemas["dataset.receipts"] = [SchemaField("id", "STRING")]
+        self.assertTrue(manager.does_table_exist("receipts"))
+
+    def test_invalidate_fetches_schema_again(self):
+        manager = storage_manager.StorageManager("project", "dataset")
+        manager.get_table_schema_index("invoices")
+        self.client.schemas["dataset.invoices"] = [
+            SchemaField("invoice_id", "STRING"),
+            SchemaField("total", "NUMERIC"),
+        ]
+
+        # Other instances see the invalidation
+        storage_manager.StorageManager("project", "dataset").invalidate_table_schema(
+            "invoices"
+        )
+
+        self.assertIsNotNone(manager.get_table_schema_index("invoices").get("total"))
+        self.assertEqual(self.client.fetches, {"dataset.invoices": 2})
+
+    def handle_insert_errors(self, exclude_fields: list):
+        manager = storage_manager.StorageManager("project", "dataset")
+        manager.get_table_schema_index("invoices")
+        connector = DocAIBQConnector(
+            bucket_name="bucket",
+            file_name="invoice.pdf",
+            content_type="application/pdf",
+            processing_type_override="sync",
+            processor_project_id="project",
+            processor_location="us",
+            processor_id="processor",
+            async_output_folder_gcs_uri="gs://bucket/async",
+            should_async_wait=True,
+            operation_id="operation",
+            destination_project_id="project",
+            destination_dataset_id="dataset",
+            destination_table_id="invoices",
+        )
+        mapper = MagicMock()
+        mapper.process_insert_errors.return_value = exclude_fields
+        connector._handle_insert_errors(
+            manager, mapper, [{"index": 0, "errors": [{"location": "total"}]}]
+        )
+        manager.get_table_schema_index("invoices")
+
+    def test_invalidated_after_field_insert_errors(self):
+        self.handle_insert_errors(exclude_fields=["total"])
+
+        self.assertEqual(self.client.fetches, {"dataset.invoices": 2})
+
+    def test_kept_after_row_insert_errors(self):
+        self.handle_insert_errors(exclude_fields=[])
+
+        self.assertEqual(self.client.fetches, {"dataset.invoices": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
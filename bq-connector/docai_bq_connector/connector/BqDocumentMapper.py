@@ -21,15 +21,15 @@ from datetime import datetime
 import json
 import logging
 import re
-from typing import List, Optional, Sequence
+from typing import List, Optional, Sequence, Union
 
+from docai_bq_connector.bigquery.SchemaIndex import SchemaIndex
 from docai_bq_connector.connector.BqMetadataMapper import BqMetadataMapper
 from docai_bq_connector.connector.ConversionError import ConversionError
 from docai_bq_connector.doc_ai_processing.DocumentField import DocumentField
 from docai_bq_connector.doc_ai_processing.DocumentField import DocumentRow
 from docai_bq_connector.doc_ai_processing.ProcessedDocument import ProcessedDocument
 from docai_bq_connector.helper import clean_number
-from docai_bq_connector.helper import find
 from docai_bq_connector.helper import get_bool_value
 from google.cloud.bigquery import SchemaField
 from google.cloud.documentai_v1 import Document
@@ -43,7 +43,7 @@ class BqDocumentMapper:
     def __init__(
         self,
         document: ProcessedDocument,
-        bq_schema: List[SchemaField],
+        bq_schema: Union[List[SchemaField], SchemaIndex],
         metadata_mapper: BqMetadataMapper,
         custom_fields: Optional[dict] = None,
         include_raw_entities: bool = True,
@@ -52,7 +52,10 @@ class BqDocumentMapper:
         parsing_methodology: str = PARSING_METHOD_ENTITIES,
     ):
         self.processed_document = document
-        self.bq_schema = bq_schema
+        self.bq_schema_index = (
+            bq_schema if isinstance(bq_schema, SchemaIndex) else SchemaIndex(bq_schema)
+        )
+        self.bq_schema = self.bq_schema_index.fields
         self.metadata_mapper = metadata_mapper
         self.custom_fields = custom_fields
         self.include_raw_entities = include_raw_entities
@@ -61,7 +64,9 @@ class BqDocumentMapper:
         self.parsing_methodology = parsing_methodology
         self.errors: List[ConversionError] = []
         self.fields = self._parse_document()
-        self.dictionary = self._map_document_to_bigquery_schema(self.fields, bq_schema)
+        self.dictionary = self._map_document_to_bigquery_schema(
+            self.fields, self.bq_schema_index
+        )
 
     def _parse_document(self) -> List[DocumentField]:
         row: DocumentRow
@@ -244,16 +249,14 @@ class BqDocumentMapper:
         return result
 
     def _map_document_to_bigquery_schema(
-        self, fields: List[DocumentField], bq_schema: List[SchemaField]
+        self, fields: List[DocumentField], bq_schema: SchemaIndex
     ):
         result: dict = {}
         for field in fields:
             field_name = field.to_bigquery_safe_name()
             if field.value is None:
                 continue
-            bq_field = find(
-                lambda schema_field: schema_field.name == field_name, bq_schema
-            )
+            bq_field = bq_schema.get(field_name)
             if bq_field is None:
                 logging.warning(
                     "Parsed field '%s' not found in BigQuery schema. Field will be excluded from the "
@@ -269,7 +272,7 @@ class BqDocumentMapper:
                     result[field_name] = []
                 for child_row in field.children:
                     child_dict = self._map_document_to_bigquery_schema(
-                        child_row.fields, bq_field.fields
+                        child_row.fields, bq_schema.children(field_name)
                     )
                     if len(child_dict) > 0:
                         result[field_name].append(child_dict)
@@ -284,7 +287,7 @@ class BqDocumentMapper:
         result = result | metadata_dict
         return result
 
-    def _map_document_metadata_to_bigquery_schema(self, bq_schema: List[SchemaField]):
+    def _map_document_metadata_to_bigquery_schema(self, bq_schema: SchemaIndex):
         result: dict = {}
         mapped_metadata = self.metadata_mapper.map_metadata()
         for cur_metadata_mapping in mapped_metadata:
@@ -292,9 +295,7 @@ class BqDocumentMapper:
             col_value = cur_metadata_mapping["bq_column_value"]
             if col_value is None:
                 continue
-            bq_field = find(
-                lambda schema_field: schema_field.name == col_name, bq_schema
-            )
+            bq_field = bq_schema.get(col_name)
             if bq_field is None:
                 logging.warning(
                     "Parsed field '%s' not found in BigQuery schema. Field will be excluded from the "
@@ -0,0 +1,105 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import logging
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+from docai_bq_connector.connector.DocAIBQConnector import DocAIBQConnector
+from docai_bq_connector.doc_ai_processing.DocumentOperation import DocumentOperation
+from docai_bq_connector.doc_ai_processing.ProcessedDocument import ProcessedDocument
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class ConnectorResult:
+    """
+    Outcome of one connector run
+
+    Attributes
+    ----
+    connector: DocAIBQConnector
+        The connector that was run
+    document: Union[DocumentOperation, ProcessedDocument]
+        The value returned by the run, None if it failed
+    error: BaseException
+        The exception raised by the run, None if it succeeded
+    """
+
+    def __init__(
+        self,
+        connector: DocAIBQConnector,
+        document: Optional[Union[DocumentOperation, ProcessedDocument]] = None,
+        error: Optional[BaseException] = None,
+    ):
+        self.connector = connector
+        self.document = document
+        self.error = error
+
+
+class ConnectorPool:
+    """
+    Runs several connectors concurrently, so a document waiting on a long
+    batch operation does not hold back the others.
+
+    At most `max_concurrency` documents are in flight at once. Each one is
+    mapped and written to BigQuery by its own connector as soon as its
+    processing completes, and results are yielded in completion order. When
+    the connectors share a BufferedWriter, the caller flushes it once all the
+    results have been consumed.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+
+    def run(self, connectors: Iterable[DocAIBQConnector]) -> Iterator[ConnectorResult]:
+        pending_connectors = iter(connectors)
+        in_flight: Dict[Future, DocAIBQConnector] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+
+            def submit_next() -> bool:
+                connector = next(pending_connectors, None)
+                if connector is None:
+                    return False
+                in_flight[executor.submit(connector.run)] = connector
+                return True
+
+            while len(in_flight) < self.max_concurrency and submit_next():
+                pass
+
+            while len(in_flight) > 0:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    connector = in_flight.pop(future)
+                    submit_next()
+                    error = future.exception()
+                    if error is not None:
+                        logging.error(
+                            f"Processing of {connector.bucket_name}/"
+                            f"{connector.file_name} failed: {error!r}"
+                        )
+                        yield ConnectorResult(connector, error=error)
+                    else:
+                        yield ConnectorResult(connector, document=future.result())
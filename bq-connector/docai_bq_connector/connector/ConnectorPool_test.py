@@ -0,0 +1,111 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Unit tests for ConnectorPool"""
+
+import threading
+import unittest
+
+from docai_bq_connector.connector.ConnectorPool import ConnectorPool
+
+
+class FakeConnector:
+    """Connector whose run waits for `wait_for` to be set"""
+
+    def __init__(self, file_name: str, tracker, wait_for=None, error=None):
+        self.bucket_name = "bucket"
+        self.file_name = file_name
+        self.tracker = tracker
+        self.wait_for = wait_for
+        self.error = error
+
+    def run(self):
+        self.tracker.enter()
+        try:
+            if self.wait_for is not None:
+                self.wait_for.wait(timeout=5)
+            if self.error is not None:
+                raise self.error
+            return f"document {self.file_name}"
+        finally:
+            self.tracker.leave()
+
+
+class ConcurrencyTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def enter(self):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def leave(self):
+        with self.lock:
+            self.running -= 1
+
+
+class TestConnectorPool(unittest.TestCase):
+    def test_results_in_completion_order(self):
+        tracker = ConcurrencyTracker()
+        release = threading.Event()
+        slow = FakeConnector("slow.pdf", tracker, wait_for=release)
+        fast = FakeConnector("fast.pdf", tracker)
+        failing = FakeConnector("failing.pdf", tracker, error=ValueError("bad"))
+
+        results = []
+        for result in ConnectorPool(max_concurrency=2).run([slow, fast, failing]):
+            results.append(result)
+            if len(results) == 2:
+                # The slow document only completes once the others are done
+                release.set()
+
+        self.assertEqual(
+            [result.connector for result in results], [fast, failing, slow]
+        )
+        self.assertEqual(results[0].document, "document fast.pdf")
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertIsNone(results[1].document)
+        self.assertEqual(results[2].document, "document slow.pdf")
+
+    def test_max_concurrency(self):
+        tracker = ConcurrencyTracker()
+        release = threading.Event()
+        connectors = [
+            FakeConnector(f"{idx}.pdf", tracker, wait_for=release) for idx in range(6)
+        ]
+
+        # Documents are only submitted as earlier ones complete
+        release_timer = threading.Timer(0.2, release.set)
+        release_timer.start()
+        results = list(ConnectorPool(max_concurrency=3).run(connectors))
+        release_timer.join()
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(tracker.max_running, 3)
+
+    def test_invalid_max_concurrency(self):
+        with self.assertRaises(ValueError):
+            ConnectorPool(max_concurrency=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,15 +19,18 @@
 
 from datetime import datetime
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import uuid
 
+from docai_bq_connector.bigquery.BufferedWriter import BufferedWriter
 from docai_bq_connector.bigquery.StorageManager import StorageManager
 from docai_bq_connector.connector.BqDocumentMapper import BqDocumentMapper
 from docai_bq_connector.connector.BqMetadataMapper import BqMetadataMapper
 from docai_bq_connector.connector.BqMetadataMapper import BqMetadataMappingInfo
 from docai_bq_connector.doc_ai_processing.DocumentState import DocumentState
 from docai_bq_connector.doc_ai_processing.ProcessedDocument import ProcessedDocument
+from docai_bq_connector.doc_ai_processing.Processor import DEFAULT_POLL_INITIAL_DELAY
+from docai_bq_connector.doc_ai_processing.Processor import DEFAULT_POLL_MAX_DELAY
 from docai_bq_connector.doc_ai_processing.Processor import Processor
 from docai_bq_connector.exception.DocReferenceException import DocAlreadyProcessedError
 from docai_bq_connector.exception.DocReferenceException import (
@@ -64,6 +67,9 @@ class DocAIBQConnector:
         should_write_extraction_result: bool = True,
         max_sync_page_count: int = 5,
         parsing_methodology: str = "entities",
+        bq_writer: Optional[BufferedWriter] = None,
+        poll_initial_delay: float = DEFAULT_POLL_INITIAL_DELAY,
+        poll_max_delay: float = DEFAULT_POLL_MAX_DELAY,
     ):
         self.bucket_name = bucket_name
         self.file_name = file_name
@@ -92,11 +98,30 @@ class DocAIBQConnector:
         self.should_write_extraction_result = should_write_extraction_result
         self.max_sync_page_count = max_sync_page_count
         self.parsing_methodology = parsing_methodology
+        if bq_writer is not None:
+            writer_storage = bq_writer.storage_manager
+            if (
+                destination_project_id is not None
+                and destination_project_id != writer_storage.project_id
+            ) or destination_dataset_id != writer_storage.dataset_id:
+                raise ValueError(
+                    f"Destination '{destination_project_id}.{destination_dataset_id}' "
+                    f"does not match the bq_writer destination "
+                    f"'{writer_storage.project_id}.{writer_storage.dataset_id}'"
+                )
+        # When set, rows are buffered and inserted in batches shared with other
+        # connector runs. The caller is responsible for flushing the writer.
+        self.bq_writer = bq_writer
+        self.poll_initial_delay = poll_initial_delay
+        self.poll_max_delay = poll_max_delay
 
     def run(self):
-        storage_manager = StorageManager(
-            self.destination_project_id, self.destination_dataset_id
-        )
+        if self.bq_writer is not None:
+            storage_manager = self.bq_writer.storage_manager
+        else:
+            storage_manager = StorageManager(
+                self.destination_project_id, self.destination_dataset_id
+            )
         doc_ai_process = Processor(
             bucket_name=self.bucket_name,
             file_name=self.file_name,
@@ -111,6 +136,8 @@ class DocAIBQConnector:
             should_async_wait=self.should_async_wait,
             should_write_extraction_result=self.should_write_extraction_result,
             max_sync_page_count=self.max_sync_page_count,
+            poll_initial_delay=self.poll_initial_delay,
+            poll_max_delay=self.poll_max_delay,
         )
 
         document = doc_ai_process.process()
@@ -155,7 +182,10 @@ class DocAIBQConnector:
             }
             logging.debug("Will insert into doc_reference table:")
             logging.debug(bq_row)
-            storage_manager.write_record("doc_reference", bq_row)
+            if self.bq_writer is not None:
+                self.bq_writer.write_record("doc_reference", bq_row)
+            else:
+                storage_manager.write_record("doc_reference", bq_row)
         else:
             # Existing document that was sent for HITL review
             # Retrieve info stored when the doc was first processed
@@ -227,10 +257,10 @@ class DocAIBQConnector:
                 f"in '{self.destination_project_id}.{self.destination_dataset_id}'"
             )
 
-        schema = storage_manager.get_table_schema(self.destination_table_id)
+        schema_index = storage_manager.get_table_schema_index(self.destination_table_id)
         mapper = BqDocumentMapper(
             document=document,
-            bq_schema=schema,
+            bq_schema=schema_index,
             metadata_mapper=self.metadata_mapper,
             custom_fields=self.custom_fields,
             include_raw_entities=self.include_raw_entities,
@@ -248,11 +278,34 @@ class DocAIBQConnector:
         bq_row = mapper.to_bq_row()
 
         # 1: Attempt initial row insert
-        insert_1_errors = storage_manager.write_record(
-            self.destination_table_id, bq_row
-        )
+        if self.bq_writer is not None:
+            # Retries, if any, are issued once the buffered batch is flushed
+            self.bq_writer.write_record(
+                self.destination_table_id,
+                bq_row,
+                callback=lambda errors: self._handle_insert_errors(
+                    storage_manager, mapper, errors
+                ),
+            )
+        else:
+            insert_1_errors = storage_manager.write_record(
+                self.destination_table_id, bq_row
+            )
+            self._handle_insert_errors(storage_manager, mapper, insert_1_errors)
+
+        return document
+
+    def _handle_insert_errors(
+        self,
+        storage_manager: StorageManager,
+        mapper: BqDocumentMapper,
+        insert_1_errors,
+    ):
         self.log_bq_errors(1, insert_1_errors)
-        exclude_fields: [str] = mapper.process_insert_errors(insert_1_errors)
+        exclude_fields: List[str] = mapper.process_insert_errors(insert_1_errors)
+        if len(exclude_fields) > 0:
+            # Field level errors may mean the table schema changed since it was cached
+            storage_manager.invalidate_table_schema(self.destination_table_id)
 
         retry_success = False
         if self.continue_on_error is True:
@@ -283,8 +336,6 @@ class DocAIBQConnector:
                 else:
                     logging.warning("There are no fields to insert")
 
-        return document
-
     @staticmethod
     def log_bq_errors(retry, errors):
         if errors:
@@ -24,8 +24,18 @@ from google.cloud.documentai_v1 import Document
 
 class ProcessedDocument:
     def __init__(
-        self, document: Document, dictionary, hitl_operation_id: Optional[str] = None
+        self,
+        document: Document,
+        dictionary: Optional[dict] = None,
+        hitl_operation_id: Optional[str] = None,
     ):
         self.document = document
-        self.dictionary = dictionary
+        self._dictionary = dictionary
         self.hitl_operation_id = hitl_operation_id
+
+    @property
+    def dictionary(self) -> dict:
+        # Converted on first use only, the copy is as large as the document itself
+        if self._dictionary is None:
+            self._dictionary = Document.to_dict(self.document)
+        return self._dictionary
@@ -18,21 +18,29 @@
 #
 import logging
 import re
+import time
 from typing import Union
 import uuid
 
 from docai_bq_connector.doc_ai_processing.DocumentOperation import DocumentOperation
 from docai_bq_connector.doc_ai_processing.ProcessedDocument import ProcessedDocument
 from docai_bq_connector.exception.InvalidGcsUriError import InvalidGcsUriError
+from docai_bq_connector.helper.client_util import get_documentai_client
+from docai_bq_connector.helper.client_util import get_storage_client
+from docai_bq_connector.helper.document_util import get_shard_file_index
+from docai_bq_connector.helper.document_util import merge_document_shards
 from docai_bq_connector.helper.gcs_util import get_gcs_blob
 from docai_bq_connector.helper.gcs_util import write_gcs_blob
 from docai_bq_connector.helper.pdf_util import get_pdf_page_cnt
 from google.cloud import documentai_v1 as documentai
-from google.cloud import storage
 
 CONTENT_TYPE_PDF = "application/pdf"
 CONTENT_TYPE_JSON = "application/json"
 
+# Batch operations are polled with an exponential backoff between these delays
+DEFAULT_POLL_INITIAL_DELAY = 1.0
+DEFAULT_POLL_MAX_DELAY = 30.0
+
 
 class Processor:
     def __init__(
@@ -50,6 +58,8 @@ class Processor:
         should_async_wait: bool = True,
         should_write_extraction_result: bool = True,
         max_sync_page_count: int = 5,
+        poll_initial_delay: float = DEFAULT_POLL_INITIAL_DELAY,
+        poll_max_delay: float = DEFAULT_POLL_MAX_DELAY,
     ):
         self.bucket_name = bucket_name
         self.file_name = file_name
@@ -63,6 +73,8 @@ class Processor:
         self.async_timeout = async_timeout
         self.should_async_wait = should_async_wait
         self.max_sync_page_count = max_sync_page_count
+        self.poll_initial_delay = poll_initial_delay
+        self.poll_max_delay = poll_max_delay
         if should_write_extraction_result and extraction_result_output_bucket is None:
             raise Exception(
                 "extraction_result_output_bucket should be set when should_write_extraction_result is set to True"
@@ -78,14 +90,34 @@ class Processor:
     def _get_document_ai_options(self):
         return {"api_endpoint": f"{self.processor_location}-documentai.googleapis.com"}
 
-    def _write_result_to_gcs(self, json_result_as_str):
+    def _wait_for_operation(self, operation):
+        """
+        Polls a long-running operation until it completes, doubling the delay
+        between polls up to poll_max_delay.
+        Raises TimeoutError if the operation is not done within async_timeout.
+        """
+        deadline = time.monotonic() + self.async_timeout
+        delay = self.poll_initial_delay
+        while not operation.done():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(
+                    f"Operation {operation.operation.name} did not complete "
+                    f"within {self.async_timeout} seconds"
+                )
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.poll_max_delay)
+        # Raises the operation error, if any
+        return operation.result()
+
+    def _write_result_to_gcs(self, document: documentai.Document):
         if self.should_write_extraction_result:
             split_fname = self.file_name.split(".")[0]
             json_file_name = f"{split_fname}.json"
             write_gcs_blob(
                 self.extraction_result_output_bucket,
                 json_file_name,
-                json_result_as_str,
+                documentai.Document.to_json(document),
                 content_type="application/json",
             )
 
@@ -109,7 +141,7 @@ class Processor:
         """
         # You must set the api_endpoint if you use a location other than 'us', e.g.:
         opts = self._get_document_ai_options()
-        client = documentai.DocumentProcessorServiceClient(client_options=opts)
+        client = get_documentai_client(opts["api_endpoint"])
 
         document = {"content": document_blob, "mime_type": self.content_type}
 
@@ -130,12 +162,8 @@ class Processor:
             hitl_op_split = hitl_op.split("/")
             hitl_op_id = hitl_op_split.pop()
 
-        # This method will sometimes run out of memory if the document is big enough
-        # It seems to work fine if # of pages <= 5
-        results_dict = documentai.types.Document.to_dict(results.document)
         return ProcessedDocument(
             document=results.document,
-            dictionary=results_dict,
             hitl_operation_id=hitl_op_id,
         )
 
@@ -159,7 +187,7 @@ class Processor:
         """
         # You must set the api_endpoint if you use a location other than 'us', e.g.:
         opts = self._get_document_ai_options()
-        client = documentai.DocumentProcessorServiceClient(client_options=opts)
+        client = get_documentai_client(opts["api_endpoint"])
 
         # Add a unique folder to the uri for this particular async operation
         unique_folder = uuid.uuid4().hex
@@ -207,7 +235,7 @@ class Processor:
             return DocumentOperation(operation.operation.name)
 
         # Wait for the operation to finish
-        operation.result(timeout=self.async_timeout)
+        self._wait_for_operation(operation)
         logging.debug("DocAI Batch Process finished")
 
         if operation.metadata and operation.metadata.individual_process_statuses:
@@ -218,7 +246,7 @@ class Processor:
             )
         else:
             # Fallback to using the GCS path set in the request
-            hitl_gcs_output = output_config
+            hitl_gcs_output = destination_uri
             hitl_op_full_path = None
 
         # Results are written to GCS. Use a regex to find
@@ -232,34 +260,38 @@ class Processor:
                 "The supplied async_output_folder_gcs_uri is not a properly structured GCS Path"
             )
 
-        storage_client = storage.Client()
+        storage_client = get_storage_client()
         bucket = storage_client.get_bucket(output_bucket)
         blob_list = list(bucket.list_blobs(prefix=prefix))
-        # should always be a single document here
-        for i, blob in enumerate(blob_list):
-            # If JSON file, download the contents of this blob as a bytes object.
-            if blob.content_type == "application/json":
-                blob_as_bytes = blob.download_as_bytes()
-
-                document = documentai.Document.from_json(
-                    blob_as_bytes, ignore_unknown_fields=True
-                )
-                logging.debug(f"Fetched file {i + 1}: {blob.name}")
+        json_blobs = []
+        for blob in blob_list:
+            if blob.content_type == CONTENT_TYPE_JSON:
+                json_blobs.append(blob)
             else:
                 logging.info(f"Skipping non-supported file type {blob.name}")
+        # Large documents are split in several shards
+        json_blobs.sort(key=lambda blob: get_shard_file_index(blob.name))
+
+        # Shards are downloaded and parsed one at a time, the merged document
+        # holds all of them
+        def load_shards():
+            for i, blob in enumerate(json_blobs):
+                logging.debug(f"Fetched file {i + 1}: {blob.name}")
+                yield documentai.Document.from_json(
+                    blob.download_as_bytes(), ignore_unknown_fields=True
+                )
+
+        document = merge_document_shards(load_shards())
 
         # Delete the unique folder created for this operation
-        blobs = list(bucket.list_blobs(prefix=prefix))
-        bucket.delete_blobs(blobs)
+        bucket.delete_blobs(blob_list)
         hitl_op_id = None
         if hitl_op_full_path:
             logging.debug(f"Async processing returned hitl_op = {hitl_op_full_path}")
             hitl_op_id = hitl_op_full_path.split("/").pop()
 
-        results_dict = documentai.types.Document.to_dict(document)
         return ProcessedDocument(
             document=document,
-            dictionary=results_dict,
             hitl_operation_id=hitl_op_id,
         )
 
@@ -267,10 +299,7 @@ class Processor:
         document = documentai.types.Document.from_json(
             gcs_blob, ignore_unknown_fields=True
         )
-        results_dict = documentai.types.Document.to_dict(document)
-        return ProcessedDocument(
-            document=document, dictionary=results_dict, hitl_operation_id=None
-        )
+        return ProcessedDocument(document=document, hitl_operation_id=None)
 
     def process(self) -> Union[DocumentOperation, ProcessedDocument]:
         gcs_doc_blob, gcs_doc_meta = self._get_gcs_blob()
@@ -286,7 +315,7 @@ class Processor:
                 isinstance(process_result, ProcessedDocument)
                 and process_result is not None
             ):
-                self._write_result_to_gcs(process_result.dictionary)
+                self._write_result_to_gcs(process_result.document)
         elif self.content_type == CONTENT_TYPE_JSON:
             # This document was already processed and sent for HITL review. The result must now be processed
             logging.debug(
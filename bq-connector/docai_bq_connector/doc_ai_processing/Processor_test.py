@@ -0,0 +1,112 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Unit tests for Processor"""
+
+import unittest
+from unittest.mock import patch
+
+from docai_bq_connector.doc_ai_processing.Processor import Processor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeOperation:
+    """Long-running operation done after `polls` calls to done()"""
+
+    def __init__(self, polls: int, result=None, error=None):
+        self.polls = polls
+        self._result = result
+        self._error = error
+        self.operation = type("Operation", (), {"name": "operations/123"})
+
+    def done(self) -> bool:
+        self.polls -= 1
+        return self.polls < 0
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class TestWaitForOperation(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch(
+            "docai_bq_connector.doc_ai_processing.Processor.time", self.clock
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_processor(self, async_timeout: int = 900) -> Processor:
+        return Processor(
+            bucket_name="bucket",
+            file_name="doc.pdf",
+            content_type="application/pdf",
+            processor_project_id="project",
+            processor_location="us",
+            processor_id="processor",
+            extraction_result_output_bucket=None,
+            async_output_folder_gcs_uri="gs://bucket/output",
+            async_timeout=async_timeout,
+            should_write_extraction_result=False,
+            poll_initial_delay=1,
+            poll_max_delay=4,
+        )
+
+    def test_backoff_is_doubled_up_to_max_delay(self):
+        operation = FakeOperation(polls=5, result="document")
+
+        result = self.make_processor()._wait_for_operation(operation)
+
+        self.assertEqual(result, "document")
+        self.assertEqual(self.clock.sleeps, [1, 2, 4, 4, 4])
+
+    def test_no_sleep_when_done(self):
+        self.make_processor()._wait_for_operation(FakeOperation(polls=0))
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            self.make_processor(async_timeout=10)._wait_for_operation(
+                FakeOperation(polls=100)
+            )
+        # The last sleep is cut short at the deadline
+        self.assertEqual(self.clock.sleeps, [1, 2, 4, 3])
+
+    def test_operation_error_is_raised(self):
+        operation = FakeOperation(polls=1, error=RuntimeError("failed"))
+        with self.assertRaises(RuntimeError):
+            self.make_processor()._wait_for_operation(operation)
+
+
+if __name__ == "__main__":
+    unittest.main()
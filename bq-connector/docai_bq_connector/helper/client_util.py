@@ -0,0 +1,54 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from functools import lru_cache
+from typing import Optional
+
+from google.cloud import bigquery
+from google.cloud import documentai_v1 as documentai
+from google.cloud import storage
+
+# Clients are created once per process and shared, so credential discovery and
+# channel setup are not repeated for every document. The Google clients are
+# safe to share between threads.
+
+
+@lru_cache(maxsize=None)
+def get_documentai_client(
+    api_endpoint: str,
+) -> documentai.DocumentProcessorServiceClient:
+    return documentai.DocumentProcessorServiceClient(
+        client_options={"api_endpoint": api_endpoint}
+    )
+
+
+@lru_cache(maxsize=None)
+def get_storage_client() -> storage.Client:
+    return storage.Client()
+
+
+@lru_cache(maxsize=None)
+def get_bigquery_client(project_id: Optional[str] = None) -> bigquery.Client:
+    return bigquery.Client(project=project_id)
+
+
+def clear_clients():
+    get_documentai_client.cache_clear()
+    get_storage_client.cache_clear()
+    get_bigquery_client.cache_clear()
@@ -0,0 +1,68 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Unit tests for client_util"""
+
+import unittest
+from unittest.mock import patch
+
+from docai_bq_connector.helper import client_util
+
+
+class TestClientUtil(unittest.TestCase):
+    def setUp(self):
+        client_util.clear_clients()
+        self.addCleanup(client_util.clear_clients)
+
+    @patch.object(client_util.bigquery, "Client")
+    def test_bigquery_client_reused_per_project(self, client_class):
+        client_class.side_effect = lambda project=None: object()
+
+        client = client_util.get_bigquery_client("project-a")
+
+        self.assertIs(client_util.get_bigquery_client("project-a"), client)
+        self.assertIsNot(client_util.get_bigquery_client("project-b"), client)
+        self.assertEqual(client_class.call_count, 2)
+
+    @patch.object(client_util.documentai, "DocumentProcessorServiceClient")
+    def test_documentai_client_reused_per_endpoint(self, client_class):
+        client_class.side_effect = lambda client_options: object()
+
+        client = client_util.get_documentai_client("us-documentai.googleapis.com")
+
+        self.assertIs(
+            client_util.get_documentai_client("us-documentai.googleapis.com"), client
+        )
+        client_util.get_documentai_client("eu-documentai.googleapis.com")
+        self.assertEqual(client_class.call_count, 2)
+
+    @patch.object(client_util.storage, "Client")
+    def test_clear_clients(self, client_class):
+        client_class.side_effect = object
+
+        client = client_util.get_storage_client()
+        self.assertIs(client_util.get_storage_client(), client)
+        client_util.clear_clients()
+
+        self.assertIsNot(client_util.get_storage_client(), client)
+        self.assertEqual(client_class.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from google.cloud import documentai_v1 as documentai
+
+
+def get_shard_file_index(file_name: str) -> int:
+    # Batch output shards are written as <name>-<shard_index>.json
+    match = re.search(r"-(\d+)\.json$", file_name)
+    return int(match.group(1)) if match else 0
+
+
+def _shift_text_anchors(message, offset: int):
+    if message.DESCRIPTOR.name == "TextAnchor":
+        for segment in message.text_segments:
+            segment.start_index += offset
+            segment.end_index += offset
+        return
+    for field, value in message.ListFields():
+        if field.type != field.TYPE_MESSAGE:
+            continue
+        items = [value] if hasattr(value, "ListFields") else value
+        for item in items:
+            _shift_text_anchors(item, offset)
+
+
+def _shift_page_refs(entity, offset: int):
+    for page_ref in entity.page_anchor.page_refs:
+        page_ref.page += offset
+    for prop in entity.properties:
+        _shift_page_refs(prop, offset)
+
+
+class _ShardMerger:
+    def __init__(self) -> None:
+        self.document: Optional[documentai.Document] = None
+        self.text_parts: List[str] = []
+        self.text_length = 0
+        self.shard_count = 0
+
+    def append(self, shard: documentai.Document):
+        shard_pb = documentai.Document.pb(shard)
+        # Without textOffset, the shard text follows the text merged so far
+        text_offset = int(shard_pb.shard_info.text_offset) or self.text_length
+        if text_offset != self.text_length:
+            logging.warning(
+                f"Shard {self.shard_count} has text offset {text_offset}, "
+                f"expected {self.text_length}"
+            )
+        if text_offset:
+            _shift_text_anchors(shard_pb, text_offset)
+        # pageRefs are relative to the pages of the shard
+        if len(shard_pb.pages) > 0:
+            page_offset = min(page.page_number for page in shard_pb.pages) - 1
+            for entity in shard_pb.entities:
+                _shift_page_refs(entity, page_offset)
+
+        self.text_parts.append(shard_pb.text)
+        self.text_length += len(shard_pb.text)
+        self.shard_count += 1
+        if self.document is None:
+            # Document level fields (uri, mime_type, ...) come from the first shard
+            shard_pb.ClearField("text")
+            shard_pb.ClearField("shard_info")
+            self.document = shard
+            return
+        document_pb = documentai.Document.pb(self.document)
+        document_pb.pages.extend(shard_pb.pages)
+        document_pb.entities.extend(shard_pb.entities)
+        document_pb.entity_relations.extend(shard_pb.entity_relations)
+        document_pb.text_styles.extend(shard_pb.text_styles)
+        document_pb.revisions.extend(shard_pb.revisions)
+
+
+def merge_document_shards(
+    shards: Iterable[documentai.Document],
+) -> documentai.Document:
+    """
+    Merges the shards of a Document AI batch output into one document.
+    Shards are read one at a time and appended to the merged document as soon
+    as their turn comes, so no list of parsed shards is built first. The
+    merged document still holds every shard, as it is mapped and written out
+    whole.
+    Args:
+        shards: Shards of the document, in file name order
+    Returns:
+        The merged document
+    """
+    merger = _ShardMerger()
+    pending: Dict[int, documentai.Document] = {}
+    for position, shard in enumerate(shards):
+        shard_index = int(shard.shard_info.shard_index)
+        if not shard.shard_info.shard_count or shard_index in pending:
+            # No usable shardInfo, keep the file name order
+            shard_index = position
+        pending[shard_index] = shard
+        del shard
+        while merger.shard_count in pending:
+            merger.append(pending.pop(merger.shard_count))
+
+    # Shard indexes were not contiguous
+    for shard_index in sorted(pending):
+        logging.warning(f"Shard {shard_index} is out of sequence")
+        merger.append(pending.pop(shard_index))
+
+    if merger.document is None:
+        return documentai.Document()
+    merger.document.text = "".join(merger.text_parts)
+    return merger.document
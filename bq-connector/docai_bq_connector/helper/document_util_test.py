@@ -0,0 +1,100 @@
+#
+# Copyright 2022 Google LLC
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Unit tests for document_util"""
+
+import unittest
+
+from docai_bq_connector.helper.document_util import get_shard_file_index
+from docai_bq_connector.helper.document_util import merge_document_shards
+from google.cloud import documentai_v1 as documentai
+
+
+def make_shard(text: str, page_number: int, shard_info=None) -> documentai.Document:
+    # One page, with an entity and its property anchored to the whole text
+    anchors = {
+        "text_anchor": {"text_segments": [{"start_index": 0, "end_index": len(text)}]},
+        "page_anchor": {"page_refs": [{"page": 0}]},
+    }
+    return documentai.Document(
+        text=text,
+        pages=[{"page_number": page_number}],
+        entities=[{**anchors, "properties": [anchors]}],
+        shard_info=shard_info,
+    )
+
+
+def anchored_text(document: documentai.Document):
+    return [
+        (
+            document.text[segment.start_index : segment.end_index],
+            prop_segment.start_index,
+            entity.page_anchor.page_refs[0].page,
+            entity.properties[0].page_anchor.page_refs[0].page,
+        )
+        for entity in document.entities
+        for segment in entity.text_anchor.text_segments
+        for prop_segment in entity.properties[0].text_anchor.text_segments
+    ]
+
+
+class TestMergeDocumentShards(unittest.TestCase):
+    def test_shards_merged_by_shard_index(self):
+        merged = merge_document_shards(
+            [
+                make_shard(
+                    "ghi", 3, {"shard_index": 2, "shard_count": 3, "text_offset": 6}
+                ),
+                make_shard("abc", 1, {"shard_index": 0, "shard_count": 3}),
+                make_shard(
+                    "def", 2, {"shard_index": 1, "shard_count": 3, "text_offset": 3}
+                ),
+            ]
+        )
+
+        self.assertEqual(merged.text, "abcdefghi")
+        self.assertEqual([page.page_number for page in merged.pages], [1, 2, 3])
+        self.assertEqual(
+            anchored_text(merged),
+            [("abc", 0, 0, 0), ("def", 3, 1, 1), ("ghi", 6, 2, 2)],
+        )
+        self.assertFalse(merged.shard_info)
+
+    def test_shards_without_shard_info(self):
+        files = {"doc-10.json": "ccc", "doc-0.json": "aaa", "doc-2.json": "bbb"}
+
+        merged = merge_document_shards(
+            make_shard(files[file], page_number)
+            for page_number, file in enumerate(
+                sorted(files, key=get_shard_file_index), start=1
+            )
+        )
+
+        self.assertEqual(merged.text, "aaabbbccc")
+        self.assertEqual(
+            anchored_text(merged),
+            [("aaa", 0, 0, 0), ("bbb", 3, 1, 1), ("ccc", 6, 2, 2)],
+        )
+
+    def test_no_shards(self):
+        self.assertEqual(merge_document_shards([]), documentai.Document())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,12 +19,12 @@
 
 import logging
 
-from google.cloud import storage
+from docai_bq_connector.helper.client_util import get_storage_client
 
 
 def get_gcs_blob(bucket_name, file_name):
     try:
-        gcs_client = storage.Client()
+        gcs_client = get_storage_client()
         bucket = gcs_client.get_bucket(bucket_name)
         gcs_file = bucket.get_blob(file_name)
         file_meta = gcs_file.metadata
@@ -38,7 +38,7 @@ def get_gcs_blob(bucket_name, file_name):
 
 
 def write_gcs_blob(bucket_name, file_name, content_as_str, content_type):
-    gcs_client = storage.Client()
+    gcs_client = get_storage_client()
     bucket = gcs_client.get_bucket(bucket_name)
     gcs_file = bucket.blob(file_name)
     gcs_file.upload_from_string(content_as_str, content_type=content_type)
@@ -20,6 +20,8 @@ retrieving specific configuration elements.
 import datetime
 import json
 import os
+import threading
+import time
 from typing import Any, cast, Dict, Optional, Tuple
 
 import google.auth
@@ -63,10 +65,18 @@ DOCAI_OUTPUT_BUCKET = os.environ.get(
 )
 CONFIG_BUCKET = os.environ.get("CONFIG_BUCKET", f"{PROJECT_ID}-config")
 CONFIG_FILE_NAME = "config.json"
+# Local configuration file to use instead of the one in CONFIG_BUCKET (e.g. for tests)
+CONFIG_FILE_PATH = os.environ.get("CONFIG_FILE_PATH")
+# Configuration is served from memory and checked for updates once per interval
+CONFIG_CACHE_TTL_SECONDS = float(os.environ.get("CONFIG_CACHE_TTL_SECONDS", 60))
 CLASSIFICATION_UNDETECTABLE = "unclassified"
 CLOUD_RUN_EXECUTION = os.environ.get("CLOUD_RUN_EXECUTION")
 REGION = os.environ.get("REGION")
 SPLITTER_OUTPUT_DIR = os.environ.get("SPLITTER_OUTPUT_DIR", "splitter_output")
+# Maximum number of split subdocuments uploaded concurrently
+SPLITTER_UPLOAD_WORKERS = int(os.environ.get("SPLITTER_UPLOAD_WORKERS", 8))
+# Maximum number of classification outputs read from GCS concurrently
+CLASSIFY_RESULT_WORKERS = int(os.environ.get("CLASSIFY_RESULT_WORKERS", 8))
 
 PDF_EXTENSION = ".pdf"
 PDF_MIME_TYPE = "application/pdf"
@@ -94,6 +104,8 @@ FULL_JOB_NAME = run_v2.ExecutionsClient.job_path(PROJECT_ID, REGION, "classify-j
 BUCKET: Optional[storage.Bucket] = None
 LAST_MODIFIED_TIME_OF_CONFIG = datetime.datetime.now()
 CONFIG_DATA: Optional[Dict[Any, Any]] = None
+CONFIG_CHECKED_AT: Optional[float] = None
+CONFIG_LOCK = threading.Lock()
 
 logger.info(
     f"Settings used: CLASSIFY_INPUT_BUCKET=gs://{CLASSIFY_INPUT_BUCKET}, INPUT_FILE={INPUT_FILE}, "
@@ -134,13 +146,11 @@ def get_config(
     Returns:
         Optional[Dict[Any, Any]]: The configuration data.
     """
-    global CONFIG_DATA
-    if not CONFIG_DATA:
-        CONFIG_DATA = load_config(CONFIG_BUCKET, CONFIG_FILE_NAME)
-        assert CONFIG_DATA, "Unable to load configuration data"
+    config_data = get_cached_config()
+    assert config_data, "Unable to load configuration data"
 
     config_data_loaded = (
-        CONFIG_DATA.get(config_name, {}) if config_name else CONFIG_DATA
+        config_data.get(config_name, {}) if config_name else config_data
     )
 
     if element_path:
@@ -165,6 +175,46 @@ def get_config(
     return config_data_loaded
 
 
+def is_config_cache_expired() -> bool:
+    """
+    Checks whether the cached configuration needs to be checked for updates.
+
+    Returns:
+        bool: True if the configuration was never loaded or is older than the TTL.
+    """
+    return (
+        not CONFIG_DATA
+        or CONFIG_CHECKED_AT is None
+        or time.monotonic() - CONFIG_CHECKED_AT >= CONFIG_CACHE_TTL_SECONDS
+    )
+
+
+def get_cached_config() -> Optional[Dict[Any, Any]]:
+    """
+    Retrieves the configuration data from memory, refreshing it once the TTL expired.
+
+    Concurrent callers share a single refresh. If the refresh fails,
+    the previously loaded configuration keeps being used.
+
+    Returns:
+        Optional[Dict[Any, Any]]: The configuration data.
+    """
+    global CONFIG_CHECKED_AT
+    if not is_config_cache_expired():
+        return CONFIG_DATA
+
+    with CONFIG_LOCK:
+        # Another thread may have refreshed the configuration in the meantime
+        if is_config_cache_expired():
+            if CONFIG_FILE_PATH:
+                load_local_config(CONFIG_FILE_PATH)
+            else:
+                load_config(CONFIG_BUCKET, CONFIG_FILE_NAME)
+            CONFIG_CHECKED_AT = time.monotonic()
+
+    return CONFIG_DATA
+
+
 def get_parser_name_by_doc_type(doc_type: str) -> Optional[str]:
     """Retrieves the parser name based on the document type.
 
@@ -255,6 +305,35 @@ def load_config(bucket_name: str, filename: str) -> Optional[Dict[Any, Any]]:
     return CONFIG_DATA
 
 
+def load_local_config(file_path: str) -> Optional[Dict[Any, Any]]:
+    """
+    Loads the configuration data from a local file, if it was modified since last loaded.
+
+    Args:
+        file_path (str): The configuration file path.
+
+    Returns:
+        Optional[Dict[Any, Any]]: The configuration data.
+    """
+    global CONFIG_DATA, LAST_MODIFIED_TIME_OF_CONFIG
+    try:
+        last_modified_time = datetime.datetime.fromtimestamp(
+            os.path.getmtime(file_path)
+        )
+        if CONFIG_DATA and LAST_MODIFIED_TIME_OF_CONFIG == last_modified_time:
+            return CONFIG_DATA
+
+        logger.info(f"Reloading config from: {file_path}")
+        with open(file_path, encoding="utf-8") as json_file:
+            CONFIG_DATA = json.load(json_file)
+        LAST_MODIFIED_TIME_OF_CONFIG = last_modified_time
+    except (OSError, json.JSONDecodeError) as exc:
+        logger.error(f"Error loading local config file {file_path}: {exc}")
+        return None
+
+    return CONFIG_DATA
+
+
 def get_docai_settings() -> Optional[Dict[Any, Any]]:
     """
     Retrieves the Document AI settings configuration.
@@ -0,0 +1,112 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Unit tests of the configuration cache """
+
+import datetime
+import json
+from types import SimpleNamespace
+from typing import Dict, Optional
+import unittest
+from unittest.mock import patch
+
+import config
+
+
+class FakeBlob:
+    """Configuration file stored in GCS"""
+
+    def __init__(self, data: Dict, updated: datetime.datetime):
+        self.data = data
+        self.updated = updated
+        self.downloads = 0
+
+    def download_as_text(self, encoding: str = "utf-8") -> str:
+        self.downloads += 1
+        return json.dumps(self.data)
+
+
+class FakeBucket:
+    def __init__(self, blob: Optional[FakeBlob]):
+        self.blob = blob
+        self.get_blob_calls = 0
+
+    def get_blob(self, filename: str) -> Optional[FakeBlob]:
+        self.get_blob_calls += 1
+        return self.blob
+
+
+class TestGetCachedConfig(unittest.TestCase):
+    """Tests for get_cached_config"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.bucket = FakeBucket(
+            FakeBlob({"version": 1}, datetime.datetime(2024, 1, 1))
+        )
+        for name, value in (
+            ("time", SimpleNamespace(monotonic=lambda: self.now)),
+            ("BUCKET", self.bucket),
+            ("CONFIG_FILE_PATH", None),
+            ("CONFIG_CACHE_TTL_SECONDS", 60),
+            ("CONFIG_DATA", None),
+            ("CONFIG_CHECKED_AT", None),
+            ("LAST_MODIFIED_TIME_OF_CONFIG", None),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_served_from_memory_within_ttl(self):
+        """The configuration is read from GCS once per TTL"""
+        self.assertEqual(config.get_cached_config(), {"version": 1})
+        self.now += 59
+        self.assertEqual(config.get_cached_config(), {"version": 1})
+
+        self.assertEqual(self.bucket.get_blob_calls, 1)
+        self.assertFalse(config.is_config_cache_expired())
+
+    def test_unchanged_config_not_downloaded_again(self):
+        """Once the TTL expired, an unchanged file is not downloaded again"""
+        config.get_cached_config()
+        self.now += 60
+        self.assertTrue(config.is_config_cache_expired())
+
+        self.assertEqual(config.get_cached_config(), {"version": 1})
+        self.assertEqual(self.bucket.get_blob_calls, 2)
+        self.assertEqual(self.bucket.blob.downloads, 1)
+        self.assertFalse(config.is_config_cache_expired())
+
+    def test_reloaded_after_ttl(self):
+        """An updated file is loaded once the TTL expired"""
+        config.get_cached_config()
+        self.bucket.blob = FakeBlob({"version": 2}, datetime.datetime(2024, 1, 2))
+
+        self.now += 30
+        self.assertEqual(config.get_cached_config(), {"version": 1})
+        self.now += 30
+        self.assertEqual(config.get_cached_config(), {"version": 2})
+
+    def test_previous_config_kept_on_failure(self):
+        """If the file cannot be read, the previous configuration is used"""
+        config.get_cached_config()
+        self.bucket.blob = None
+
+        self.now += 60
+        self.assertEqual(config.get_cached_config(), {"version": 1})
+        self.assertFalse(config.is_config_cache_expired())
+
+
+if __name__ == "__main__":
+    unittest.main()
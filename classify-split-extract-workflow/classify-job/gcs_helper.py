@@ -175,11 +175,17 @@ def split_uri_2_path_filename(uri: str) -> Tuple[str, str]:
 
 
 def upload_file(
-    bucket_name: str, source_file_name: str, destination_blob_name: str
+    bucket_name: str,
+    source_file_name: str,
+    destination_blob_name: str,
+    metadata: Optional[Dict[str, str]] = None,
 ) -> str:
-    """Uploads a file to the bucket."""
+    """Uploads a file to the bucket, with optional custom metadata set in the
+    same request."""
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(destination_blob_name)
+    if metadata:
+        blob.metadata = metadata
 
     blob.upload_from_filename(source_file_name)
 
@@ -51,7 +51,7 @@ def process():
         # When classifier/splitter is not setup
         if not processor:
             logger.info(f"{CLASSIFIER} processor not found in the config.json")
-            classified_items = handle_no_classifier(f_uris)
+            classified_items = [handle_no_classifier(f_uris)]
         else:
             # Run Classification job
             logger.info(
@@ -59,7 +59,7 @@ def process():
             )
             classified_items = batch_classification(processor, dai_client, f_uris)
 
-        logger.info(f"Classified items: {classified_items}")
+        # Inputs are saved as they are classified
         out_bucket_name, out_file_name = save_classification_results(classified_items)
 
     except Exception as e:
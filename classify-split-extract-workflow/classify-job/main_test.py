@@ -12,15 +12,527 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-""" Helper function to test locally Classification/Splitting processing """
+""" Unit tests of the classification results handling, and helper function to test
+locally Classification/Splitting processing """
+
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
 import config
+from google.cloud import documentai_v1 as documentai
 from logging_handler import Logger
+from pikepdf import Pdf
+import split_and_classify
 
 from main import process
 
 logger = Logger.get_logger(__file__)
 
+OUTPUT_BUCKET = "docai-output"
+
+
+def make_entity(
+    entity_type: str, confidence: float, pages: Optional[List[int]] = None
+) -> Dict:
+    entity: Dict = {"type": entity_type, "confidence": confidence}
+    if pages is not None:
+        entity["pageAnchor"] = {"pageRefs": [{"page": str(page)} for page in pages]}
+    return entity
+
+
+def make_blob(name: str, document: Optional[Dict] = None) -> MagicMock:
+    blob = MagicMock()
+    blob.name = name
+    blob.content_type = "application/json" if document is not None else "image/png"
+    blob.download_as_bytes.return_value = json.dumps(document or {}).encode()
+    return blob
+
+
+class TestProcessClassifyResults(unittest.TestCase):
+    """Tests for process_classify_results"""
+
+    def setUp(self):
+        for name, value in (
+            ("get_classification_confidence_threshold", 0.5),
+            ("get_classification_default_class", "generic"),
+        ):
+            patcher = patch.object(config, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(
+            config, "get_document_class_by_classifier_label", side_effect=str
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(split_and_classify.gcs_helper, "add_metadata")
+        self.add_metadata = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process(
+        self,
+        outputs: Dict[str, List[MagicMock]],
+        split_results: Dict[str, Dict],
+        split: Optional[Callable[[str, List], Dict]] = None,
+        consume: Callable[[Iterator[Dict]], List[Dict]] = list,
+    ):
+        """Runs process_classify_results for one input per output prefix, with
+        split_pdf calling split, or returning split_results for each input, and
+        returns the documents of each input read by consume."""
+        metadata = documentai.BatchProcessMetadata(
+            state=documentai.BatchProcessMetadata.State.SUCCEEDED,
+            individual_process_statuses=[
+                {
+                    "input_gcs_source": f"gs://input/{prefix}.pdf",
+                    "output_gcs_destination": f"gs://{OUTPUT_BUCKET}/{prefix}",
+                }
+                for prefix in outputs
+            ],
+        )
+        storage_client = MagicMock()
+        storage_client.list_blobs.side_effect = lambda bucket, prefix: outputs[
+            prefix.rstrip("/")
+        ]
+        split_pdf = MagicMock(
+            side_effect=split or (lambda gcs_uri, entities: split_results[gcs_uri])
+        )
+        with patch.object(
+            split_and_classify, "storage_client", storage_client
+        ), patch.object(split_and_classify, "split_pdf", split_pdf):
+            documents = consume(split_and_classify.process_classify_results(metadata))
+        return documents, split_pdf
+
+    def test_keeps_documents_of_all_inputs_and_shards(self):
+        """Both inputs are kept, and the entities of the second shard of a split
+        input are passed to split_pdf with page references of the whole input"""
+        outputs = {
+            "single": [
+                make_blob(
+                    "single/doc-0.json", {"entities": [make_entity("invoice", 0.9)]}
+                )
+            ],
+            "sharded": [
+                make_blob(
+                    "sharded/doc-1.json",
+                    {
+                        "shardInfo": {"shardIndex": "1", "shardCount": "2"},
+                        "pages": [{"pageNumber": 3}, {"pageNumber": 4}],
+                        "entities": [make_entity("paystub", 0.8, [0, 1])],
+                    },
+                ),
+                make_blob("sharded/page-1.png"),
+                make_blob(
+                    "sharded/doc-0.json",
+                    {
+                        "shardInfo": {"shardIndex": "0", "shardCount": "2"},
+                        "pages": [{"pageNumber": 1}, {"pageNumber": 2}],
+                        "entities": [make_entity("invoice", 0.9, [0, 1])],
+                    },
+                ),
+            ],
+        }
+        split_results = {
+            "gs://input/sharded.pdf": {
+                "invoice": ["gs://input/splitter_output/sharded_pg1-2_invoice.pdf"],
+                "paystub": ["gs://input/splitter_output/sharded_pg3-4_paystub.pdf"],
+            }
+        }
+
+        documents, split_pdf = self.process(outputs, split_results)
+
+        self.assertCountEqual(
+            documents,
+            [{"invoice": ["gs://input/single.pdf"]}, *split_results.values()],
+        )
+        split_pdf.assert_called_once()
+        gcs_uri, entities = split_pdf.call_args.args
+        self.assertEqual(gcs_uri, "gs://input/sharded.pdf")
+        self.assertEqual(
+            [
+                (entity.type_, [int(ref.page) for ref in entity.page_anchor.page_refs])
+                for entity in entities
+            ],
+            [("invoice", [0, 1]), ("paystub", [2, 3])],
+        )
+        self.add_metadata.assert_called_once_with(
+            "gs://input/single.pdf",
+            {config.METADATA_CONFIDENCE: 0.9, config.METADATA_DOCUMENT_TYPE: "invoice"},
+        )
+
+    def test_skips_inputs_without_output(self):
+        """An input without output shards does not drop the other inputs"""
+        outputs = {
+            "empty": [make_blob("empty/page-1.png")],
+            "single": [
+                make_blob("single/doc-0.json", {"entities": [make_entity("w2", 0.9)]})
+            ],
+        }
+
+        documents, split_pdf = self.process(outputs, {})
+
+        self.assertEqual(documents, [{"w2": ["gs://input/single.pdf"]}])
+        split_pdf.assert_not_called()
+
+    def test_orders_shards_without_shard_info_by_file_name(self):
+        """Shards without shard indexes are merged in the order of the index in
+        their file name, whatever the listing order"""
+        outputs = {
+            "sharded": [
+                make_blob(
+                    f"sharded/doc-{index}.json",
+                    {
+                        "pages": [{"pageNumber": index + 1}],
+                        "entities": [make_entity(f"type_{index}", 0.9, [0])],
+                    },
+                )
+                for index in (10, 2, 0, 1)
+            ]
+        }
+
+        _, split_pdf = self.process(outputs, {"gs://input/sharded.pdf": {}})
+
+        _, entities = split_pdf.call_args.args
+        self.assertEqual(
+            [
+                (entity.type_, [int(ref.page) for ref in entity.page_anchor.page_refs])
+                for entity in entities
+            ],
+            [("type_0", [0]), ("type_1", [1]), ("type_2", [2]), ("type_10", [10])],
+        )
+
+    def test_splits_inputs_concurrently(self):
+        """Each input is split as soon as its output is read, concurrently with
+        the other inputs"""
+        outputs = {
+            prefix: [
+                make_blob(
+                    f"{prefix}/doc-0.json",
+                    {
+                        "entities": [
+                            make_entity("invoice", 0.9, [0]),
+                            make_entity("paystub", 0.9, [1]),
+                        ]
+                    },
+                )
+            ]
+            for prefix in ("first", "second")
+        }
+        split_results = {
+            f"gs://input/{prefix}.pdf": {
+                "invoice": [f"gs://input/{prefix}_pg1_invoice.pdf"],
+                "paystub": [f"gs://input/{prefix}_pg2_paystub.pdf"],
+            }
+            for prefix in outputs
+        }
+        # Neither split returns before both have started
+        both_splitting = threading.Barrier(2, timeout=5)
+
+        def split_when_both_splitting(gcs_uri, _entities):
+            both_splitting.wait()
+            return split_results[gcs_uri]
+
+        documents, split_pdf = self.process(
+            outputs, split_results, split_when_both_splitting
+        )
+
+        self.assertEqual(split_pdf.call_count, 2)
+        self.assertCountEqual(documents, list(split_results.values()))
+
+    def test_yields_each_input_when_done(self):
+        """An input is yielded while the output of another input is still being
+        read"""
+        outputs = {
+            "slow": [
+                make_blob("slow/doc-0.json", {"entities": [make_entity("w2", 0.9)]})
+            ],
+            "fast": [
+                make_blob(
+                    "fast/doc-0.json", {"entities": [make_entity("invoice", 0.9)]}
+                )
+            ],
+        }
+        fast_yielded = threading.Event()
+        download_slow_output = outputs["slow"][0].download_as_bytes
+
+        def download_after_fast_yielded():
+            self.assertTrue(fast_yielded.wait(timeout=5))
+            return download_slow_output.return_value
+
+        download_slow_output.side_effect = download_after_fast_yielded
+
+        def consume(results: Iterator[Dict]) -> List[Dict]:
+            first = next(results)
+            fast_yielded.set()
+            return [first, *results]
+
+        documents, _ = self.process(outputs, {}, consume=consume)
+
+        self.assertEqual(
+            documents,
+            [{"invoice": ["gs://input/fast.pdf"]}, {"w2": ["gs://input/slow.pdf"]}],
+        )
+
+
+class TestSaveClassificationResults(unittest.TestCase):
+    """Tests for save_classification_results"""
+
+    def setUp(self):
+        self.calls: List[tuple] = []
+        for target, name, side_effect in (
+            (
+                config,
+                "get_model_name_table_name",
+                lambda document_type: (
+                    f"models.{document_type}",
+                    f"tables.{document_type}",
+                ),
+            ),
+            (
+                config,
+                "get_parser_name_by_doc_type",
+                lambda document_type: (
+                    None if document_type == "unknown" else f"{document_type}_parser"
+                ),
+            ),
+            (
+                split_and_classify.docai_helper,
+                "get_processor_and_client",
+                lambda processor_name: (processor_name, None),
+            ),
+            (
+                split_and_classify.bq_mlops,
+                "remote_model_create",
+                lambda processor, model_name: self.calls.append(("model", model_name)),
+            ),
+            (
+                split_and_classify.bq_mlops,
+                "object_table_create",
+                lambda f_uris, document_type: self.calls.append(
+                    ("object_table", document_type, f_uris)
+                )
+                or f"objects.{document_type}",
+            ),
+            (split_and_classify.utils, "get_utc_timestamp", lambda: "timestamp"),
+        ):
+            patcher = patch.object(target, name, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(
+            split_and_classify.gcs_helper,
+            "write_data_to_gcs",
+            side_effect=lambda bucket_name, blob_name, content, mime_type: (
+                bucket_name,
+                blob_name,
+            ),
+        )
+        self.write_data_to_gcs = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def classified_items(self) -> Iterator[Dict]:
+        yield {"invoice": ["gs://input/a.pdf"], "unknown": ["gs://input/b.pdf"]}
+        self.calls.append(("yielded",))
+        yield {"invoice": ["gs://input/c.pdf"], "w2": ["gs://input/d.pdf"]}
+        self.calls.append(("yielded",))
+
+    def test_creates_models_as_types_are_classified(self):
+        """The model of a type is created when the type is first classified, and
+        its object table once all of its documents are known"""
+        result = split_and_classify.save_classification_results(self.classified_items())
+
+        self.assertEqual(
+            result,
+            (config.CLASSIFY_OUTPUT_BUCKET, f"timestamp_{config.OUTPUT_FILE_JSON}"),
+        )
+        self.assertEqual(
+            self.calls,
+            [
+                ("model", "models.invoice"),
+                ("yielded",),
+                ("model", "models.w2"),
+                ("yielded",),
+                (
+                    "object_table",
+                    "invoice",
+                    ["gs://input/a.pdf", "gs://input/c.pdf"],
+                ),
+                ("object_table", "w2", ["gs://input/d.pdf"]),
+            ],
+        )
+        self.assertEqual(
+            json.loads(self.write_data_to_gcs.call_args.kwargs["content"]),
+            [
+                {
+                    "object_table_name": f"objects.{document_type}",
+                    "model_name": f"models.{document_type}",
+                    "out_table_name": f"tables.{document_type}",
+                }
+                for document_type in ("invoice", "w2")
+            ],
+        )
+
+    def test_nothing_classified(self):
+        """No output is written when no input was classified"""
+        self.assertEqual(
+            split_and_classify.save_classification_results(iter([])), (None, None)
+        )
+        self.write_data_to_gcs.assert_not_called()
+
+
+class FakeUploadBlob:
+    """Blob recording the metadata and content it was uploaded with"""
+
+    def __init__(self, bucket: "FakeUploadBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.metadata: Optional[Dict] = None
+
+    def upload_from_filename(self, filename: str):
+        self.bucket.upload(self, filename)
+
+
+class FakeUploadBucket:
+    """Bucket recording uploads, each taking `upload_seconds`"""
+
+    def __init__(self, upload_seconds: float):
+        self.upload_seconds = upload_seconds
+        self.uploads: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def blob(self, name: str) -> FakeUploadBlob:
+        return FakeUploadBlob(self, name)
+
+    def upload(self, blob: FakeUploadBlob, filename: str):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.upload_seconds)
+        with Pdf.open(filename) as pdf:
+            page_count = len(pdf.pages)
+        with self.lock:
+            self.running -= 1
+            self.uploads[blob.name] = (page_count, blob.metadata)
+
+
+class TestSplitPdf(unittest.TestCase):
+    """Tests for split_pdf"""
+
+    def setUp(self):
+        for name, value in (
+            ("get_classification_confidence_threshold", 0.5),
+            ("get_classification_default_class", "generic"),
+        ):
+            patcher = patch.object(config, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(
+            config, "get_document_class_by_classifier_label", side_effect=str
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.bucket = FakeUploadBucket(upload_seconds=0.05)
+        storage_client = MagicMock()
+        storage_client.bucket.return_value = self.bucket
+        for target, name, value in (
+            (split_and_classify.gcs_helper, "storage_client", storage_client),
+            (split_and_classify.gcs_helper, "download_file", self.download_file),
+            (split_and_classify.gcs_helper, "add_metadata", MagicMock()),
+            (split_and_classify, "SPLITTER_UPLOAD_WORKERS", 4),
+        ):
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def download_file(gcs_uri: str, output_filename: str) -> str:
+        """Writes a 12 page PDF instead of downloading the input"""
+        with Pdf.new() as pdf:
+            for _ in range(12):
+                pdf.add_blank_page()
+            pdf.save(output_filename)
+        return output_filename
+
+    def test_uploads_subdocuments_with_metadata(self):
+        """Subdocuments are uploaded concurrently, named after their pages and
+        type, with their metadata set in the upload request"""
+        gcs_uri = "gs://input/bundles/bundle.pdf"
+        entities = [
+            documentai.Document.Entity.from_json(
+                json.dumps(make_entity(f"type_{index}", 0.9, [start, start + 1]))
+            )
+            for index, start in enumerate(range(0, 12, 2))
+        ]
+
+        documents = split_and_classify.split_pdf(gcs_uri, entities)
+
+        expected_names = [
+            f"bundles/splitter_output/bundle_pg{start + 1}-{start + 2}_type_{index}.pdf"
+            for index, start in enumerate(range(0, 12, 2))
+        ]
+        self.assertEqual(
+            documents,
+            {
+                f"type_{index}": [f"gs://input/{name}"]
+                for index, name in enumerate(expected_names)
+            },
+        )
+        self.assertEqual(
+            self.bucket.uploads,
+            {
+                name: (
+                    2,
+                    {
+                        config.METADATA_CONFIDENCE: 0.9,
+                        config.METADATA_DOCUMENT_TYPE: f"type_{index}",
+                        "original": gcs_uri,
+                    },
+                )
+                for index, name in enumerate(expected_names)
+            },
+        )
+        split_and_classify.gcs_helper.add_metadata.assert_not_called()
+        self.assertGreater(self.bucket.max_running, 1)
+        self.assertLessEqual(self.bucket.max_running, 4)
+
+
+class TestAddPredictedDocumentType(unittest.TestCase):
+    """Tests for add_predicted_document_type"""
+
+    @patch.object(config, "get_document_class_by_classifier_label", side_effect=str)
+    @patch.object(config, "get_classification_default_class", return_value="generic")
+    @patch.object(config, "get_classification_confidence_threshold", return_value=0.5)
+    def test_appends_every_document_of_a_type(self, *_):
+        """Every document of a type is kept, not only the first one"""
+        documents: Dict[str, List[str]] = {}
+        for uri, confidence in (
+            ("gs://input/a.pdf", 0.9),
+            ("gs://input/b.pdf", 0.8),
+            ("gs://input/c.pdf", 0.1),
+        ):
+            split_and_classify.add_predicted_document_type(
+                {
+                    config.METADATA_CONFIDENCE: confidence,
+                    config.METADATA_DOCUMENT_TYPE: "invoice",
+                },
+                input_gcs_source=uri,
+                documents=documents,
+            )
+
+        self.assertEqual(
+            documents,
+            {
+                "invoice": ["gs://input/a.pdf", "gs://input/b.pdf"],
+                "generic": ["gs://input/c.pdf"],
+            },
+        )
+
+
 if __name__ == "__main__":
     # To be used for testing from the local machine. Specify the file to trigger processing
     # Either a single file like below (must be located in GCS: gs://PROJECT_ID--documents/)
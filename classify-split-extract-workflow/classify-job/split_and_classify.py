@@ -21,18 +21,23 @@ classification results, splitting PDF files based on classification, and handlin
 metadata and callbacks.
 """
 
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 import re
-from typing import Dict, List, Optional, Tuple
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import bq_mlops
 import config
+from config import CLASSIFY_RESULT_WORKERS
 from config import DOCAI_OUTPUT_BUCKET
 from config import METADATA_CONFIDENCE
 from config import METADATA_DOCUMENT_TYPE
 from config import NO_CLASSIFIER_LABEL
 from config import SPLITTER_OUTPUT_DIR
+from config import SPLITTER_UPLOAD_WORKERS
 import docai_helper
 import gcs_helper
 from google.cloud import documentai_v1 as documentai
@@ -54,7 +59,7 @@ def batch_classification(
     processor: documentai.types.processor.Processor,
     dai_client: documentai.DocumentProcessorServiceClient,
     input_uris: List[str],
-) -> Optional[Dict]:
+) -> Optional[Iterator[Dict]]:
     """Performs batch classification on a list of documents using Document AI."""
     logger.info(f"input_uris = {input_uris}")
     if not input_uris:
@@ -96,39 +101,76 @@ def batch_classification(
     return process_classify_results(metadata)
 
 
-def process_classify_results(metadata: BatchProcessMetadata) -> Optional[Dict]:
-    """Processes the results of a classification operation."""
-    logger.info(f"handling classification results - operation.metadata={metadata}")
+def process_classify_results(metadata: BatchProcessMetadata) -> Iterator[Dict]:
+    """Processes the results of a classification operation.
 
-    documents = {}
+    Returns an iterator over the documents of each input, see
+    iter_classify_results().
+    """
+    logger.info(f"handling classification results - operation.metadata={metadata}")
 
     if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
         raise ValueError(f"Batch Process Failed: {metadata.state_message}")
 
-    for process in metadata.individual_process_statuses:
-        matches = re.match(r"gs://(.*?)/(.*)", process.output_gcs_destination)
-        if matches:
-            output_bucket, output_prefix = matches.groups()
-        else:
-            logger.error(
-                f"Invalid GCS destination format: {process.output_gcs_destination}"
+    return iter_classify_results(list(metadata.individual_process_statuses))
+
+
+def iter_classify_results(
+    processes: List[BatchProcessMetadata.IndividualProcessStatus],
+) -> Iterator[Dict]:
+    """Yields the documents of each input as soon as it has been split or tagged.
+
+    Each input is handled by its own worker, which splits or tags the input as
+    soon as its output has been read, while the outputs of the other inputs
+    are still being downloaded. Inputs are yielded in completion order, and
+    inputs without entities are skipped.
+    """
+    with ThreadPoolExecutor(max_workers=CLASSIFY_RESULT_WORKERS) as executor:
+        futures = [
+            executor.submit(
+                handle_classify_output,
+                process.input_gcs_source,
+                process.output_gcs_destination,
             )
-            continue
-        input_gcs_source = process.input_gcs_source
+            for process in processes
+        ]
+        for future in as_completed(futures):
+            documents = future.result()
+            if documents:
+                yield documents
 
-        logger.info(
-            f"output_bucket = {output_bucket}, "
-            f"output_prefix={output_prefix}, "
-            f"input_gcs_source = {input_gcs_source}, "
-            f"output_gcs_destination = {process.output_gcs_destination}"
-        )
 
-        # Adding support for shards using toolbox after the issue is addressed
-        # https://github.com/googleapis/python-documentai-toolbox/issues/332
-        output_blob = list(
-            storage_client.list_blobs(output_bucket, prefix=output_prefix + "/")
-        )[0]
+def handle_classify_output(
+    input_gcs_source: str, output_gcs_destination: str
+) -> Optional[Dict]:
+    """Reads the output of a single input and splits or tags the input, or
+    returns None when no entities were found."""
+    blob_entities = read_classify_output(output_gcs_destination)
+    if not blob_entities:
+        logger.info(f"No entities found for {input_gcs_source}")
+        return None
+
+    return classify_input(input_gcs_source, blob_entities)
 
+
+def read_classify_output(
+    output_gcs_destination: str,
+) -> Optional[List[Document.Entity]]:
+    """Reads all the output shards of a single input and returns their merged
+    entities, or None when the output cannot be read."""
+    matches = re.match(r"gs://(.*?)/(.*)", output_gcs_destination)
+    if matches:
+        output_bucket, output_prefix = matches.groups()
+    else:
+        logger.error(f"Invalid GCS destination format: {output_gcs_destination}")
+        return None
+
+    logger.info(f"output_bucket = {output_bucket}, output_prefix={output_prefix}")
+
+    shards = []
+    for output_blob in storage_client.list_blobs(
+        output_bucket, prefix=output_prefix + "/"
+    ):
         if ".json" not in output_blob.name:
             logger.info(
                 f"Skipping non-supported file: {output_blob.name} - Mimetype: "
@@ -136,26 +178,70 @@ def process_classify_results(metadata: BatchProcessMetadata) -> Optional[Dict]:
             )
             continue
 
-        document_out = documentai.Document.from_json(
-            output_blob.download_as_bytes(), ignore_unknown_fields=True
+        shards.append(
+            (
+                output_blob.name,
+                documentai.Document.from_json(
+                    output_blob.download_as_bytes(), ignore_unknown_fields=True
+                ),
+            )
         )
-        blob_entities = document_out.entities
 
-        if not blob_entities:
-            logger.info(f"No entities found for {input_gcs_source}")
-            continue
+    if not shards:
+        logger.warning(f"No output found in {output_gcs_destination}")
+        return None
 
-        if is_splitting_required(blob_entities):
-            documents = split_pdf(input_gcs_source, blob_entities)
-        else:
-            max_confidence_entity = max(blob_entities, key=lambda item: item.confidence)
-            metadata = get_metadata(max_confidence_entity)
-            gcs_helper.add_metadata(input_gcs_source, metadata)
+    return merge_shard_entities(shards)
 
-            add_predicted_document_type(
-                metadata, input_gcs_source=input_gcs_source, documents=documents
-            )
 
+def merge_shard_entities(shards: List[Tuple[str, Document]]) -> List[Document.Entity]:
+    """Merges the entities of the output shards of a single input.
+
+    Shards are merged in shard index order. When shard indexes are missing or
+    duplicated, shards are merged in the order of the index in their file
+    name (`<name>-<index>.json`), and then of their file name. Page references
+    in a shard are relative to its own pages, so they are offset by the number
+    of the first page of the shard.
+    """
+    shard_indexes = {shard.shard_info.shard_index for _, shard in shards}
+    if len(shard_indexes) == len(shards):
+        ordered = sorted(shards, key=lambda item: item[1].shard_info.shard_index)
+    else:
+        logger.warning(
+            "Missing or duplicated shard indexes, merging shards in file name order"
+        )
+        ordered = sorted(shards, key=lambda item: shard_file_order(item[0]))
+
+    entities = []
+    for _, shard in ordered:
+        page_offset = shard.pages[0].page_number - 1 if shard.pages else 0
+        for entity in shard.entities:
+            if page_offset:
+                for page_ref in entity.page_anchor.page_refs:
+                    page_ref.page += page_offset
+            entities.append(entity)
+    return entities
+
+
+def shard_file_order(blob_name: str) -> Tuple[int, str]:
+    """Returns the sort key of an output shard from its file name."""
+    matches = re.search(r"-(\d+)\.json$", blob_name)
+    return (int(matches.group(1)) if matches else -1, blob_name)
+
+
+def classify_input(input_gcs_source: str, entities: List[Document.Entity]) -> Dict:
+    """Splits or tags a single input based on its classification entities."""
+    if is_splitting_required(entities):
+        return split_pdf(input_gcs_source, entities)
+
+    documents: Dict[str, List[str]] = {}
+    max_confidence_entity = max(entities, key=lambda item: item.confidence)
+    metadata = get_metadata(max_confidence_entity)
+    gcs_helper.add_metadata(input_gcs_source, metadata)
+
+    add_predicted_document_type(
+        metadata, input_gcs_source=input_gcs_source, documents=documents
+    )
     return documents
 
 
@@ -200,7 +286,7 @@ def add_predicted_document_type(
 
     if predicted_class not in documents:
         documents[predicted_class] = []
-        documents[predicted_class].append(input_gcs_source)
+    documents[predicted_class].append(input_gcs_source)
 
 
 def handle_no_classifier(f_uris: List[str]) -> Dict:
@@ -237,25 +323,34 @@ def stream_classification_results(
 
 
 def save_classification_results(
-    classified_items: Dict,
+    classified_items: Optional[Iterable[Dict]],
 ) -> Tuple[Optional[str], Optional[str]]:
-    """Saves classification results to Google Cloud Storage."""
+    """Saves classification results to Google Cloud Storage.
+
+    classified_items yields the documents of each input, by document type. The
+    remote model of a document type is created as soon as the type is first
+    classified, while the remaining inputs are still being classified, and the
+    object table of each type once all of its documents are known.
+    """
     payload_data = []
     try:
-        for document_type, f_uris in classified_items.items():
-            model_name, out_table_name = config.get_model_name_table_name(document_type)
-            processor_name = config.get_parser_name_by_doc_type(document_type)
-            if processor_name:
-                processor, _ = docai_helper.get_processor_and_client(processor_name)
-            else:
-                logger.error(f"No processor found for document type: {document_type}")
-                continue
-
+        # f_uris and model of each document type with a processor
+        f_uris_by_type: Dict[str, List[str]] = {}
+        models: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        for documents in classified_items or []:
+            logger.info(f"Classified items: {documents}")
+            for document_type, f_uris in documents.items():
+                if document_type not in f_uris_by_type:
+                    f_uris_by_type[document_type] = []
+                    model = create_document_type_model(document_type)
+                    if model:
+                        models[document_type] = model
+                f_uris_by_type[document_type].extend(f_uris)
+
+        for document_type, (model_name, out_table_name) in models.items():
             object_table_name = bq_mlops.object_table_create(
-                f_uris=f_uris, document_type=document_type
+                f_uris=f_uris_by_type[document_type], document_type=document_type
             )
-            bq_mlops.remote_model_create(processor=processor, model_name=model_name)
-
             payload_data.append(
                 {
                     "object_table_name": object_table_name,
@@ -286,6 +381,21 @@ def save_classification_results(
     return bucket, blob_object
 
 
+def create_document_type_model(
+    document_type: str,
+) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """Creates the remote model of a document type, and returns its model and
+    output table names, or None when the type has no processor."""
+    model_name, out_table_name = config.get_model_name_table_name(document_type)
+    processor_name = config.get_parser_name_by_doc_type(document_type)
+    if not processor_name:
+        logger.error(f"No processor found for document type: {document_type}")
+        return None
+    processor, _ = docai_helper.get_processor_and_client(processor_name)
+    bq_mlops.remote_model_create(processor=processor, model_name=model_name)
+    return model_name, out_table_name
+
+
 def is_splitting_required(entities: List[Document.Entity]) -> bool:
     """Check if splitting is required based on entities."""
     try:
@@ -335,11 +445,12 @@ def split_pdf(gcs_uri: str, entities: List[Document.Entity]) -> Dict:
             metadata=metadata, input_gcs_source=gcs_uri, documents=documents
         )
     else:
-        temp_local_dir = os.path.join(
-            os.path.dirname(__file__), "temp_files", utils.get_utc_timestamp()
+        # Inputs are split concurrently, so each split gets its own directory
+        temp_files_dir = os.path.join(os.path.dirname(__file__), "temp_files")
+        os.makedirs(temp_files_dir, exist_ok=True)
+        temp_local_dir = tempfile.mkdtemp(
+            prefix=f"{utils.get_utc_timestamp()}_", dir=temp_files_dir
         )
-        if not os.path.exists(temp_local_dir):
-            os.makedirs(temp_local_dir)
 
         pdf_path = os.path.join(temp_local_dir, os.path.basename(gcs_uri))
         gcs_helper.download_file(gcs_uri=gcs_uri, output_filename=pdf_path)
@@ -347,7 +458,12 @@ def split_pdf(gcs_uri: str, entities: List[Document.Entity]) -> Dict:
         input_filename, input_extension = os.path.splitext(os.path.basename(pdf_path))
         bucket_name, _ = gcs_utilities.split_gcs_uri(gcs_uri)
 
-        with Pdf.open(pdf_path) as pdf:
+        uploads = []
+        with Pdf.open(pdf_path) as pdf, ThreadPoolExecutor(
+            max_workers=SPLITTER_UPLOAD_WORKERS
+        ) as executor:
+            # Subdocuments are written one at a time since the shared source
+            # Pdf is not thread-safe, while the uploads run in the pool.
             for entity in entities:
                 subdoc_type = entity.type_ or "subdoc"
                 page_refs = entity.page_anchor.page_refs
@@ -374,7 +490,6 @@ def split_pdf(gcs_uri: str, entities: List[Document.Entity]) -> Dict:
                 destination_blob_name = os.path.join(
                     gcs_path, SPLITTER_OUTPUT_DIR, output_filename
                 )
-                destination_blob_uri = f"gs://{bucket_name}/{destination_blob_name}"
 
                 local_out_file = os.path.join(temp_local_dir, output_filename)
 
@@ -382,18 +497,21 @@ def split_pdf(gcs_uri: str, entities: List[Document.Entity]) -> Dict:
                 subdoc.pages.extend(pdf.pages[start_page : end_page + 1])
                 subdoc.save(local_out_file, min_version=pdf.pdf_version)
 
-                gcs_helper.upload_file(
+                future = executor.submit(
+                    gcs_helper.upload_file,
                     bucket_name=bucket_name,
                     source_file_name=local_out_file,
                     destination_blob_name=destination_blob_name,
-                )
-                gcs_helper.add_metadata(destination_blob_uri, metadata)
-
-                add_predicted_document_type(
                     metadata=metadata,
-                    input_gcs_source=destination_blob_uri,
-                    documents=documents,
                 )
+                uploads.append((future, metadata))
+
+        for future, metadata in uploads:
+            add_predicted_document_type(
+                metadata=metadata,
+                input_gcs_source=future.result(),
+                documents=documents,
+            )
 
         utils.delete_directory(temp_local_dir)
     return documents
@@ -3,19 +3,23 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import base64
-import gc
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 import json
 import mimetypes
+import os
 from pathlib import Path
 import shutil
 import tempfile
-from typing import Dict, List
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, TextIO, Tuple
 
 from flask import jsonify
 import functions_framework
 from google.cloud import storage
+import ijson
 from PIL import Image
-import psutil
 import pypdfium2 as pdfium
 
 
@@ -51,32 +55,60 @@ def parse_results(request):
     # define pageImageUrlPrefix and pageImageNames which may be used by a frontend to render the document pages from images stored on GCS
     response["pageImageUrlPrefix"] = result_prefix
     response["pageImageNames"] = []
+    # pages without an image are rendered from the input PDF, which is opened at most once per invocation
+    with PdfPageImages(
+        input_bucket_name, input_object_name, result_bucket_name, result_prefix
+    ) as page_images:
+        return process_results(
+            response,
+            input_bucket_name,
+            input_object_name,
+            result_bucket_name,
+            result_prefix,
+            page_images,
+        )
+
+
+def process_results(
+    response,
+    input_bucket_name,
+    input_object_name,
+    result_bucket_name,
+    result_prefix,
+    page_images,
+):
+    """Merge or post-process the batchProcess output and complete the response"""
     # retrieve all blobs in the result bucket for the given result prefix (e.g. belonging to the same batchProcess output)
     blobs = list_results(result_bucket_name, result_prefix)
     # only use blobs of content-type application/json which contain batchProcess output
     blobs = [blob for blob in blobs if blob.content_type == "application/json"]
     # if the result JSON is sharded merge it into a single result JSON
     if len(blobs) > 1:
-        # merge sharded results
-        document, page_image_names = merge_sharded_results(
-            blobs,
-            input_bucket_name,
-            input_object_name,
-            result_bucket_name,
-            result_prefix,
-        )
-        # add pageImageNames from shards to response
-        response["pageImageNames"] = response["pageImageNames"] + page_image_names
-        # upload unsharded document
-        storage_client = storage.Client()
-        process_result_bucket = storage_client.get_bucket(result_bucket_name)
-        document_blob = storage.Blob(
-            name=str(Path(result_prefix, "unsharded.json")),
-            bucket=process_result_bucket,
-        )
-        document_blob.upload_from_string(
-            json.dumps(document), content_type="application/json"
-        )
+        # merge sharded results into a local file, which is then uploaded as unsharded document
+        with tempfile.TemporaryDirectory() as merge_dir:
+            merged_file_name = str(Path(merge_dir, "unsharded.json"))
+            with open(merged_file_name, "w", encoding="utf-8") as merged_file:
+                page_image_names, page_count = merge_sharded_results(
+                    blobs,
+                    input_bucket_name,
+                    input_object_name,
+                    result_bucket_name,
+                    result_prefix,
+                    merged_file,
+                    page_images,
+                )
+            # add pageImageNames from shards to response
+            response["pageImageNames"] = response["pageImageNames"] + page_image_names
+            # upload unsharded document
+            storage_client = storage.Client()
+            process_result_bucket = storage_client.get_bucket(result_bucket_name)
+            document_blob = storage.Blob(
+                name=str(Path(result_prefix, "unsharded.json")),
+                bucket=process_result_bucket,
+            )
+            document_blob.upload_from_filename(
+                merged_file_name, content_type="application/json"
+            )
         # update resultObject to unsharded blob in response
         response["resultObject"] = document_blob.name
         # delete shard blobs
@@ -102,6 +134,7 @@ def parse_results(request):
                 input_object_name=input_object_name,
                 result_bucket_name=result_bucket_name,
                 result_prefix=result_prefix,
+                page_images=page_images,
             )
         else:
             # extract images from batchProcess output and put them into the same location as the batchProcess output for better performance in the HITL UI
@@ -111,6 +144,7 @@ def parse_results(request):
                 input_object_name,
                 result_bucket_name,
                 result_prefix,
+                page_images=page_images,
             )
             # remove images from pages
             for page in document["pages"]:
@@ -121,18 +155,15 @@ def parse_results(request):
                 json.dumps(document), content_type="application/json"
             )
 
-    if "pages" in document:
-        page_count = len(document["pages"])
-    else:
-        # splitter result may not have pages, only entities so we need to find the highest page number from the entities
-        page_count = 1
-        if "entities" in document:
-            for entity in document["entities"]:
-                if "pageAnchor" in entity and "pageRefs" in entity["pageAnchor"]:
-                    for page_anchor in entity["pageAnchor"]["pageRefs"]:
-                        if "page" in page_anchor:
-                            # page_anchor starts at page 0
-                            page_count = max(page_count, int(page_anchor["page"]) + 1)
+        if "pages" in document:
+            page_count = len(document["pages"])
+        else:
+            # splitter result may not have pages, only entities so we need to find the highest page number from the entities
+            page_count = max(
+                [entity_pages(entity) for entity in document.get("entities", [])],
+                default=1,
+            )
+
     response["pageCount"] = page_count
     print(response)
     return jsonify(response)
@@ -174,98 +205,285 @@ def apply_text_offset(json_input, text_offset):
             apply_text_offset(item, text_offset)
 
 
+def iter_document_fields(stream: BinaryIO) -> Iterator[Tuple[str, Any]]:
+    """Parse a Document JSON stream one top-level field at a time
+
+    Yields:
+        (key, value): the value is parsed for scalar and object fields, for list fields it is an
+            iterator over the parsed items of the list, which has to be consumed before the next field
+    """
+    events = ijson.parse(stream, use_float=True)
+    for prefix, event, value in events:
+        if prefix != "" or event != "map_key":
+            continue
+        key = value
+        _, event, value = next(events)
+        if event == "start_array":
+            items = iter_list_items(events)
+            yield key, items
+            # skip the items not consumed by the caller
+            for _ in items:
+                pass
+        else:
+            yield key, build_value(events, event, value)
+
+
+def iter_list_items(events: Iterator[Tuple[str, str, Any]]) -> Iterator[Any]:
+    for _, event, value in events:
+        if event == "end_array":
+            return
+        yield build_value(events, event, value)
+
+
+def build_value(events: Iterator[Tuple[str, str, Any]], event: str, value: Any) -> Any:
+    builder = ijson.ObjectBuilder()
+    builder.event(event, value)
+    depth = 1 if event in ("start_map", "start_array") else 0
+    while depth:
+        _, event, value = next(events)
+        builder.event(event, value)
+        if event in ("start_map", "start_array"):
+            depth += 1
+        elif event in ("end_map", "end_array"):
+            depth -= 1
+    return builder.value
+
+
+class ShardSpool:
+    """Fields of a sharded result, spooled to temporary files
+
+    The text is stored JSON escaped and each top-level list (pages, entities, ...) one JSON item per line,
+    so that the merged document can be written in shard order holding a single item in memory.
+    """
+
+    def __init__(self, spool_dir: str):
+        self.spool_dir = spool_dir
+        self.text_length = 0
+        self.text_offset: Optional[int] = None
+        self.shard_info: Dict = {}
+        # first page number of the shard, starting at 1
+        self.first_page_number: Optional[int] = None
+        self.page_image_names: List[str] = []
+        self.list_files: Dict[str, str] = {}
+
+    def text_file(self) -> str:
+        return str(Path(self.spool_dir, "text"))
+
+    def list_file(self, key: str) -> str:
+        if key not in self.list_files:
+            self.list_files[key] = str(
+                Path(self.spool_dir, f"list-{len(self.list_files)}")
+            )
+        return self.list_files[key]
+
+    def iter_list_items(self, key: str) -> Iterator[Any]:
+        if key not in self.list_files:
+            return
+        with open(self.list_files[key], encoding="utf-8") as list_file:
+            for line in list_file:
+                yield json.loads(line)
+
+
+def spool_shard(
+    blob: storage.Blob,
+    spool_dir: str,
+    fields: Dict[str, Any],
+    result_bucket_name,
+    result_prefix,
+    page_images: "PdfPageImages",
+) -> ShardSpool:
+    """Stream a sharded result into a ShardSpool, extracting the page images on the way
+
+    Fields other than text and lists are added to fields unless already set by a previous shard.
+    """
+    shard = ShardSpool(spool_dir)
+    storage_client = page_images.get_storage_client()
+    # pages without an image, rendered together from the input PDF once the shard is spooled
+    missing_pages: Dict[int, Tuple[int, int]] = {}
+    with blob.open("rb") as stream:
+        for key, value in iter_document_fields(stream):
+            if key == "shardInfo":
+                shard.shard_info = value
+            elif key == "text":
+                shard.text_length = len(value)
+                with open(shard.text_file(), "w", encoding="utf-8") as text_file:
+                    # strip the quotes, texts of all shards are joined in a single JSON string
+                    text_file.write(json.dumps(value)[1:-1])
+            elif isinstance(value, Iterator):
+                with open(shard.list_file(key), "a", encoding="utf-8") as list_file:
+                    for item in value:
+                        if key == "pages":
+                            page_number = int(item["pageNumber"])
+                            if shard.first_page_number is None:
+                                shard.first_page_number = page_number
+                            shard.first_page_number = min(
+                                shard.first_page_number, page_number
+                            )
+                            image_name = upload_page_image(
+                                item,
+                                page_number,
+                                result_bucket_name,
+                                result_prefix,
+                                storage_client,
+                            )
+                            if image_name is None:
+                                missing_pages[len(shard.page_image_names)] = (
+                                    page_number - 1,
+                                    page_number,
+                                )
+                                image_name = ""
+                            shard.page_image_names.append(image_name)
+                            item.pop("image", None)
+                        list_file.write(json.dumps(item) + "\n")
+            elif key not in fields:
+                fields[key] = value
+    if missing_pages:
+        rendered_names = page_images.page_image_names(list(missing_pages.values()))
+        for position, image_name in zip(missing_pages.keys(), rendered_names):
+            shard.page_image_names[position] = image_name
+    return shard
+
+
 def merge_sharded_results(
     blobs: List[storage.Blob],
     input_bucket_name,
     input_object_name,
     result_bucket_name,
     result_prefix,
+    output: TextIO,
+    page_images: Optional["PdfPageImages"] = None,
 ):
+    """Merge sharded results and write the merged document JSON to output
+
+    Shards are parsed as streams and their pages, entities and other lists spooled to temporary files,
+    which keeps memory bounded by the largest page or entity rather than by the size of the document.
+
+    Returns:
+        (page_image_names, page_count) of the merged document
+    """
+    if page_images is None:
+        with PdfPageImages(
+            input_bucket_name, input_object_name, result_bucket_name, result_prefix
+        ) as page_images:
+            return merge_sharded_results(
+                blobs,
+                input_bucket_name,
+                input_object_name,
+                result_bucket_name,
+                result_prefix,
+                output,
+                page_images,
+            )
     shard_count = len(blobs)
     print(f"Merging {len(blobs)} sharded results")
-    merged_document: Dict = {}
-    page_image_names_per_shard: List[str] = [""] * shard_count
-    text_offset = 0
-    shard_index = next_shard_index = 0
-    text = [""] * shard_count
-    for blob in blobs:
-        print(f"Downloading content of blob {blob.name}")
-        content = blob.download_as_bytes()
-        document = json.loads(content)
-        del content
-        print("Extracting images to external files or render from input document")
-        # page_offset is the minimum of the pageNumbers of the current shard but starts at 0 - thus substracting 1
-        page_offset = min(int(page["pageNumber"]) for page in document["pages"]) - 1
-        if "shardInfo" in document:
-            shard_info = document["shardInfo"]
+    with tempfile.TemporaryDirectory() as spool_dir:
+        shards: List[Optional[ShardSpool]] = [None] * shard_count
+        # first value of each top-level field which is neither text nor a list
+        fields: Dict[str, Any] = {}
+        next_shard_index = 0
+        for blob_index, blob in enumerate(blobs):
+            print(f"Streaming content of blob {blob.name}")
+            shard_spool_dir = str(Path(spool_dir, str(blob_index)))
+            Path(shard_spool_dir).mkdir()
+            shard = spool_shard(
+                blob,
+                shard_spool_dir,
+                fields,
+                result_bucket_name,
+                result_prefix,
+                page_images,
+            )
+            shard_info = shard.shard_info
             if "textOffset" in shard_info:
-                text_offset = int(shard_info["textOffset"])
+                shard.text_offset = int(shard_info["textOffset"])
             if "shardCount" in shard_info:
                 if shard_count != int(shard_info["shardCount"]):
                     raise ValueError(
                         f"Shard count mismatch! Current shard_count is {shard_count} shardInfo has {shard_info['shardCount']} and there are {len(blobs)} blobs with shard information"
                     )
-            if "shardIndex" in shard_info:
-                shard_index = int(shard_info["shardIndex"])
-                if shard_index >= shard_count:
-                    raise ValueError(
-                        f"Shard index {shard_index} larger than or equal to shard count {shard_count}"
-                    )
-            else:
-                # auto increment shard_index by one - only works if blobs are in the same order as shard index, which they usually are but not guaranteed
-                next_shard_index = shard_index + 1
-            del document["shardInfo"]
-        print(f"Working on shard_index {shard_index} out of {shard_count} total shards")
-        print("Extracting images from current shard")
-        page_image_names_per_shard[shard_index] = extract_image(
-            document,
-            input_bucket_name,
-            input_object_name,
-            result_bucket_name,
-            result_prefix,
-            page_offset,
+            # without shardIndex, blobs are assumed to be in the same order as the shards, which they usually are but not guaranteed
+            shard_index = int(shard_info.get("shardIndex", next_shard_index))
+            if shard_index >= shard_count:
+                raise ValueError(
+                    f"Shard index {shard_index} larger than or equal to shard count {shard_count}"
+                )
+            if shards[shard_index] is not None:
+                raise ValueError(f"Duplicate shard index {shard_index}")
+            print(
+                f"Spooled shard_index {shard_index} out of {shard_count} total shards"
+            )
+            shards[shard_index] = shard
+            next_shard_index = shard_index + 1
+
+        print("Writing merged document")
+        ordered_shards = [shard for shard in shards if shard is not None]
+        text_offset = 0
+        for shard in ordered_shards:
+            if shard.text_offset is None:
+                shard.text_offset = text_offset
+            text_offset = shard.text_offset + shard.text_length
+        output.write("{")
+        for key, value in fields.items():
+            output.write(f"{json.dumps(key)}: {json.dumps(value)}, ")
+        page_count = 0
+        entity_page_count = 1
+        list_keys = dict.fromkeys(
+            key for shard in ordered_shards for key in shard.list_files
         )
-        print("Remove images from document JSON")
-        for page in document.get("pages", []):
-            if "image" in page:
-                del page["image"]
-        print("Applying page offset to all pageRefs")
-        for entity in document.get("entities", []):
-            page_anchor = entity.get("pageAnchor")
-            if page_anchor:
-                page_refs = page_anchor.get("pageRefs")
-                if page_refs:
-                    for page_ref in page_refs:
-                        page = page_ref.get("page")
-                        if page:
-                            page_ref["page"] = int(page) + page_offset
-                        else:
-                            page_ref["page"] = page_offset
-        print("Applying text offset to all text segments")
-        apply_text_offset(document, text_offset)
-        print("Merging document into merged_document")
-        for key in document.keys():
-            if isinstance(document[key], list):
-                if key in merged_document:
-                    merged_document[key] = merged_document[key] + document[key]
-                else:
-                    merged_document[key] = document[key]
-            elif key == "text":
-                text[shard_index] = document[key]
-            else:
-                if key not in merged_document:
-                    merged_document[key] = document[key]
-        del document
-        gc.collect()
-        print("Memory: ", psutil.virtual_memory())
-        shard_index = next_shard_index
-    # flatten page_image_names_per_shard
+        for key in list_keys:
+            output.write(f"{json.dumps(key)}: [")
+            separator = ""
+            for shard in ordered_shards:
+                # page_offset is the minimum of the pageNumbers of the current shard but starts at 0 - thus substracting 1
+                page_offset = (shard.first_page_number or 1) - 1
+                for item in shard.iter_list_items(key):
+                    if key == "pages":
+                        page_count += 1
+                    elif key == "entities":
+                        apply_page_offset(item, page_offset)
+                        entity_page_count = max(entity_page_count, entity_pages(item))
+                    apply_text_offset(item, shard.text_offset)
+                    output.write(separator + json.dumps(item))
+                    separator = ", "
+            output.write("], ")
+        # join all text entries in shard order, last like in the previous in-memory merge
+        output.write('"text": "')
+        for shard in ordered_shards:
+            if Path(shard.text_file()).exists():
+                with open(shard.text_file(), encoding="utf-8") as text_file:
+                    shutil.copyfileobj(text_file, output)
+        output.write('"}')
     page_image_names = [
-        item for sub_list in page_image_names_per_shard if sub_list for item in sub_list
+        image_name for shard in ordered_shards for image_name in shard.page_image_names
     ]
-    # join all text entries in the right order
-    merged_document["text"] = "".join(text)
-    return merged_document, page_image_names
+    if "pages" not in list_keys:
+        # splitter result may not have pages, only entities
+        page_count = entity_page_count
+    return page_image_names, page_count
+
+
+def apply_page_offset(entity, page_offset):
+    page_anchor = entity.get("pageAnchor")
+    if page_anchor:
+        page_refs = page_anchor.get("pageRefs")
+        if page_refs:
+            for page_ref in page_refs:
+                page = page_ref.get("page")
+                if page:
+                    page_ref["page"] = int(page) + page_offset
+                else:
+                    page_ref["page"] = page_offset
+
+
+def entity_pages(entity) -> int:
+    """Number of pages spanned by the pageRefs of an entity, counting from the first page of the document"""
+    page_count = 1
+    if "pageAnchor" in entity and "pageRefs" in entity["pageAnchor"]:
+        for page_anchor in entity["pageAnchor"]["pageRefs"]:
+            if "page" in page_anchor:
+                # page_anchor starts at page 0
+                page_count = max(page_count, int(page_anchor["page"]) + 1)
+    return page_count
 
 
 def list_results(bucket_name: str, prefix: str) -> List[storage.Blob]:
@@ -288,61 +506,226 @@ def list_results(bucket_name: str, prefix: str) -> List[storage.Blob]:
     return list(blobs)
 
 
+# Rendering and encoding run in worker processes (pdfium is not thread-safe), uploads in threads
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", min(os.cpu_count() or 1, 8)))
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 8))
+# The codec of a page image is chosen by encoding a strip of full resolution tiles sampled
+# along its diagonal, instead of encoding the whole page both ways
+CODEC_SAMPLE_TILES = 3
+CODEC_SAMPLE_TILE_SIZE = 256
+
+# PDF opened once by each render worker process
+worker_pdf: Optional[pdfium.PdfDocument] = None
+
+
+def init_render_worker(input_file: str):
+    global worker_pdf
+    worker_pdf = pdfium.PdfDocument(input_file)
+
+
+def render_worker_page(page_index: int, page_number: int, output_dir: str):
+    return render_page_to_file(worker_pdf, page_index, page_number, output_dir)
+
+
+def render_page_to_file(
+    pdf: pdfium.PdfDocument, page_index: int, page_number: int, output_dir: str
+) -> Tuple[str, str]:
+    """Render a page of the PDF at 150dpi and save it with the codec best suited to its content
+
+    Returns:
+        (image_filename, content_type) of the saved page image
+    """
+    page = pdf[page_index]
+    try:
+        image = page.render(scale=150 / 72).to_pil()  # 150dpi resolution
+    finally:
+        page.close()
+    image.thumbnail((1500, 1500), Image.LANCZOS)
+    print(f"Saving page {page_number}")
+    if is_png_smaller(image):
+        image_filename = str(Path(output_dir, f"page-{page_number:04d}.png"))
+        content_type = "image/png"
+        image.save(image_filename)
+    else:
+        image_filename = str(Path(output_dir, f"page-{page_number:04d}.jpg"))
+        content_type = "image/jpg"
+        image.save(image_filename, optimize=True, quality=95)
+    return image_filename, content_type
+
+
+def is_png_smaller(image: Image.Image) -> bool:
+    """Estimate whether the image is smaller as PNG than as JPEG from a sample of tiles"""
+    tile_size = min(CODEC_SAMPLE_TILE_SIZE, image.width, image.height)
+    sample = Image.new(image.mode, (tile_size * CODEC_SAMPLE_TILES, tile_size))
+    for i in range(CODEC_SAMPLE_TILES):
+        x = (image.width - tile_size) * (2 * i + 1) // (2 * CODEC_SAMPLE_TILES)
+        y = (image.height - tile_size) * (2 * i + 1) // (2 * CODEC_SAMPLE_TILES)
+        sample.paste(
+            image.crop((x, y, x + tile_size, y + tile_size)), (i * tile_size, 0)
+        )
+    png_buffer, jpg_buffer = BytesIO(), BytesIO()
+    sample.save(png_buffer, format="PNG")
+    sample.save(jpg_buffer, format="JPEG", optimize=True, quality=95)
+    return png_buffer.tell() < jpg_buffer.tell()
+
+
+class PdfPageImages:
+    """Page images rendered from the input PDF on demand.
+
+    The input PDF is downloaded and opened on first use, only the requested pages
+    are rendered, and each page image is uploaded once for the life of the invocation.
+    Several pages are rendered in parallel worker processes, each page being uploaded
+    as soon as it is rendered.
+    """
+
+    def __init__(
+        self,
+        input_bucket_name,
+        input_object_name,
+        result_bucket_name,
+        result_prefix,
+        storage_client: Optional[storage.Client] = None,
+    ):
+        self.input_bucket_name = input_bucket_name
+        self.input_object_name = input_object_name
+        self.result_bucket_name = result_bucket_name
+        self.result_prefix = result_prefix
+        self.storage_client = storage_client
+        self.tempdir: Optional[str] = None
+        self.input_file: Optional[str] = None
+        self.pdf: Optional[pdfium.PdfDocument] = None
+        # uploaded image name per (page index in input PDF, page number in result)
+        self.uploaded_images: Dict[Tuple[int, int], str] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_storage_client(self) -> storage.Client:
+        if self.storage_client is None:
+            self.storage_client = storage.Client()
+        return self.storage_client
+
+    def open_pdf(self) -> pdfium.PdfDocument:
+        if self.pdf is None:
+            self.tempdir = tempfile.mkdtemp()
+            _, self.input_file = tempfile.mkstemp(dir=self.tempdir)
+            input_bucket = self.get_storage_client().get_bucket(self.input_bucket_name)
+            input_object = input_bucket.get_blob(self.input_object_name)
+            print(f"Downloading input document {self.input_object_name}")
+            input_object.download_to_filename(self.input_file)
+            self.pdf = pdfium.PdfDocument(self.input_file)
+        return self.pdf
+
+    def page_count(self) -> int:
+        return len(self.open_pdf())
+
+    def page_image_name(self, page_index: int, page_number: int) -> str:
+        """Render a page of the input PDF, upload it and return the image name
+
+        Args:
+            page_index (int): index of the page in the input PDF (starts at 0)
+            page_number (int): page number used to name the image (starts at 1)
+
+        Returns:
+            image_name (str): name of the uploaded image, relative to result_prefix
+        """
+        return self.page_image_names([(page_index, page_number)])[0]
+
+    def page_image_names(self, pages: List[Tuple[int, int]]) -> List[str]:
+        """Render pages of the input PDF, upload them and return the image names
+
+        Args:
+            pages (list[tuple[int, int]]): (page_index, page_number) of each page, see page_image_name()
+
+        Returns:
+            image_names (list[str]): name of the uploaded image of each page, in the same order
+        """
+        pending = [
+            key for key in dict.fromkeys(pages) if key not in self.uploaded_images
+        ]
+        if pending:
+            self.render_and_upload(pending)
+        return [self.uploaded_images[key] for key in pages]
+
+    def render_and_upload(self, pages: List[Tuple[int, int]]):
+        pdf = self.open_pdf()
+        # set by open_pdf() until close()
+        assert self.tempdir is not None and self.input_file is not None
+        tempdir, input_file = self.tempdir, self.input_file
+        workers = min(RENDER_WORKERS, len(pages))
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as upload_executor:
+            uploads = {}
+            if workers <= 1:
+                for key in pages:
+                    image_file = render_page_to_file(pdf, *key, tempdir)
+                    uploads[key] = upload_executor.submit(self.upload, *image_file)
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=init_render_worker,
+                    initargs=(input_file,),
+                ) as render_executor:
+                    renders = {
+                        render_executor.submit(render_worker_page, *key, tempdir): key
+                        for key in pages
+                    }
+                    # upload each page as soon as it is rendered
+                    for render in as_completed(renders):
+                        uploads[renders[render]] = upload_executor.submit(
+                            self.upload, *render.result()
+                        )
+            for key, upload in uploads.items():
+                self.uploaded_images[key] = upload.result()
+
+    def upload(self, image_filename: str, content_type: str) -> str:
+        image_blob_uri = f"gs://{self.result_bucket_name}/{Path(self.result_prefix,Path(image_filename).name)}"
+        image_blob = storage.Blob.from_string(
+            uri=image_blob_uri, client=self.get_storage_client()
+        )
+        image_blob.cache_control = "private,max-age=604800"
+        print(f"Uploading file {image_filename} to {image_blob_uri}")
+        image_blob.upload_from_filename(image_filename, content_type=content_type)
+        Path(image_filename).unlink()
+        return Path(image_filename).name
+
+    def close(self):
+        if self.pdf is not None:
+            self.pdf.close()
+            self.pdf = None
+        if self.tempdir is not None:
+            print("Deleting temporary directory")
+            shutil.rmtree(self.tempdir, ignore_errors=True)
+            self.tempdir = None
+
+
 def render_pdf_to_image(
     input_bucket_name,
     input_object_name,
     result_bucket_name,
     result_prefix,
     page_offset=None,
+    page_images: Optional[PdfPageImages] = None,
 ):
-    page_image_names = []
-    # create a temp folder based on temp_local_filename
-    # use ghostscript to export the pdf into pages as pngs in the temp dir
-    tempdir = tempfile.mkdtemp()
-    _, input_file = tempfile.mkstemp(dir=tempdir)
-    storage_client = storage.Client()
-    input_bucket = storage_client.get_bucket(input_bucket_name)
-    input_object = input_bucket.get_blob(input_object_name)
-    input_object.download_to_filename(input_file)
-    # render images using pypdfium2
-    pdf = pdfium.PdfDocument(input_file)
-    n_pages = len(pdf)
-    page_indices = [i for i in range(n_pages)]
-    renderer = pdf.render(
-        pdfium.PdfBitmap.to_pil,
-        page_indices=page_indices,
-        scale=150 / 72,  # 150dpi resolution
-    )
+    if page_images is None:
+        with PdfPageImages(
+            input_bucket_name, input_object_name, result_bucket_name, result_prefix
+        ) as page_images:
+            return render_pdf_to_image(
+                input_bucket_name,
+                input_object_name,
+                result_bucket_name,
+                result_prefix,
+                page_offset,
+                page_images,
+            )
     if page_offset is None:
         page_offset = 0
-    for i, image in zip(page_indices, renderer):
-        page_number = i + page_offset + 1
-        png_file_name = str(Path(tempdir, f"page-{page_number:04d}.png"))
-        jpg_file_name = str(Path(tempdir, f"page-{page_number:04d}.jpg"))
-        image.thumbnail((1500, 1500), Image.LANCZOS)
-        print(f"Saving page {page_number}")
-        image.save(png_file_name)
-        image.save(jpg_file_name, optimize=True, quality=95)
-        # compare filesize between png and jpg and only upload the smaller file
-        if Path(png_file_name).stat().st_size < Path(jpg_file_name).stat().st_size:
-            image_filename = png_file_name
-            content_type = "image/png"
-            Path(jpg_file_name).unlink()
-        else:
-            image_filename = jpg_file_name
-            content_type = "image/jpg"
-            Path(png_file_name).unlink()
-        page_image_names.append(Path(image_filename).name)
-        image_blob_uri = (
-            f"gs://{result_bucket_name}/{Path(result_prefix,Path(image_filename).name)}"
-        )
-        image_blob = storage.Blob.from_string(uri=image_blob_uri, client=storage_client)
-        image_blob.cache_control = "private,max-age=604800"
-        print(f"Uploading file {image_filename} to {image_blob_uri}")
-        image_blob.upload_from_filename(image_filename, content_type=content_type)
-    print("Deleting temporary directory")
-    shutil.rmtree(tempdir, ignore_errors=True)
-    return page_image_names
+    return page_images.page_image_names(
+        [(i, i + page_offset + 1) for i in range(page_images.page_count())]
+    )
 
 
 def extract_image(
@@ -352,32 +735,64 @@ def extract_image(
     result_bucket_name,
     result_prefix,
     page_offset=0,
+    page_images: Optional[PdfPageImages] = None,
 ):
-    page_image_names = []
-    for page in document["pages"]:
-        if "image" in page and "content" in page["image"]:
-            if "mimeType" in page["image"]:
-                extension = mimetypes.guess_extension(page["image"]["mimeType"])
-            else:
-                extension = ".png"
-            storage_client = storage.Client()
-            image_filename = f"page-{int(page['pageNumber']):03d}{extension}"
-            page_image_names.append(image_filename)
-            page_blob_url = f"gs://{result_bucket_name}/{Path(result_prefix,Path(image_filename).name)}"
-            page_blob = storage.Blob.from_string(
-                uri=page_blob_url, client=storage_client
-            )
-            page_blob.cache_control = "private,max-age=604800"
-            page_blob.upload_from_string(
-                base64.b64decode(page["image"]["content"]),
-                content_type=mimetypes.types_map[extension],
-            )
-        else:
-            page_image_names = page_image_names + render_pdf_to_image(
-                input_bucket_name=input_bucket_name,
-                input_object_name=input_object_name,
-                result_bucket_name=result_bucket_name,
-                result_prefix=result_prefix,
-                page_offset=page_offset,
+    if page_images is None:
+        with PdfPageImages(
+            input_bucket_name, input_object_name, result_bucket_name, result_prefix
+        ) as page_images:
+            return extract_image(
+                document,
+                input_bucket_name,
+                input_object_name,
+                result_bucket_name,
+                result_prefix,
+                page_offset,
+                page_images,
             )
+    page_image_names: List[str] = []
+    # pages without an image, rendered together from the input PDF after the loop
+    missing_pages: Dict[int, Tuple[int, int]] = {}
+    storage_client = page_images.get_storage_client()
+    for i, page in enumerate(document["pages"]):
+        page_number = int(page.get("pageNumber", page_offset + i + 1))
+        image_name = upload_page_image(
+            page, page_number, result_bucket_name, result_prefix, storage_client
+        )
+        if image_name is None:
+            # render only this page from the input PDF (pageNumber starts at 1)
+            missing_pages[len(page_image_names)] = (page_number - 1, page_number)
+            image_name = ""
+        page_image_names.append(image_name)
+    if missing_pages:
+        rendered_names = page_images.page_image_names(list(missing_pages.values()))
+        for position, image_name in zip(missing_pages.keys(), rendered_names):
+            page_image_names[position] = image_name
     return page_image_names
+
+
+def upload_page_image(
+    page, page_number, result_bucket_name, result_prefix, storage_client
+) -> Optional[str]:
+    """Upload the image of a page to the result location
+
+    Returns:
+        image_name (str): name of the uploaded image, None if the page has no image
+    """
+    if "image" not in page or "content" not in page["image"]:
+        return None
+    if "mimeType" in page["image"]:
+        extension = mimetypes.guess_extension(page["image"]["mimeType"])
+    else:
+        extension = ".png"
+    image_filename = f"page-{page_number:03d}{extension}"
+    page_blob_url = (
+        f"gs://{result_bucket_name}/{Path(result_prefix,Path(image_filename).name)}"
+    )
+    page_blob = storage.Blob.from_string(uri=page_blob_url, client=storage_client)
+    page_blob.cache_control = "private,max-age=604800"
+    page_blob.upload_from_string(
+        base64.b64decode(page["image"]["content"]),
+        content_type=mimetypes.types_map[extension],
+    )
+    return image_filename
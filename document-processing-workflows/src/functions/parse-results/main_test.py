@@ -0,0 +1,399 @@
+# Copyright 2024 Google LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests for merging sharded batchProcess results and rendering page images"""
+
+import base64
+from io import BytesIO
+from io import StringIO
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from typing import Dict, List
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from PIL import Image
+from PIL import ImageDraw
+
+import main
+
+RESULT_BUCKET = "result-bucket"
+RESULT_PREFIX = "result/prefix"
+PAGE_IMAGE = base64.b64encode(b"\x89PNG image data").decode()
+
+
+class FakeBlob:
+    """Result blob read from memory"""
+
+    def __init__(self, name: str, document: Dict):
+        self.name = name
+        self.content = json.dumps(document).encode()
+
+    def open(self, mode: str = "rb"):
+        return BytesIO(self.content)
+
+
+def make_shards(
+    shard_count: int, pages_per_shard: int, tokens_per_page: int, seed: int = 0
+) -> List[Dict]:
+    """Builds the shards of a batchProcess result, with page images on even pages
+    and entities anchored to the text and pages of their shard."""
+    rng = random.Random(seed)
+    shards = []
+    text_offset = 0
+    for shard_index in range(shard_count):
+        words = [
+            rng.choice(["lorem", "ipsum", 'd"olor', "s\\it", "amét", "été"])
+            for _ in range(pages_per_shard * tokens_per_page)
+        ]
+        text = "\n".join(words)
+        first_page_number = shard_index * pages_per_shard + 1
+        pages = []
+        for page in range(pages_per_shard):
+            tokens = [
+                {
+                    "layout": {
+                        "textAnchor": {
+                            "textSegments": [{"startIndex": "0", "endIndex": "5"}]
+                        },
+                        "confidence": round(rng.random(), 6),
+                    }
+                }
+                for _ in range(tokens_per_page)
+            ]
+            page_json = {"pageNumber": first_page_number + page, "tokens": tokens}
+            if page % 2 == 0:
+                page_json["image"] = {"mimeType": "image/png", "content": PAGE_IMAGE}
+            pages.append(page_json)
+        entities = [
+            {
+                "type": f"type_{page % 3}",
+                "mentionText": words[page],
+                "confidence": round(rng.random(), 6),
+                "textAnchor": {
+                    "textSegments": [{"startIndex": str(page), "endIndex": "9"}]
+                },
+                "pageAnchor": {"pageRefs": [{"page": str(page)} if page else {}]},
+            }
+            for page in range(pages_per_shard)
+        ]
+        shards.append(
+            {
+                "mimeType": "application/pdf",
+                "text": text,
+                "pages": pages,
+                "entities": entities,
+                "shardInfo": {
+                    "shardIndex": str(shard_index),
+                    "shardCount": str(shard_count),
+                    "textOffset": str(text_offset),
+                },
+            }
+        )
+        text_offset += len(text)
+    return shards
+
+
+def baseline_merge(shards: List[Dict]) -> Dict:
+    """The previous in-memory merge of shards given in shard order, without the
+    image extraction."""
+    merged_document: Dict = {}
+    text = []
+    for shard in shards:
+        document = json.loads(json.dumps(shard))
+        page_offset = min(int(page["pageNumber"]) for page in document["pages"]) - 1
+        text_offset = int(document.pop("shardInfo")["textOffset"])
+        for page in document["pages"]:
+            page.pop("image", None)
+        for entity in document["entities"]:
+            main.apply_page_offset(entity, page_offset)
+        main.apply_text_offset(document, text_offset)
+        for key, value in document.items():
+            if isinstance(value, list):
+                merged_document[key] = merged_document.get(key, []) + value
+            elif key == "text":
+                text.append(value)
+            elif key not in merged_document:
+                merged_document[key] = value
+    merged_document["text"] = "".join(text)
+    return merged_document
+
+
+def rendered_page_names(pages):
+    return [f"page-{page_number:03d}.png" for _, page_number in pages]
+
+
+class TestMergeShardedResults(unittest.TestCase):
+    """Tests for merge_sharded_results"""
+
+    def setUp(self):
+        patcher = patch.object(main.storage.Blob, "from_string")
+        self.blob_from_string = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.page_images = MagicMock()
+        self.page_images.page_image_names.side_effect = rendered_page_names
+
+    def merge(self, shards: List[Dict]):
+        blobs = [
+            FakeBlob(f"{RESULT_PREFIX}/doc-{index}.json", shard)
+            for index, shard in enumerate(shards)
+        ]
+        output = StringIO()
+        page_image_names, page_count = main.merge_sharded_results(
+            blobs,
+            "input-bucket",
+            "input.pdf",
+            RESULT_BUCKET,
+            RESULT_PREFIX,
+            output,
+            self.page_images,
+        )
+        return output.getvalue(), page_image_names, page_count
+
+    def test_matches_baseline(self):
+        """The merged JSON is byte for byte the previous in-memory merge, whatever
+        the order of the blobs"""
+        shards = make_shards(shard_count=4, pages_per_shard=5, tokens_per_page=20)
+        expected = json.dumps(baseline_merge(shards))
+
+        for order in (
+            shards,
+            shards[::-1],
+            [shards[2], shards[0], shards[3], shards[1]],
+        ):
+            merged, page_image_names, page_count = self.merge(order)
+
+            self.assertEqual(merged, expected)
+            self.assertEqual(page_count, 20)
+            self.assertEqual(
+                page_image_names, [f"page-{page:03d}.png" for page in range(1, 21)]
+            )
+
+    def peak_python_heap(self, shards: List[Dict]) -> int:
+        blobs = [
+            FakeBlob(f"{RESULT_PREFIX}/doc-{index}.json", shard)
+            for index, shard in enumerate(shards)
+        ]
+        with open(os.devnull, "w", encoding="utf-8") as output:
+            tracemalloc.start()
+            try:
+                main.merge_sharded_results(
+                    blobs,
+                    "input-bucket",
+                    "input.pdf",
+                    RESULT_BUCKET,
+                    RESULT_PREFIX,
+                    output,
+                    self.page_images,
+                )
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        return peak
+
+    def test_memory_does_not_grow_with_document(self):
+        """The peak Python heap does not grow with the size of the shards and stays
+        below the size of the document (ijson buffers the events of each read)"""
+        small_shards = make_shards(
+            shard_count=4, pages_per_shard=10, tokens_per_page=200
+        )
+        large_shards = make_shards(
+            shard_count=4, pages_per_shard=40, tokens_per_page=200
+        )
+        large_size = sum(len(json.dumps(shard)) for shard in large_shards)
+
+        small_peak = self.peak_python_heap(small_shards)
+        large_peak = self.peak_python_heap(large_shards)
+
+        self.assertLess(large_peak, small_peak * 1.5)
+        self.assertLess(large_peak, large_size)
+
+
+def make_text_page() -> Image.Image:
+    """Page of flat colors, smaller as PNG"""
+    image = Image.new("RGB", (400, 500), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(40, 460, 20):
+        draw.rectangle((40, y, 360, y + 6), fill="black")
+    return image
+
+
+def make_photo_page() -> Image.Image:
+    """Page of a noisy gradient, smaller as JPEG"""
+    gradient = Image.linear_gradient("L").resize((400, 500)).convert("RGB")
+    noise = Image.merge(
+        "RGB", [Image.effect_noise((400, 500), sigma) for sigma in (40, 50, 60)]
+    )
+    return Image.blend(gradient, noise, 0.3)
+
+
+class FakeStorageClient:
+    """Storage client serving the input PDF from a local file"""
+
+    def __init__(self, input_file: str):
+        self.input_file = input_file
+        self.downloads = 0
+
+    def get_bucket(self, bucket_name: str):
+        return self
+
+    def get_blob(self, blob_name: str):
+        return self
+
+    def download_to_filename(self, filename: str):
+        self.downloads += 1
+        shutil.copyfile(self.input_file, filename)
+
+
+class FakeImageBlob:
+    """Result blob recording the image uploaded to it"""
+
+    def __init__(self, uploads: Dict, lock: threading.Lock, uri: str):
+        self.uploads = uploads
+        self.lock = lock
+        self.uri = uri
+        self.cache_control = None
+
+    def upload_from_filename(self, filename: str, content_type: str):
+        with Image.open(filename) as image:
+            upload = (content_type, image.format, image.size)
+        with self.lock:
+            self.uploads.setdefault(self.uri, []).append(upload)
+
+
+class TestPdfPageImages(unittest.TestCase):
+    """Tests for PdfPageImages"""
+
+    def setUp(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        self.input_file = os.path.join(tempdir, "input.pdf")
+        self.pages = [make_text_page(), make_photo_page(), make_text_page()]
+        self.pages[0].save(self.input_file, save_all=True, append_images=self.pages[1:])
+
+        self.uploads: Dict[str, List] = {}
+        lock = threading.Lock()
+        patcher = patch.object(
+            main.storage.Blob,
+            "from_string",
+            side_effect=lambda uri, client: FakeImageBlob(self.uploads, lock, uri),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def image_uri(self, image_name: str) -> str:
+        return f"gs://{RESULT_BUCKET}/{RESULT_PREFIX}/{image_name}"
+
+    def test_renders_pages_in_worker_processes(self):
+        """Pages rendered by several worker processes are uploaded once each, with
+        the codec best suited to their content, and the temporary files are deleted"""
+        storage_client = FakeStorageClient(self.input_file)
+        render_page_to_file = patch.object(
+            main, "render_page_to_file", wraps=main.render_page_to_file
+        )
+        with patch.object(
+            main, "RENDER_WORKERS", 2
+        ), render_page_to_file as render, main.PdfPageImages(
+            "input-bucket", "input.pdf", RESULT_BUCKET, RESULT_PREFIX, storage_client
+        ) as page_images:
+            image_names = page_images.page_image_names([(0, 1), (1, 2), (2, 3)])
+            tempdir = page_images.tempdir
+            self.assertEqual(
+                os.listdir(tempdir), [os.path.basename(page_images.input_file)]
+            )
+
+        self.assertFalse(os.path.exists(tempdir))
+        # no page was rendered in this process
+        render.assert_not_called()
+        self.assertEqual(storage_client.downloads, 1)
+        self.assertEqual(
+            image_names, ["page-0001.png", "page-0002.jpg", "page-0003.png"]
+        )
+        # 150dpi renders of the 72dpi pages
+        size = (834, 1042)
+        self.assertEqual(
+            self.uploads,
+            {
+                self.image_uri("page-0001.png"): [("image/png", "PNG", size)],
+                self.image_uri("page-0002.jpg"): [("image/jpg", "JPEG", size)],
+                self.image_uri("page-0003.png"): [("image/png", "PNG", size)],
+            },
+        )
+
+    def test_extract_image_renders_each_page_once(self):
+        """Pages without an image are rendered from the input PDF once for the life
+        of the PdfPageImages, however many times they are requested"""
+        storage_client = FakeStorageClient(self.input_file)
+        document = {
+            "pages": [
+                {
+                    "pageNumber": 1,
+                    "image": {"mimeType": "image/png", "content": PAGE_IMAGE},
+                },
+                {"pageNumber": 2},
+                {"pageNumber": 3},
+            ]
+        }
+        render_page_to_file = patch.object(
+            main, "render_page_to_file", wraps=main.render_page_to_file
+        )
+        with patch.object(main, "RENDER_WORKERS", 1), patch.object(
+            main.storage.Blob, "from_string"
+        ) as page_blob, render_page_to_file as render, main.PdfPageImages(
+            "input-bucket", "input.pdf", RESULT_BUCKET, RESULT_PREFIX, storage_client
+        ) as page_images:
+            extracted = [
+                main.extract_image(
+                    document,
+                    "input-bucket",
+                    "input.pdf",
+                    RESULT_BUCKET,
+                    RESULT_PREFIX,
+                    page_images=page_images,
+                )
+                for _ in range(2)
+            ]
+            rendered = main.render_pdf_to_image(
+                "input-bucket",
+                "input.pdf",
+                RESULT_BUCKET,
+                RESULT_PREFIX,
+                page_images=page_images,
+            )
+
+        self.assertEqual(
+            extracted, [["page-001.png", "page-0002.jpg", "page-0003.png"]] * 2
+        )
+        self.assertEqual(rendered, ["page-0001.png", "page-0002.jpg", "page-0003.png"])
+        renders_per_page: Dict[int, int] = {}
+        for call in render.call_args_list:
+            page_index = call.args[1]
+            renders_per_page[page_index] = renders_per_page.get(page_index, 0) + 1
+        self.assertEqual(renders_per_page, {0: 1, 1: 1, 2: 1})
+        self.assertEqual(storage_client.downloads, 1)
+        # the embedded image of page 1 is uploaded on each extraction
+        self.assertEqual(page_blob.return_value.upload_from_string.call_count, 2)
+
+    def test_is_png_smaller(self):
+        """The sampled estimate picks the codec that encodes the whole page smaller"""
+        for image, png_smaller in (
+            (make_text_page(), True),
+            (make_photo_page(), False),
+            (make_photo_page().resize((100, 120)), False),
+        ):
+            png_buffer, jpg_buffer = BytesIO(), BytesIO()
+            image.save(png_buffer, format="PNG")
+            image.save(jpg_buffer, format="JPEG", optimize=True, quality=95)
+
+            self.assertEqual(png_buffer.tell() < jpg_buffer.tell(), png_smaller)
+            self.assertEqual(main.is_png_smaller(image), png_smaller)
+
+
+if __name__ == "__main__":
+    unittest.main()
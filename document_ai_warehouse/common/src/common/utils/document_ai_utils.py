@@ -1,4 +1,3 @@
-import json
 import re
 import time
 from typing import Any, Dict, List, Optional
@@ -225,33 +224,133 @@ class DocumentaiUtils:
         return result
 
 
+def _get_shard_file_index(file: str) -> int:
+    # Shards are written as <name>-<shard_index>.json
+    match = re.search(r"-(\d+)\.json$", file)
+    return int(match.group(1)) if match else 0
+
+
+def _read_document_shard(file: str) -> documentai.Document:
+    bucket_name, prefix = split_uri_2_bucket_prefix(file)
+    blob = storage_client.bucket(bucket_name).blob(prefix)
+    return documentai.Document.from_json(
+        blob.download_as_bytes(), ignore_unknown_fields=True
+    )
+
+
+def _rebase_text_anchors(message, text_offset: int) -> None:
+    """Shifts every TextAnchor nested in a protobuf message by text_offset."""
+    if message.DESCRIPTOR.name == "TextAnchor":
+        for segment in message.text_segments:
+            segment.start_index += text_offset
+            segment.end_index += text_offset
+        return
+    for field, value in message.ListFields():
+        if field.type != field.TYPE_MESSAGE:
+            continue
+        # Singular or repeated message field
+        items = [value] if hasattr(value, "ListFields") else value
+        for item in items:
+            _rebase_text_anchors(item, text_offset)
+
+
+def _offset_entity_pages(entity, page_offset: int) -> None:
+    """Shifts the page references of an entity and its nested properties."""
+    for page_ref in entity.page_anchor.page_refs:
+        page_ref.page += page_offset
+    for prop in entity.properties:
+        _offset_entity_pages(prop, page_offset)
+
+
+def _rebase_shard_anchors(shard_pb, merged_text_length: int) -> None:
+    """Rebases the text anchors and page references of a shard onto the merged document."""
+    text_offset = int(shard_pb.shard_info.text_offset)
+    if not shard_pb.shard_info.shard_count or not text_offset:
+        # textOffset is missing, the shard text follows the text merged so far
+        text_offset = merged_text_length
+    elif text_offset != merged_text_length:
+        Logger.warning(
+            f"merge_json_files - shard {shard_pb.shard_info.shard_index} has text offset "
+            f"{text_offset}, expected {merged_text_length}"
+        )
+    if text_offset:
+        _rebase_text_anchors(shard_pb, text_offset)
+
+    # pageRefs are relative to the pages of the shard they were found in
+    if len(shard_pb.pages) > 0:
+        page_offset = min(page.page_number for page in shard_pb.pages) - 1
+        if page_offset > 0:
+            for entity in shard_pb.entities:
+                _offset_entity_pages(entity, page_offset)
+
+
+def _append_document_shard(
+    merged: Optional[documentai.Document],
+    shard: documentai.Document,
+    text_parts: List[str],
+) -> documentai.Document:
+    shard_pb = documentai.Document.pb(shard)
+    _rebase_shard_anchors(shard_pb, sum(len(text) for text in text_parts))
+
+    text_parts.append(shard_pb.text)
+    if merged is None:
+        # Document level fields (uri, mime_type, ...) are taken from the first shard
+        shard_pb.ClearField("text")
+        shard_pb.ClearField("shard_info")
+        return shard
+    merged_pb = documentai.Document.pb(merged)
+    merged_pb.pages.extend(shard_pb.pages)
+    merged_pb.entities.extend(shard_pb.entities)
+    merged_pb.entity_relations.extend(shard_pb.entity_relations)
+    merged_pb.text_styles.extend(shard_pb.text_styles)
+    merged_pb.revisions.extend(shard_pb.revisions)
+    return merged
+
+
 def merge_json_files(files):
-    """Merges n json files in memory.
+    """Merges the JSON shards of a single Document AI batch output.
+
+    Shards are read one at a time and appended in shardInfo.shardIndex order:
+    pages and entities are concatenated and text anchors are rebased onto the
+    merged text using shardInfo.textOffset, or the length of the text merged
+    so far when it is missing.
 
     Args:
-      files: A list of paths to json files.
+      files: A list of gs:// paths to the json shards of one document.
 
     Returns:
-      A dictionary containing the merged data.
+      The merged documentai.Document.
     """
 
-    result = {}
-    json_list = []
-
-    for file in files:
-        bucket_name, prefix = split_uri_2_bucket_prefix(file)
-        bucket = storage_client.get_bucket(bucket_name)
-        blob = bucket.blob(prefix)
-        json_str = blob.download_as_string()
-        json_list.append(json.loads(json_str.decode("utf8")))
-
-    for d in json_list:
-        result.update(d)
+    merged: Optional[documentai.Document] = None
+    text_parts: List[str] = []
+    # Shards read ahead of their turn, keyed by shard index
+    pending: Dict[int, documentai.Document] = {}
+    next_shard_index = 0
+
+    for file_index, file in enumerate(sorted(files, key=_get_shard_file_index)):
+        shard = _read_document_shard(file)
+        shard_index = int(shard.shard_info.shard_index)
+        if not shard.shard_info.shard_count or shard_index in pending:
+            # No usable shardInfo, rely on the file name order
+            shard_index = file_index
+        pending[shard_index] = shard
+        del shard
+        while next_shard_index in pending:
+            merged = _append_document_shard(
+                merged, pending.pop(next_shard_index), text_parts
+            )
+            next_shard_index += 1
 
-    doc_json = json.dumps(result)
+    # Only happens if the shard indexes are not contiguous
+    for shard_index in sorted(pending):
+        Logger.warning(f"merge_json_files - shard {shard_index} is out of sequence")
+        merged = _append_document_shard(merged, pending.pop(shard_index), text_parts)
 
-    document = documentai.Document.from_json(doc_json, ignore_unknown_fields=True)
-    return document
+    if merged is None:
+        return documentai.Document()
+    merged.text = "".join(text_parts)
+    return merged
 
 
 # Handling Nested labels for CDE processor
@@ -0,0 +1,157 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for merging sharded Document AI batch output"""
+
+from typing import Any, Dict, List, Optional
+import unittest
+from unittest.mock import patch
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import documentai_v1 as documentai
+
+# The logging and storage clients are created on import
+with patch(
+    "google.auth.default", return_value=(AnonymousCredentials(), "test-project")
+):
+    from common.utils import document_ai_utils
+
+
+def make_shard(
+    text: str,
+    first_page_number: int,
+    page_count: int,
+    text_offset: int,
+    shard_index: Optional[int] = None,
+    shard_count: Optional[int] = None,
+) -> documentai.Document:
+    """Builds a shard with one entity per page, each one with a nested
+    property anchored to the same page and to the whole shard text."""
+    entities = []
+    for page in range(page_count):
+        anchor = {
+            "text_anchor": {
+                "text_segments": [{"start_index": 0, "end_index": len(text)}]
+            },
+            "page_anchor": {"page_refs": [{"page": page}]},
+        }
+        entities.append(
+            {
+                "type_": "parent",
+                **anchor,
+                "properties": [{"type_": "child", **anchor}],
+            }
+        )
+    shard: Dict[str, Any] = {
+        "text": text,
+        "pages": [
+            {"page_number": first_page_number + page} for page in range(page_count)
+        ],
+        "entities": entities,
+    }
+    if shard_count is not None:
+        shard["shard_info"] = {
+            "shard_index": shard_index,
+            "shard_count": shard_count,
+            "text_offset": text_offset,
+        }
+    return documentai.Document(shard)
+
+
+def entity_pages(entities) -> List[List[int]]:
+    """Page references of each entity followed by those of its properties"""
+    return [
+        [int(page_ref.page) for page_ref in entity.page_anchor.page_refs]
+        + [
+            int(page_ref.page)
+            for prop in entity.properties
+            for page_ref in prop.page_anchor.page_refs
+        ]
+        for entity in entities
+    ]
+
+
+class TestMergeJsonFiles(unittest.TestCase):
+    """Tests for merge_json_files"""
+
+    def merge(self, shards: Dict[str, documentai.Document]) -> documentai.Document:
+        with patch.object(
+            document_ai_utils, "_read_document_shard", side_effect=shards.get
+        ):
+            return document_ai_utils.merge_json_files(list(shards))
+
+    def test_out_of_order_shards(self):
+        """Shards are merged by shard index, with text anchors and page
+        references of entities and their properties rebased"""
+        merged = self.merge(
+            {
+                "gs://bucket/out/doc-2.json": make_shard("ghi", 5, 2, 6, 2, 3),
+                "gs://bucket/out/doc-0.json": make_shard("abc", 1, 2, 0, 0, 3),
+                "gs://bucket/out/doc-1.json": make_shard("def", 3, 2, 3, 1, 3),
+            }
+        )
+
+        self.assertEqual(merged.text, "abcdefghi")
+        self.assertEqual(
+            [page.page_number for page in merged.pages], [1, 2, 3, 4, 5, 6]
+        )
+        self.assertEqual(
+            entity_pages(merged.entities),
+            [[0, 0], [1, 1], [2, 2], [3, 3], [4, 4], [5, 5]],
+        )
+        for entity in merged.entities:
+            segment = entity.text_anchor.text_segments[0]
+            prop_segment = entity.properties[0].text_anchor.text_segments[0]
+            self.assertEqual(prop_segment.start_index, segment.start_index)
+        self.assertEqual(
+            [
+                merged.text[segment.start_index : segment.end_index]
+                for segment in (
+                    entity.text_anchor.text_segments[0]
+                    for entity in merged.entities[::2]
+                )
+            ],
+            ["abc", "def", "ghi"],
+        )
+
+    def test_missing_shard_info(self):
+        """Without shardInfo, shards are merged in file name order"""
+        merged = self.merge(
+            {
+                "gs://bucket/out/doc-10.json": make_shard("ccc", 3, 1, 0),
+                "gs://bucket/out/doc-0.json": make_shard("aaa", 1, 1, 0),
+                "gs://bucket/out/doc-2.json": make_shard("bbb", 2, 1, 0),
+            }
+        )
+
+        self.assertEqual(merged.text, "aaabbbccc")
+        self.assertEqual(entity_pages(merged.entities), [[0, 0], [1, 1], [2, 2]])
+        # Text anchors are rebased by the length of the preceding shards
+        self.assertEqual(
+            [
+                merged.text[segment.start_index : segment.end_index]
+                for segment in (
+                    entity.text_anchor.text_segments[0] for entity in merged.entities
+                )
+            ],
+            ["aaa", "bbb", "ccc"],
+        )
+
+    def test_no_shards(self):
+        """An empty list of files gives an empty document"""
+        self.assertEqual(self.merge({}), documentai.Document())
+
+
+if __name__ == "__main__":
+    unittest.main()
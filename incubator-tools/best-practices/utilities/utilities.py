@@ -4,23 +4,69 @@ Google Cloud's DocumentAI."""
 
 # Import the libraries
 import difflib
+from functools import lru_cache
 import io
 import json
-import operator
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import zlib
 
 from google.api_core.client_options import ClientOptions
 from google.cloud import documentai_v1beta3 as documentai
 from google.cloud import storage
 from google.cloud.exceptions import Conflict
 from google.cloud.exceptions import NotFound
+import numpy as np
 from pandas import DataFrame
 import pandas as pd
 from PIL import Image
+from PIL import PdfParser
 
 pd.options.mode.chained_assignment = None  # default='warn'
 
+# Minimum IOU for two entities of the same type to be considered a match
+IOU_MATCH_THRESHOLD = 0.2
+
+
+@lru_cache(maxsize=None)
+def get_storage_client(project_id: Optional[str] = None) -> storage.Client:
+    """
+    Returns a Cloud Storage client shared by every helper in this module.
+
+    Clients are created once per project, so credentials are resolved and the
+    HTTP session is opened only on the first call.
+
+    Args:
+        project_id (Optional[str]): The project of the client, the default
+            project of the environment if not set.
+
+    Returns:
+        storage.Client: The shared client.
+    """
+    if project_id is None:
+        return storage.Client()
+    return storage.Client(project=project_id)
+
+
+@lru_cache(maxsize=None)
+def get_documentai_client(location: str) -> documentai.DocumentProcessorServiceClient:
+    """
+    Returns a Document AI client shared by every helper in this module.
+
+    Clients are created once per location, since each location has its own
+    endpoint.
+
+    Args:
+        location (str): The location of the processor, e.g. "us" or "eu".
+
+    Returns:
+        documentai.DocumentProcessorServiceClient: The shared client.
+    """
+    # You must set the `api_endpoint` if you use a location other than "us".
+    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+    return documentai.DocumentProcessorServiceClient(client_options=opts)
+
 
 def file_names(gs_file_path: str) -> Tuple[List[str], Dict[str, str]]:
     """
@@ -41,7 +87,7 @@ def file_names(gs_file_path: str) -> Tuple[List[str], Dict[str, str]]:
     file_names_list = []
     file_dict = {}
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     source_bucket = storage_client.get_bucket(bucket)
 
     filenames = [
@@ -73,7 +119,7 @@ def check_create_bucket(bucket_name: str) -> storage.bucket.Bucket:
         The bucket object corresponding to the provided bucket name.
     """
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     try:
         bucket = storage_client.get_bucket(bucket_name)
         print(f"Bucket {bucket_name} already exists.")
@@ -100,7 +146,7 @@ def bucket_delete(bucket_name: str) -> None:
 
     print("Deleting bucket:", bucket_name)
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     try:
         bucket = storage_client.get_bucket(bucket_name)
         bucket.delete(force=True)
@@ -120,7 +166,7 @@ def list_blobs(bucket_name: str) -> List[str]:
     """
 
     blob_list = []
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     blobs = storage_client.list_blobs(bucket_name)
 
     for blob in blobs:
@@ -190,7 +236,7 @@ def documentai_json_proto_downloader(
         documentai.Document: A DocumentAI Document proto representation of the downloaded JSON.
     """
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name_with_prefix_path)
 
@@ -217,16 +263,14 @@ def copy_blob(
     Output:
         None. The blob is copied to the destination bucket with the specified name.
     """
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     source_bucket = storage_client.bucket(bucket_name)
     source_blob = source_bucket.blob(blob_name)
     destination_bucket = storage_client.bucket(destination_bucket_name)
     source_bucket.copy_blob(source_blob, destination_bucket, destination_blob_name)
 
 
-def get_entity_metadata(
-    df: pd.DataFrame, entity: documentai.Document.Entity
-) -> pd.DataFrame:
+def get_entity_row(entity: documentai.Document.Entity) -> List[Any]:
     """
     Parse the entity to extract bounding boxes,
     entity type, text and page number.
@@ -235,12 +279,8 @@ def get_entity_metadata(
         entity: Document AI entity object
 
     Returns:
-        pandas.DataFrame: A DataFrame representation of the JSON with columns
-                          ['type_', 'mention_text', 'bbox', 'page'].
-                          'type_' column indicates the type of entity.
-                          'mention_text' column contains the text of the entity or its property.
-                          'bbox' column contains bounding box coordinates.
-                          'page' column indicates the page number where the entity is found.
+        List: The values of the entity for the columns
+              ['type_', 'mention_text', 'bbox', 'page'] of json_to_dataframe().
     """
 
     bbox = []
@@ -259,12 +299,36 @@ def get_entity_metadata(
         round(max(x1), 8),
         round(max(y1), 8),
     ]
-    df.loc[len(df.index)] = [
+    return [
         entity.type_,
         entity.mention_text,
         bbox,
         page,
     ]
+
+
+def get_entity_metadata(
+    df: pd.DataFrame, entity: documentai.Document.Entity
+) -> pd.DataFrame:
+    """
+    Parse the entity to extract bounding boxes,
+    entity type, text and page number.
+
+    Appends a single row, use json_to_dataframe() to convert all the entities of a document.
+
+    Args:
+        entity: Document AI entity object
+
+    Returns:
+        pandas.DataFrame: A DataFrame representation of the JSON with columns
+                          ['type_', 'mention_text', 'bbox', 'page'].
+                          'type_' column indicates the type of entity.
+                          'mention_text' column contains the text of the entity or its property.
+                          'bbox' column contains bounding box coordinates.
+                          'page' column indicates the page number where the entity is found.
+    """
+
+    df.loc[len(df.index)] = get_entity_row(entity)
     return df
 
 
@@ -284,7 +348,9 @@ def json_to_dataframe(data: documentai.Document) -> pd.DataFrame:
                           'page' column indicates the page number where the entity is found.
     """
 
-    df = pd.DataFrame(columns=["type_", "mention_text", "bbox", "page"])
+    columns = ["type_", "mention_text", "bbox", "page"]
+    # rows are collected first and the DataFrame built once
+    rows: List[List[Any]] = []
 
     try:
         for entity in data.entities:
@@ -296,7 +362,7 @@ def json_to_dataframe(data: documentai.Document) -> pd.DataFrame:
                 for subentity in entity.properties:
                     has_properties = True  # Mark that we found properties
                     try:
-                        df = get_entity_metadata(df, subentity)
+                        rows.append(get_entity_row(subentity))
                     except (AttributeError, Exception) as e:
                         print(e)
                         continue
@@ -308,15 +374,17 @@ def json_to_dataframe(data: documentai.Document) -> pd.DataFrame:
             # If no properties were found for the entity, add it to the dataframe
             if not has_properties:
                 try:
-                    df = get_entity_metadata(df, entity)
+                    rows.append(get_entity_row(entity))
                 except (AttributeError, Exception) as e:
                     print(f"Exception encountered: {e}")
                     continue
 
-        return df
     except (AttributeError, Exception) as e:
         print(f"Exception encountered: {e}")
-        return df
+
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(rows, columns=columns)
 
 
 def blob_downloader(bucket_name: str, blob_name: str) -> Dict:
@@ -331,7 +399,7 @@ def blob_downloader(bucket_name: str, blob_name: str) -> Dict:
     Returns:
         dict: A dictionary representation of the downloaded JSON file.
     """
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
 
@@ -403,7 +471,7 @@ def find_match(
         that computes the IOU.
     """
 
-    bbox_file1 = entity_file1[2]
+    bbox_file1: Any = entity_file1[2]
 
     # Entity not present in json file
     if not bbox_file1:
@@ -411,22 +479,16 @@ def find_match(
 
     # Filtering entities with the same name
     df_file2 = df_file2[df_file2["type_"] == entity_file1[0]]
-
-    # Calculating IOU values for the entities
-    index_iou_pairs = []
-    for index, entity_file2 in df_file2.iterrows():
-        if entity_file2["bbox"]:
-            iou = bb_intersection_over_union(bbox_file1, entity_file2["bbox"])
-            index_iou_pairs.append((index, iou))
+    df_file2 = df_file2[[bool(bbox) for bbox in df_file2["bbox"]]]
+    if df_file2.empty:
+        return None
 
     # Choose entity with highest IOU, IOU should be at least > 0.2
-    matched_index = None
-    for index_iou in sorted(index_iou_pairs, key=operator.itemgetter(1), reverse=True):
-        if index_iou[1] > 0.2:  # Threshold
-            matched_index = index_iou[0]
-            break
-
-    return matched_index
+    ious = bb_intersection_over_union_matrix([bbox_file1], list(df_file2["bbox"]))[0]
+    best = int(np.argmax(ious))
+    if ious[best] > IOU_MATCH_THRESHOLD:
+        return df_file2.index[best]
+    return None
 
 
 def bb_intersection_over_union(box1: Any, box2: List[float]) -> float:
@@ -472,6 +534,91 @@ def bb_intersection_over_union(box1: Any, box2: List[float]) -> float:
     return iou
 
 
+def bb_intersection_over_union_matrix(
+    boxes1: Sequence[Sequence[float]], boxes2: Sequence[Sequence[float]]
+) -> np.ndarray:
+    """
+    Calculates the Intersection Over Union (IOU) between every pair of bounding boxes
+    from two lists, using the same formula as `bb_intersection_over_union`.
+
+    Args:
+        boxes1 (list[list[float]]): N bounding boxes as [x_min, y_min, x_max, y_max].
+        boxes2 (list[list[float]]): M bounding boxes as [x_min, y_min, x_max, y_max].
+
+    Returns:
+        numpy.ndarray: An N x M array where element [i, j] is the IOU
+        between boxes1[i] and boxes2[j].
+    """
+
+    array1 = np.asarray(boxes1, dtype=float).reshape(-1, 4)
+    array2 = np.asarray(boxes2, dtype=float).reshape(-1, 4)
+
+    # Coordinates of the intersection rectangles
+    x1 = np.maximum(array1[:, None, 0], array2[None, :, 0])
+    y1 = np.maximum(array1[:, None, 1], array2[None, :, 1])
+    x2 = np.minimum(array1[:, None, 2], array2[None, :, 2])
+    y2 = np.minimum(array1[:, None, 3], array2[None, :, 3])
+    inter_area = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+
+    box1_area = (array1[:, 2] - array1[:, 0]) * (array1[:, 3] - array1[:, 1])
+    box2_area = (array2[:, 2] - array2[:, 0]) * (array2[:, 3] - array2[:, 1])
+    union_area = box1_area[:, None] + box2_area[None, :] - inter_area
+
+    # If there's no intersection, IOU is 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(inter_area > 0, inter_area / union_area, 0.0)
+
+
+def match_entities_by_iou(
+    df_file1: pd.DataFrame,
+    df_file2: pd.DataFrame,
+    threshold: float = IOU_MATCH_THRESHOLD,
+) -> List[Optional[Any]]:
+    """
+    Matches the entities of `df_file1` to entities of the same type in `df_file2`
+    based on the IOU of their bounding boxes.
+
+    Rows of `df_file1` are matched in order, each one to the not yet matched entity
+    of `df_file2` with the highest IOU above `threshold`. This gives the same result
+    as calling `find_match` row by row and dropping every matched row from
+    `df_file2`, but computes the IOUs of each entity type in a single matrix.
+
+    Args:
+        df_file1 (pandas.DataFrame): Entities of the first file, as returned
+        by `json_to_dataframe`.
+        df_file2 (pandas.DataFrame): Entities of the second file, as returned
+        by `json_to_dataframe`.
+        threshold (float): IOU a match has to exceed.
+
+    Returns:
+        list: For every row of `df_file1`, the index of the matching entity
+        in `df_file2`, or None if there is no match.
+    """
+
+    matches: List[Optional[Any]] = [None] * len(df_file1.index)
+    types1 = df_file1["type_"].to_numpy()
+    types2 = df_file2["type_"].to_numpy()
+    bboxes1 = list(df_file1["bbox"])
+    bboxes2 = list(df_file2["bbox"])
+
+    for entity_type in pd.unique(types1):
+        rows = [i for i in np.flatnonzero(types1 == entity_type) if bboxes1[i]]
+        cols = [j for j in np.flatnonzero(types2 == entity_type) if bboxes2[j]]
+        if not rows or not cols:
+            continue
+        ious = bb_intersection_over_union_matrix(
+            [bboxes1[i] for i in rows], [bboxes2[j] for j in cols]
+        )
+        # Matched entities of df_file2 are masked out for the following rows
+        for row_position, row in enumerate(rows):
+            best = int(np.argmax(ious[row_position]))
+            if ious[row_position, best] > threshold:
+                matches[row] = df_file2.index[cols[best]]
+                ious[:, best] = -1
+
+    return matches
+
+
 def get_match_ratio(values: List[str]) -> float:
     """
     Calculates the similarity ratio between two strings using SequenceMatcher.
@@ -511,21 +658,88 @@ def compare_pre_hitl_and_post_hitl_output(
                                 comparison,and the second element is a float representing
                                 the score.
     """
+    not_found_string = "Entity not found."
     df_file1 = json_to_dataframe(file1)
     df_file2 = json_to_dataframe(file2)
-    file1_entities = [entity[0] for entity in df_file1.values]
-    file2_entities = [entity[0] for entity in df_file2.values]
+    file1_counts = df_file1["type_"].value_counts()
+    file2_counts = df_file2["type_"].value_counts()
 
     # find entities which are present only once in both files
     # these entities will be matched directly
-    common_entities = set(file1_entities).intersection(set(file2_entities))
-    exclude_entities = []
+    common_entities = [
+        entity
+        for entity in pd.unique(df_file1["type_"])
+        if file1_counts[entity] == 1 and file2_counts.get(entity, 0) == 1
+    ]
+    common_file1 = df_file1[df_file1["type_"].isin(common_entities)].set_index("type_")
+    common_file2 = df_file2[df_file2["type_"].isin(common_entities)].set_index("type_")
+    compare_rows = []
     for entity in common_entities:
-        if file1_entities.count(entity) > 1 or file2_entities.count(entity) > 1:
-            exclude_entities.append(entity)
-    for entity in exclude_entities:
-        common_entities.remove(entity)
+        row1 = common_file1.loc[entity]
+        row2 = common_file2.loc[entity]
+        compare_rows.append(
+            [
+                entity,
+                row1["mention_text"],
+                row2["mention_text"],
+                row1["bbox"],
+                row2["bbox"],
+                row1["page"],
+                row2["page"],
+            ]
+        )
+    # common entities are removed from df_file1 and df_file2
+    df_file1 = df_file1[~df_file1["type_"].isin(common_entities)]
+    df_file2 = df_file2[~df_file2["type_"].isin(common_entities)]
+
+    # remaining entities are matched comparing the area of IOU across them
+    matched_indexes = match_entities_by_iou(df_file1, df_file2)
+    for row, matched_index in zip(df_file1.itertuples(index=False), matched_indexes):
+        if matched_index is not None:
+            match = df_file2.loc[matched_index]
+            compare_rows.append(
+                [
+                    row.type_,
+                    row.mention_text,
+                    match["mention_text"],
+                    row.bbox,
+                    match["bbox"],
+                    row.page,
+                    match["page"],
+                ]
+            )
+        else:
+            compare_rows.append(
+                [
+                    row.type_,
+                    row.mention_text,
+                    not_found_string,
+                    row.bbox,
+                    not_found_string,
+                    row.page,
+                    "no",
+                ]
+            )
+
+    # adding entities which are present in file2 but not in file1
+    df_file2 = df_file2.drop(
+        index=[index for index in matched_indexes if index is not None]
+    )
+    for row in df_file2.itertuples(index=False):
+        compare_rows.append(
+            [
+                row.type_,
+                not_found_string,
+                row.mention_text,
+                "[]",
+                row.bbox,
+                "[]",
+                row.page,
+            ]
+        )
+
     df_compare = pd.DataFrame(
+        compare_rows,
         columns=[
             "Entity Type",
             "Pre_HITL_Output",
@@ -534,108 +748,29 @@ def compare_pre_hitl_and_post_hitl_output(
             "post_bbox",
             "page1",
             "page2",
-        ]
+        ],
+        dtype=object,
     )
-    for entity in common_entities:
-        value1 = df_file1[df_file1["type_"] == entity].iloc[0]["mention_text"]
-        value2 = df_file2[df_file2["type_"] == entity].iloc[0]["mention_text"]
-        pre_bbox = df_file1[df_file1["type_"] == entity].iloc[0]["bbox"]
-        post_bbox = df_file2[df_file2["type_"] == entity].iloc[0]["bbox"]
-        page1 = df_file1[df_file1["type_"] == entity].iloc[0]["page"]
-        page2 = df_file2[df_file2["type_"] == entity].iloc[0]["page"]
-        df_compare.loc[len(df_compare.index)] = [
-            entity,
-            value1,
-            value2,
-            pre_bbox,
-            post_bbox,
-            page1,
-            page2,
-        ]
-        # common entities are removed from df_file1 and df_file2
-        df_file1 = remove_row(df_file1, entity)
-        df_file2 = remove_row(df_file2, entity)
 
-    # remaining entities are matched comparing the area of IOU across them
-    mention_text2 = pd.Series(dtype=str)
-    bbox2 = pd.Series(dtype=object)
-    bbox1 = pd.Series(dtype=object)
-    page_1 = pd.Series(dtype=object)
-    page_2 = pd.Series(dtype=object)
-
-    for index, row in enumerate(df_file1.values):
-        matched_index = find_match(row, df_file2)
-        if matched_index is not None:
-            mention_text2.loc[index] = df_file2.loc[matched_index][1]
-            bbox2.loc[index] = df_file2.loc[matched_index][2]
-            bbox1.loc[index] = row[2]
-            page_2.loc[index] = df_file2.loc[matched_index][3]
-            page_1.loc[index] = row[3]
-            df_file2 = df_file2.drop(matched_index)
-        else:
-            mention_text2.loc[index] = "Entity not found."
-            bbox2.loc[index] = "Entity not found."
-            bbox1.loc[index] = row[2]
-            page_1.loc[index] = row[3]
-            page_2.loc[index] = "no"
-
-    df_file1["mention_text2"] = mention_text2.values
-    df_file1["bbox2"] = bbox2.values
-    df_file1["bbox1"] = bbox1.values
-    df_file1["page_1"] = page_1.values
-    df_file1["page_2"] = page_2.values
-
-    df_file1 = df_file1.drop(["bbox"], axis=1)
-    df_file1 = df_file1.drop(["page"], axis=1)
-    df_file1.rename(
-        columns={
-            "type_": "Entity Type",
-            "mention_text": "Pre_HITL_Output",
-            "mention_text2": "Post_HITL_Output",
-            "bbox1": "pre_bbox",
-            "bbox2": "post_bbox",
-            "page_1": "page1",
-            "page_2": "page2",
-        },
-        inplace=True,
-    )
-    df_compare = df_compare.append(df_file1, ignore_index=True)
-    # adding entities which are present in file2 but not in file1
-    for row in df_file2.values:
-        df_compare.loc[len(df_compare.index)] = [
-            row[0],
-            "Entity not found.",
-            row[1],
-            "[]",
-            row[2],
-            "[]",
-            row[3],
-        ]
-
-    # df_compare['Match'] = df_compare['Ground Truth Text'] == df_compare['Output Text']
     match_array = []
-    for i in range(0, len(df_compare)):
-        match_string = ""
-        not_found_string = "Entity not found."
-        pre_output = df_compare.iloc[i]["Pre_HITL_Output"]
-        post_output = df_compare.iloc[i]["Post_HITL_Output"]
-
+    for pre_output, post_output in zip(
+        df_compare["Pre_HITL_Output"], df_compare["Post_HITL_Output"]
+    ):
         if pre_output == not_found_string and post_output == not_found_string:
             match_string = "TN"
         elif pre_output != not_found_string and post_output == not_found_string:
             match_string = "FN"
         elif pre_output == not_found_string and post_output != not_found_string:
             match_string = "FP"
-        elif pre_output != not_found_string and post_output != not_found_string:
-            match_string = "TP" if pre_output == post_output else "FP"
         else:
-            match_string = "Something went Wrong."
-
+            match_string = "TP" if pre_output == post_output else "FP"
         match_array.append(match_string)
 
     df_compare["Match"] = match_array
 
-    df_compare["Fuzzy Ratio"] = df_compare.apply(get_match_ratio, axis=1)
+    df_compare["Fuzzy Ratio"] = [
+        get_match_ratio(values) for values in df_compare.values.tolist()
+    ]
     if list(df_compare.index):
         score = df_compare["Fuzzy Ratio"].sum() / len(df_compare.index)
     else:
@@ -663,12 +798,8 @@ def get_document_schema(
     Example:
         schema = get_document_schema("eu", "123456", "processor123", "version123")
     """
-    # Choose the endpoint based on the provided location.
-    # You must set the `api_endpoint` if you use a location other than "us".
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-
-    # Initialize the DocumentAI client.
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    # The client is bound to the endpoint of the provided location.
+    client = get_documentai_client(location)
 
     # The full resource name of the processor version
     # e.g.: projects/project_num/locations/location/processors/
@@ -683,56 +814,197 @@ def get_document_schema(
     return response.document_schema
 
 
-def create_pdf_bytes_from_json(gt_json: dict) -> Tuple[bytes, List[Any]]:
+class PageImages(Sequence[Image.Image]):
     """
-    Create PDF bytes from the image content of the ground truth JSON,
-    which will be used for the processing of files.
+    Page images of a document, decoded when accessed rather than all at once.
 
     Args:
-        gt_json (dict): The input JSON data containing image content.
+        image_contents (Sequence[bytes]): The encoded image of each page.
+    """
+
+    def __init__(self, image_contents: Sequence[bytes]):
+        self.image_contents = image_contents
+
+    def __len__(self) -> int:
+        return len(self.image_contents)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return decode_image(self.image_contents[index])
+
+    def __iter__(self) -> Iterator[Image.Image]:
+        for image_content in self.image_contents:
+            yield decode_image(image_content)
+
+
+def decode_image(image_bytes: bytes) -> Image.Image:
+    """
+    Decodes image bytes into a PIL Image object.
+
+    Args:
+        image_bytes (bytes): The encoded image.
 
     Returns:
-        bytes: The output PDF in byte format.
+        Image.Image: The decoded image.
     """
 
-    def decode_image(image_bytes: bytes) -> Image.Image:
-        with io.BytesIO(image_bytes) as image_file:
-            image = Image.open(image_file)
-            image.load()
-        return image
+    with io.BytesIO(image_bytes) as image_file:
+        image = Image.open(image_file)
+        image.load()
+    return image
 
-    def create_pdf_from_images(
-        images: Sequence[Image.Image],
-    ) -> bytes:
-        """Creates a PDF from a sequence of images.
 
-        The PDF will contain 1 page per image, in the same order.
+def write_pdf_image(
+    pdf: PdfParser.PdfParser,
+    image_ref: PdfParser.IndirectReference,
+    image_bytes: bytes,
+) -> Tuple[int, int, str]:
+    """
+    Writes an encoded image as a PDF image object.
 
-        Args:
-          images: A sequence of images.
+    Grayscale and RGB JPEG images are embedded as they are. Bilevel and palette
+    images are compressed losslessly, other images are JPEG encoded like the
+    Pillow PDF writer does.
 
-        Returns:
-          The PDF bytes.
-        """
-        if not images:
-            raise ValueError("At least one image is required to create a PDF")
+    Args:
+        pdf (PdfParser.PdfParser): The PDF being written.
+        image_ref (PdfParser.IndirectReference): Reference of the image object.
+        image_bytes (bytes): The encoded image.
 
-        # PIL PDF saver does not support RGBA images
-        images = [
-            image.convert("RGB") if image.mode == "RGBA" else image for image in images
-        ]
+    Returns:
+        Tuple[int, int, str]: The width and height of the image and its PDF procedure set.
+    """
 
-        with io.BytesIO() as pdf_file:
-            images[0].save(
-                pdf_file, save_all=True, append_images=images[1:], format="PDF"
+    color_space: Union[PdfParser.PdfName, List[Any]]
+    decode: Optional[List[int]] = None
+    with io.BytesIO(image_bytes) as image_file:
+        image: Image.Image = Image.open(image_file)
+        width, height = image.size
+        procset = "ImageB" if image.mode in ("1", "L") else "ImageC"
+        if image.format == "JPEG" and image.mode in ("L", "RGB"):
+            stream = image_bytes
+            decode_filter = "DCTDecode"
+            color_space = PdfParser.PdfName(
+                "DeviceGray" if image.mode == "L" else "DeviceRGB"
             )
-            return pdf_file.getvalue()
+            bits_per_component = 8
+        elif image.mode in ("1", "P"):
+            image.load()
+            stream = zlib.compress(image.tobytes())
+            decode_filter = "FlateDecode"
+            if image.mode == "1":
+                color_space = PdfParser.PdfName("DeviceGray")
+                bits_per_component = 1
+            else:
+                palette = image.getpalette()
+                if palette is None:
+                    raise ValueError("Palette image without a palette")
+                color_space = [
+                    PdfParser.PdfName("Indexed"),
+                    PdfParser.PdfName("DeviceRGB"),
+                    len(palette) // 3 - 1,
+                    PdfParser.PdfBinary(bytes(palette)),
+                ]
+                procset = "ImageI"
+                bits_per_component = 8
+        else:
+            # PIL PDF saver does not support RGBA images
+            if image.mode not in ("L", "RGB", "CMYK"):
+                image = image.convert("RGB")
+                procset = "ImageC"
+            with io.BytesIO() as jpeg_file:
+                image.save(jpeg_file, format="JPEG")
+                stream = jpeg_file.getvalue()
+            decode_filter = "DCTDecode"
+            color_space = PdfParser.PdfName(
+                {"L": "DeviceGray", "RGB": "DeviceRGB"}.get(image.mode, "DeviceCMYK")
+            )
+            if image.mode == "CMYK":
+                decode = [1, 0, 1, 0, 1, 0, 1, 0]
+            bits_per_component = 8
+
+    pdf.write_obj(
+        image_ref,
+        stream=stream,
+        Type=PdfParser.PdfName("XObject"),
+        Subtype=PdfParser.PdfName("Image"),
+        Width=width,
+        Height=height,
+        Filter=PdfParser.PdfName(decode_filter),
+        Decode=decode,
+        BitsPerComponent=bits_per_component,
+        ColorSpace=color_space,
+    )
+    return width, height, procset
+
+
+def create_pdf_from_page_images(image_contents: Sequence[bytes]) -> bytes:
+    """
+    Creates a PDF from a sequence of encoded images.
+
+    The PDF will contain 1 page per image, in the same order. Images are decoded,
+    converted and written one at a time, see write_pdf_image().
+
+    Args:
+        image_contents (Sequence[bytes]): A sequence of encoded images.
+
+    Returns:
+        bytes: The PDF bytes.
+    """
+
+    if not image_contents:
+        raise ValueError("At least one image is required to create a PDF")
+
+    with io.BytesIO() as pdf_file:
+        with PdfParser.PdfParser(f=pdf_file, mode="w+b") as pdf:
+            pdf.info["CreationDate"] = pdf.info["ModDate"] = time.gmtime()
+            pdf.start_writing()
+            pdf.write_header()
+            page_refs = [pdf.next_object_id(0) for _ in image_contents]
+            pdf.pages.extend(page_refs)
+            pdf.write_catalog()
+            for page_ref, image_bytes in zip(page_refs, image_contents):
+                image_ref = pdf.next_object_id(0)
+                contents_ref = pdf.next_object_id(0)
+                width, height, procset = write_pdf_image(pdf, image_ref, image_bytes)
+                pdf.write_page(
+                    page_ref,
+                    Resources=PdfParser.PdfDict(
+                        ProcSet=[PdfParser.PdfName("PDF"), PdfParser.PdfName(procset)],
+                        XObject=PdfParser.PdfDict(image=image_ref),
+                    ),
+                    MediaBox=[0, 0, width, height],
+                    Contents=contents_ref,
+                )
+                pdf.write_obj(
+                    contents_ref,
+                    stream=b"q %f 0 0 %f 0 0 cm /image Do Q\n" % (width, height),
+                )
+            pdf.write_xref_and_trailer()
+        return pdf_file.getvalue()
+
+
+def create_pdf_bytes_from_json(gt_json: dict) -> Tuple[bytes, Sequence[Image.Image]]:
+    """
+    Create PDF bytes from the image content of the ground truth JSON,
+    which will be used for the processing of files.
+
+    Pages are written one at a time, so a single page image is decoded at any time.
+
+    Args:
+        gt_json (dict): The input JSON data containing image content.
+
+    Returns:
+        bytes: The output PDF in byte format.
+        Sequence[Image.Image]: The page images, decoded when accessed.
+    """
 
     document = documentai.Document.from_json(json.dumps(gt_json))
-    synthesized_images = [decode_image(page.image.content) for page in document.pages]
-    pdf_bytes = create_pdf_from_images(synthesized_images)
+    image_contents = [page.image.content for page in document.pages]
+    pdf_bytes = create_pdf_from_page_images(image_contents)
 
-    return pdf_bytes, synthesized_images
+    return pdf_bytes, PageImages(image_contents)
 
 
 def process_document_sample(
@@ -743,9 +1015,7 @@ def process_document_sample(
     processor_version: str,
 ):
     """This function is used to process the files using pdf bytes and provides the processed file"""
-    # You must set the `api_endpoint` if you use a location other than "us".
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    client = get_documentai_client(location)
 
     name = client.processor_version_path(
         project_id, location, processor_id, processor_version
@@ -771,7 +1041,7 @@ def store_document_as_json(document, bucket_name: str, file_name: str):
     Store Document json in cloud storage.
     """
 
-    storage_client = storage.Client()
+    storage_client = get_storage_client()
     process_result_bucket = storage_client.get_bucket(bucket_name)
     document_blob = storage.Blob(
         name=str(Path(file_name)), bucket=process_result_bucket
@@ -794,7 +1064,7 @@ def convert_and_upload_tiff_to_jpeg(
 
     try:
         # Initialize Google Cloud Storage client
-        storage_client = storage.Client(project=project_id)
+        storage_client = get_storage_client(project_id)
         bucket = storage_client.get_bucket(bucket_name)
 
         # Download TIFF file from GCS
@@ -851,8 +1121,7 @@ def batch_process_documents_sample(
         operation.Operation: LRO operation ID for current batch-job
     """
 
-    opts = {"api_endpoint": f"{location}-documentai.googleapis.com"}
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    client = get_documentai_client(location)
     input_config = documentai.BatchDocumentsInputConfig(
         gcs_prefix=documentai.GcsPrefix(gcs_uri_prefix=gcs_input_uri)
     )
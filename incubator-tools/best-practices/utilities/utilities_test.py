@@ -0,0 +1,302 @@
+"""Unit tests for the pre/post-HITL comparison and PDF creation in utilities"""
+
+import io
+import operator
+import random
+from typing import Any, List, Tuple
+import unittest
+
+from google.cloud import documentai_v1beta3 as documentai
+import pandas as pd
+from pandas import DataFrame
+from PIL import Image
+from PIL import PdfParser
+
+from utilities import compare_pre_hitl_and_post_hitl_output
+from utilities import bb_intersection_over_union
+from utilities import create_pdf_from_page_images
+from utilities import get_match_ratio
+from utilities import json_to_dataframe
+from utilities import remove_row
+
+NOT_FOUND = "Entity not found."
+COLUMNS = [
+    "Entity Type",
+    "Pre_HITL_Output",
+    "Post_HITL_Output",
+    "pre_bbox",
+    "post_bbox",
+    "page1",
+    "page2",
+]
+
+
+def reference_compare(file1: Any, file2: Any) -> Tuple[DataFrame, float]:
+    """
+    The previous row by row implementation of compare_pre_hitl_and_post_hitl_output,
+    matching entities with the pairwise IOU loop of the previous find_match and
+    collecting rows in a list since DataFrame.append no longer exists.
+    """
+    df_file1 = json_to_dataframe(file1)
+    df_file2 = json_to_dataframe(file2)
+    file1_entities = [entity[0] for entity in df_file1.values]
+    file2_entities = [entity[0] for entity in df_file2.values]
+
+    common_entity_set = set(file1_entities).intersection(set(file2_entities))
+    common_entities = [
+        entity
+        for entity in file1_entities
+        if entity in common_entity_set
+        and file1_entities.count(entity) == 1
+        and file2_entities.count(entity) == 1
+    ]
+    rows = []
+    for entity in common_entities:
+        row1 = df_file1[df_file1["type_"] == entity].iloc[0]
+        row2 = df_file2[df_file2["type_"] == entity].iloc[0]
+        rows.append(
+            [
+                entity,
+                row1["mention_text"],
+                row2["mention_text"],
+                row1["bbox"],
+                row2["bbox"],
+                row1["page"],
+                row2["page"],
+            ]
+        )
+        df_file1 = remove_row(df_file1, entity)
+        df_file2 = remove_row(df_file2, entity)
+
+    for row in df_file1.values:
+        matched_index = None
+        if row[2]:
+            # Calculating IOU values for the entities with the same name
+            index_iou_pairs = []
+            for index, entity_file2 in df_file2[df_file2["type_"] == row[0]].iterrows():
+                if entity_file2["bbox"]:
+                    iou = bb_intersection_over_union(row[2], entity_file2["bbox"])
+                    index_iou_pairs.append((index, iou))
+            # Choose entity with highest IOU, IOU should be at least > 0.2
+            for index, iou in sorted(
+                index_iou_pairs, key=operator.itemgetter(1), reverse=True
+            ):
+                if iou > 0.2:
+                    matched_index = index
+                    break
+        if matched_index is not None:
+            match = df_file2.loc[matched_index]
+            rows.append(
+                [
+                    row[0],
+                    row[1],
+                    match["mention_text"],
+                    row[2],
+                    match["bbox"],
+                    row[3],
+                    match["page"],
+                ]
+            )
+            df_file2 = df_file2.drop(matched_index)
+        else:
+            rows.append([row[0], row[1], NOT_FOUND, row[2], NOT_FOUND, row[3], "no"])
+
+    for row in df_file2.values:
+        rows.append([row[0], NOT_FOUND, row[1], "[]", row[2], "[]", row[3]])
+
+    df_compare = pd.DataFrame(rows, columns=COLUMNS, dtype=object)
+    match_array = []
+    for pre_output, post_output in zip(
+        df_compare["Pre_HITL_Output"], df_compare["Post_HITL_Output"]
+    ):
+        if pre_output != NOT_FOUND and post_output == NOT_FOUND:
+            match_array.append("FN")
+        elif pre_output == NOT_FOUND:
+            match_array.append("FP")
+        else:
+            match_array.append("TP" if pre_output == post_output else "FP")
+    df_compare["Match"] = match_array
+    df_compare["Fuzzy Ratio"] = [
+        get_match_ratio(values) for values in df_compare.values.tolist()
+    ]
+    score = df_compare["Fuzzy Ratio"].sum() / len(df_compare.index)
+    return df_compare, score
+
+
+def make_entity(
+    entity_type: str, text: str, box: List[float], page: int
+) -> documentai.Document.Entity:
+    x_min, y_min, x_max, y_max = box
+    return documentai.Document.Entity(
+        type_=entity_type,
+        mention_text=text,
+        page_anchor={
+            "page_refs": [
+                {
+                    "page": page,
+                    "bounding_poly": {
+                        "normalized_vertices": [
+                            {"x": x_min, "y": y_min},
+                            {"x": x_max, "y": y_min},
+                            {"x": x_max, "y": y_max},
+                            {"x": x_min, "y": y_max},
+                        ]
+                    },
+                }
+            ]
+        },
+    )
+
+
+def make_document_pair(
+    seed: int,
+) -> Tuple[documentai.Document, documentai.Document]:
+    """Builds a pre-HITL document and a post-HITL document with some entities
+    moved, edited, removed or added"""
+    rng = random.Random(seed)
+    pre_entities, post_entities = [], []
+    for index in range(40):
+        entity_type = f"type_{rng.randrange(8)}"
+        x_min, y_min = rng.uniform(0, 0.8), rng.uniform(0, 0.9)
+        box = [x_min, y_min, x_min + rng.uniform(0.05, 0.2), y_min + 0.05]
+        page = rng.randrange(3)
+        text = f"value {index}"
+        pre_entities.append(make_entity(entity_type, text, box, page))
+
+        change = rng.random()
+        if change < 0.1:
+            continue
+        if change < 0.3:
+            text += " edited"
+        if change < 0.5:
+            shift = rng.uniform(-0.05, 0.05)
+            box = [box[0] + shift, box[1], box[2] + shift, box[3]]
+        post_entities.append(make_entity(entity_type, text, box, page))
+    for index in range(3):
+        post_entities.append(
+            make_entity("added", f"added {index}", [0.1, 0.1 * index, 0.2, 0.05], 0)
+        )
+    rng.shuffle(post_entities)
+    return (
+        documentai.Document(entities=pre_entities),
+        documentai.Document(entities=post_entities),
+    )
+
+
+class TestComparePreHitlAndPostHitlOutput(unittest.TestCase):
+    """Tests for compare_pre_hitl_and_post_hitl_output"""
+
+    def test_matches_reference_implementation(self):
+        """Results are the same as the previous row by row implementation"""
+        for seed in range(5):
+            pre_document, post_document = make_document_pair(seed)
+
+            df_compare, score = compare_pre_hitl_and_post_hitl_output(
+                pre_document, post_document
+            )
+            expected_df, expected_score = reference_compare(pre_document, post_document)
+
+            pd.testing.assert_frame_equal(df_compare, expected_df)
+            self.assertAlmostEqual(score, expected_score)
+
+    def test_empty_documents(self):
+        """Documents without entities give an empty comparison and a 0 score"""
+        df_compare, score = compare_pre_hitl_and_post_hitl_output(
+            documentai.Document(), documentai.Document()
+        )
+
+        self.assertTrue(df_compare.empty)
+        self.assertEqual(list(df_compare.columns), COLUMNS + ["Match", "Fuzzy Ratio"])
+        self.assertEqual(score, 0)
+
+
+def encode_image(image: Image.Image, image_format: str) -> bytes:
+    with io.BytesIO() as image_file:
+        image.save(image_file, format=image_format)
+        return image_file.getvalue()
+
+
+def reference_create_pdf(image_contents: List[bytes]) -> bytes:
+    """The previous implementation of create_pdf_from_page_images, decoding every
+    page before saving them all with the Pillow PDF writer."""
+    images = []
+    for image_bytes in image_contents:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+        images.append(image.convert("RGB") if image.mode == "RGBA" else image)
+    with io.BytesIO() as pdf_file:
+        images[0].save(pdf_file, save_all=True, append_images=images[1:], format="PDF")
+        return pdf_file.getvalue()
+
+
+def read_pdf_pages(pdf_bytes: bytes) -> List[Tuple[List[float], Any]]:
+    """Returns the media box and image stream of every page"""
+    pdf = PdfParser.PdfParser(buf=pdf_bytes)
+    pages = []
+    for page_ref in pdf.pages:
+        page = pdf.read_indirect(page_ref)
+        image_ref = page[b"Resources"][b"XObject"][b"image"]
+        pages.append((page[b"MediaBox"], pdf.read_indirect(image_ref)))
+    return pages
+
+
+class TestCreatePdfFromPageImages(unittest.TestCase):
+    """Tests for create_pdf_from_page_images"""
+
+    def setUp(self):
+        rng = random.Random(0)
+        rgb = Image.frombytes(
+            "RGB", (64, 48), bytes(rng.randrange(256) for _ in range(64 * 48 * 3))
+        )
+        self.bilevel = rgb.convert("1")
+        self.palette = rgb.quantize(16)
+        self.jpeg = encode_image(rgb, "JPEG")
+        self.image_contents = [
+            self.jpeg,
+            encode_image(rgb.convert("L").resize((30, 40)), "JPEG"),
+            encode_image(self.bilevel, "PNG"),
+            encode_image(self.palette, "PNG"),
+            encode_image(rgb.convert("RGBA").resize((20, 10)), "PNG"),
+            encode_image(rgb, "PNG"),
+        ]
+
+    def test_pages_match_reference_implementation(self):
+        """Page count and page sizes are the same as with the Pillow PDF writer"""
+        pages = read_pdf_pages(create_pdf_from_page_images(self.image_contents))
+        expected_pages = read_pdf_pages(reference_create_pdf(self.image_contents))
+
+        self.assertEqual(len(pages), len(self.image_contents))
+        self.assertEqual(
+            [media_box for media_box, _ in pages],
+            [media_box for media_box, _ in expected_pages],
+        )
+
+    def test_page_images(self):
+        """JPEG pages are embedded as they are, bilevel and palette pages are
+        stored losslessly and RGBA pages are converted to RGB"""
+        pages = read_pdf_pages(create_pdf_from_page_images(self.image_contents))
+        images = [image for _, image in pages]
+
+        self.assertEqual(images[0].buf, self.jpeg)
+        self.assertEqual(images[0].dictionary[b"ColorSpace"], b"DeviceRGB")
+        self.assertEqual(images[1].dictionary[b"ColorSpace"], b"DeviceGray")
+
+        self.assertEqual(images[2].dictionary[b"BitsPerComponent"], 1)
+        self.assertEqual(images[2].decode(), self.bilevel.tobytes())
+
+        color_space = images[3].dictionary[b"ColorSpace"]
+        self.assertEqual(color_space[0], b"Indexed")
+        self.assertEqual(images[3].decode(), self.palette.tobytes())
+
+        self.assertEqual(images[4].dictionary[b"Filter"], b"DCTDecode")
+        self.assertEqual(images[4].dictionary[b"ColorSpace"], b"DeviceRGB")
+        self.assertEqual(Image.open(io.BytesIO(images[4].buf)).mode, "RGB")
+
+    def test_no_images(self):
+        """At least one page image is required"""
+        with self.assertRaises(ValueError):
+            create_pdf_from_page_images([])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -32,15 +32,19 @@ Environment Variables Required:
 """
 
 from datetime import datetime
+from functools import lru_cache
+import hashlib
+import io
 import json
 import os
 import tempfile
-from typing import List, Optional
+from typing import BinaryIO, cast, Dict, List, Optional, Tuple, Union
 
 from flask import Request
 import functions_framework
 from google.api_core.client_options import ClientOptions
 from google.api_core.exceptions import GoogleAPIError
+from google.api_core.exceptions import NotFound
 from google.api_core.exceptions import ResourceExhausted
 from google.cloud import documentai_v1beta3 as documentai
 from google.cloud import firestore
@@ -49,6 +53,8 @@ from google.cloud import storage
 from google.cloud.firestore_v1 import FieldFilter
 from google.protobuf.json_format import MessageToDict
 import PyPDF2
+from PyPDF2.generic import DictionaryObject
+from PyPDF2.generic import NumberObject
 
 # Variables
 PROJECT_ID = os.environ.get("PROJECT_ID")
@@ -64,12 +70,42 @@ GCS_OUTPUT_PREFIX = os.environ.get("GCS_OUTPUT_PREFIX", "")
 GCS_FAILED_FILES_BUCKET = os.environ.get("GCS_FAILED_FILES_BUCKET", "")
 GCS_FAILED_FILES_PREFIX = os.environ.get("GCS_FAILED_FILES_PREFIX", "")
 
+# Maximum number of writes committed in a single Firestore transaction
+FIRESTORE_BATCH_SIZE = 500
+
+# Statuses of queue documents that are no longer processed, which may be queued again
+TERMINAL_STATUSES = ("completed", "failed")
+
+# Size of each ranged read used when probing a PDF for its page count, smaller
+# files are downloaded in a single read
+PDF_PROBE_CHUNK_SIZE = 64 * 1024
+
+# Page counts keyed by (GCS URI, object generation)
+page_count_cache: Dict[Tuple[str, int], int] = {}
+
 # Initialize Firestore client
 db = firestore.Client(PROJECT_ID)
 
 # Initialize Pub/Sub client
 publisher = pubsub_v1.PublisherClient()
 
+# Initialize Cloud Storage client, shared by all the helpers below
+storage_client = storage.Client()
+
+
+@lru_cache(maxsize=None)
+def get_docai_client() -> documentai.DocumentProcessorServiceClient:
+    """
+    Returns the Document AI client for the processor location, created on the
+    first synchronous request and reused by the following ones.
+
+    Returns:
+        The shared DocumentProcessorServiceClient
+    """
+    # You must set the `api_endpoint` if you use a location other than "us".
+    opts = ClientOptions(api_endpoint=f"{LOCATION}-documentai.googleapis.com")
+    return documentai.DocumentProcessorServiceClient(client_options=opts)
+
 
 def list_files_in_gcs_folder(bucket_name: str, folder_name: str) -> List[str]:
     """
@@ -86,9 +122,6 @@ def list_files_in_gcs_folder(bucket_name: str, folder_name: str) -> List[str]:
         Excludes folder objects (objects ending with '/')
     """
 
-    # Initialize a client
-    storage_client = storage.Client()
-
     # Get the bucket
     bucket = storage_client.bucket(bucket_name)
 
@@ -117,38 +150,118 @@ def download_file_from_gcs(gcs_uri: str, local_temp_path: str) -> None:
         Handles the parsing of GCS URI and blob retrieval automatically
     """
 
-    # Initialize a client
-    storage_client = storage.Client()
-
     bucket_name, blob_name = gcs_uri.replace("gs://", "").split("/", 1)
     bucket = storage_client.get_bucket(bucket_name)
     blob = bucket.blob(blob_name)
     blob.download_to_filename(local_temp_path)
 
 
-def get_pdf_page_count(local_pdf_path: str) -> Optional[int]:
+def count_pdf_pages(reader: PyPDF2.PdfReader) -> int:
+    """
+    Counts the pages of a PDF from the /Count of its page tree root.
+
+    Args:
+        reader: Reader of the PDF
+
+    Returns:
+        Number of pages in the PDF
+
+    Note:
+        len(reader.pages) reads every page object, which means seeking all over
+        the file. It is only used if the page tree root has no /Count.
+    """
+
+    root = cast(DictionaryObject, reader.trailer["/Root"].get_object())
+    pages = cast(DictionaryObject, root["/Pages"].get_object())
+    if "/Count" in pages:
+        return int(cast(NumberObject, pages["/Count"].get_object()))
+    return len(reader.pages)
+
+
+def get_pdf_page_count(pdf_file: Union[str, BinaryIO]) -> Optional[int]:
     """
     Determines the number of pages in a PDF document.
 
     Args:
-        local_pdf_path: Path to the local PDF file
+        pdf_file: Path to the local PDF file, or a seekable binary file object
 
     Returns:
         Number of pages in the PDF, or None if there's an error
 
     Note:
-        Uses PyPDF2 for PDF parsing
+        Uses PyPDF2 for PDF parsing, see count_pdf_pages
     """
 
     try:
-        with open(local_pdf_path, "rb") as file:
-            reader = PyPDF2.PdfReader(file)
-            return len(reader.pages)
+        if isinstance(pdf_file, str):
+            with open(pdf_file, "rb") as file:
+                return count_pdf_pages(PyPDF2.PdfReader(file))
+        return count_pdf_pages(PyPDF2.PdfReader(pdf_file))
     except Exception as e:
         print(f"Error reading PDF file: {e}")
         return None
 
 
+def get_gcs_pdf_page_count(gcs_uri: str) -> Optional[int]:
+    """
+    Determines the number of pages in a PDF stored in Google Cloud Storage.
+
+    Args:
+        gcs_uri: Complete GCS URI (gs://) of the PDF
+
+    Returns:
+        Number of pages in the PDF, or None if there's an error
+
+    Note:
+        - Parses the PDF through ranged reads of PDF_PROBE_CHUNK_SIZE bytes,
+          so only the parts PyPDF2 seeks to are downloaded. Files that fit in
+          a single read are downloaded at once.
+        - Falls back to a full download if the ranged probe fails
+        - Caches page counts by object generation
+    """
+
+    bucket_name, blob_name = gcs_uri.replace("gs://", "").split("/", 1)
+    blob = storage_client.bucket(bucket_name).get_blob(blob_name)
+    if blob is None:
+        print(f"File not found: {gcs_uri}")
+        return None
+
+    cache_key = (gcs_uri, blob.generation)
+    if cache_key in page_count_cache:
+        return page_count_cache[cache_key]
+
+    page_count = None
+    try:
+        if blob.size is not None and blob.size <= PDF_PROBE_CHUNK_SIZE:
+            pdf_bytes = blob.download_as_bytes(if_generation_match=blob.generation)
+            page_count = get_pdf_page_count(io.BytesIO(pdf_bytes))
+        else:
+            with blob.open(
+                "rb",
+                chunk_size=PDF_PROBE_CHUNK_SIZE,
+                if_generation_match=blob.generation,
+            ) as pdf_file:
+                page_count = get_pdf_page_count(pdf_file)
+    except Exception as e:
+        print(f"Ranged read failed for {gcs_uri}: {e}")
+
+    if page_count is None:
+        print(f"Downloading {gcs_uri} to count pages")
+        # Download the file from GCS to a temporary location
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
+            local_pdf_path = temp_file.name
+        try:
+            download_file_from_gcs(gcs_uri, local_pdf_path)
+            page_count = get_pdf_page_count(local_pdf_path)
+        finally:
+            os.remove(local_pdf_path)
+
+    if page_count is not None:
+        page_count_cache[cache_key] = page_count
+
+    return page_count
+
+
 def get_sync_batch(gcs_input_uri: str) -> Optional[str]:
     """
     Determines whether a document should be processed synchronously or in batch mode
@@ -162,16 +275,10 @@ def get_sync_batch(gcs_input_uri: str) -> Optional[str]:
         None if page count cannot be determined
 
     Note:
-        Downloads file temporarily to check page count
+        Reads only the parts of the file needed to count pages
     """
 
-    # Download the file from GCS to a temporary location
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
-        local_pdf_path = temp_file.name
-        download_file_from_gcs(gcs_input_uri, local_pdf_path)
-
-    # Check the page count using PyPDF2
-    page_count = get_pdf_page_count(local_pdf_path)
+    page_count = get_gcs_pdf_page_count(gcs_input_uri)
 
     if page_count is None:
         print("Unable to get page count. Skipping processing.")
@@ -183,6 +290,69 @@ def get_sync_batch(gcs_input_uri: str) -> Optional[str]:
     return "batch"
 
 
+def queue_document_id(file_path: str) -> str:
+    """
+    Derives the Firestore document ID of a queued file from its path.
+
+    Args:
+        file_path: GCS URI of the document
+
+    Returns:
+        Hex digest of the file path, a valid and fixed length document ID
+
+    Note:
+        Status updates address queue documents by this ID instead of querying by file_path
+    """
+
+    return hashlib.sha256(file_path.encode("utf-8")).hexdigest()
+
+
+def is_queued(snapshot: firestore.DocumentSnapshot) -> bool:
+    """
+    Checks whether a queue document is still waiting for or under processing.
+
+    Args:
+        snapshot: Snapshot of the queue document
+
+    Returns:
+        True if the document exists and its status is not terminal
+    """
+
+    return snapshot.exists and snapshot.get("status") not in TERMINAL_STATUSES
+
+
+@firestore.transactional
+def queue_documents(
+    transaction: firestore.Transaction, documents: Dict[str, Dict]
+) -> int:
+    """
+    Atomically writes the queue documents of files which are not already queued.
+
+    Args:
+        transaction: Firestore transaction, supplied by the caller
+        documents: Queue document data keyed by document ID
+
+    Returns:
+        Number of documents written
+
+    Note:
+        Documents still pending or processing are left untouched, so their status
+        and lease are kept. Conflicting writes are retried by Firestore
+    """
+
+    collection_ref = db.collection(FIRESTORE_COLLECTION)
+    refs = [collection_ref.document(doc_id) for doc_id in documents]
+
+    # All reads must happen before the first write of the transaction
+    snapshots = [
+        snapshot for snapshot in transaction.get_all(refs) if not is_queued(snapshot)
+    ]
+    for snapshot in snapshots:
+        transaction.set(snapshot.reference, documents[snapshot.id])
+
+    return len(snapshots)
+
+
 def populate_queue(file_paths: List[str]) -> None:
     """
     Initializes Firestore documents for tracking document processing status.
@@ -193,35 +363,87 @@ def populate_queue(file_paths: List[str]) -> None:
     Note:
         - Creates documents with initial status 'pending'
         - Includes timestamps and processing mode determination
-        - Handles errors for individual document insertion
+        - Writes documents in transactions of FIRESTORE_BATCH_SIZE, with IDs derived
+          from the file path
+        - A file queued again only replaces its previous entry once completed or
+          failed, files still pending or processing are skipped
+        - Handles errors for individual transactions
     """
 
     # Reference to the collection
     collection_ref = db.collection(FIRESTORE_COLLECTION)
 
-    for path in file_paths:
-        # Prepare the document data
-        doc_data = {
-            "file_path": path,
-            "status": "pending",
-            "process_mode": get_sync_batch(path),
-            "added_time": datetime.utcnow(),  # Firestore will automatically handle timestamp conversion
-            "process_start_time": None,  # Initialize with None or a default value
-            "process_end_time": None,
-        }
+    inserted = 0
+    skipped = 0
+    for start in range(0, len(file_paths), FIRESTORE_BATCH_SIZE):
+        batch_paths = file_paths[start : start + FIRESTORE_BATCH_SIZE]
+        paths_by_id = {queue_document_id(path): path for path in batch_paths}
 
         try:
-            # Add a new document with the data
-            collection_ref.add(doc_data)
+            # Skip queued files before probing their page count
+            queued_ids = {
+                snapshot.id
+                for snapshot in db.get_all(
+                    [collection_ref.document(doc_id) for doc_id in paths_by_id]
+                )
+                if is_queued(snapshot)
+            }
+            documents = {
+                doc_id: {
+                    "file_path": path,
+                    "status": "pending",
+                    "process_mode": get_sync_batch(path),
+                    # Firestore will automatically handle timestamp conversion
+                    "added_time": datetime.utcnow(),
+                    "process_start_time": None,  # Initialize with None or a default value
+                    "process_end_time": None,
+                }
+                for doc_id, path in paths_by_id.items()
+                if doc_id not in queued_ids
+            }
+            # Files queued since the read above are skipped by the transaction
+            written = queue_documents(db.transaction(), documents) if documents else 0
+            inserted += written
+            skipped += len(paths_by_id) - written
         except Exception as e:
-            print(f"Couldn't insert {path} into Firestore collection", e)
+            print(
+                f"Couldn't insert {len(batch_paths)} documents starting with "
+                f"{batch_paths[0]} into Firestore collection",
+                e,
+            )
             continue
 
     print(
-        f"Successfully inserted {len(file_paths)} documents into Firestore collection."
+        f"Successfully inserted {inserted} documents into Firestore collection, "
+        f"skipped {skipped} documents already queued."
     )
 
 
+def update_queue_document(file_path: str, update_data: Dict) -> None:
+    """
+    Updates the queue document of a file.
+
+    Args:
+        file_path: GCS URI of the document
+        update_data: Fields to update
+
+    Note:
+        Addresses the document by its ID derived from file_path, and only queries
+        by file_path for files queued before IDs were derived from the path
+    """
+
+    collection_ref = db.collection(FIRESTORE_COLLECTION)
+    try:
+        collection_ref.document(queue_document_id(file_path)).update(update_data)
+    except NotFound:
+        # Query for the document where file_path matches
+        query = collection_ref.where(
+            filter=FieldFilter("file_path", "==", file_path)
+        ).limit(1)
+        for doc in query.stream():
+            doc.reference.update(update_data)
+
+
 def trigger_batch_processing() -> None:
     """
     Publishes a message to Pub/Sub to initiate batch document processing.
@@ -257,9 +479,6 @@ def save_json_to_gcs(
         Automatically handles bucket name formatting and folder structure
     """
 
-    # Initialize Google Cloud Storage client
-    storage_client = storage.Client()
-
     # Remove 'gs://' if present from the bucket name
     bucket_name = destination_bucket.replace("gs://", "")
 
@@ -298,9 +517,6 @@ def copy_failed_file_to_folder(
         Maintains original filename while copying to new location
     """
 
-    # Initialize GCS client
-    storage_client = storage.Client()
-
     # Extract bucket name and blob path from the file path
     source_bucket_name = file_path.split("/")[2]
     source_blob_path = "/".join(file_path.split("/")[3:])
@@ -346,10 +562,7 @@ def process_document_sync(gcs_input_uri: str) -> bool:
         # Updating the queue status to log process_start_time
         update_queue_status(gcs_input_uri, "processing")
 
-        # You must set the `api_endpoint` if you use a location other than "us".
-        opts = ClientOptions(api_endpoint=f"{LOCATION}-documentai.googleapis.com")
-
-        client = documentai.DocumentProcessorServiceClient(client_options=opts)
+        client = get_docai_client()
 
         # Full resource name for the processor
         name = client.processor_path(PROJECT_ID, LOCATION, PROCESSOR_ID)
@@ -411,38 +624,18 @@ def update_sync_to_batch(file_path: str) -> None:
         file_path: GCS URI of the document to update
 
     Note:
-        Resets process_start_time when switching to batch mode
+        Resets status and process_start_time so the document is queued for batch mode
     """
 
-    # Reference to the specific document
-    collection_ref = db.collection(FIRESTORE_COLLECTION)
-
     # Prepare the update data
     update_data = {
         "process_mode": "batch",
+        "status": "pending",
         "process_start_time": None,  # Reseting the process_start_time
     }
 
     try:
-        # Query for the document where file_path matches
-        query = collection_ref.where(
-            filter=FieldFilter("file_path", "==", file_path)
-        ).limit(
-            1
-        )  # Use limit(1) to get a single match
-
-        results = query.stream()  # Execute the query and get the results
-
-        # Iterate through the query results (should be 1 due to limit(1))
-        for doc in results:
-            # Print the document ID for reference
-            print(f"Document ID: {doc.id}")
-
-            # Reference the document to update
-            doc_ref = collection_ref.document(doc.id)
-
-            # Update the document
-            doc_ref.update(update_data)
+        update_queue_document(file_path, update_data)
 
     except Exception as e:
         print(f"Error updating process_mode for {file_path}", e)
@@ -467,9 +660,6 @@ def update_queue_status(
         Updates timestamps and additional metadata based on status
     """
 
-    # Reference to the specific document
-    collection_ref = db.collection(FIRESTORE_COLLECTION)
-
     if status == "processing":
         # Prepare the update data
         update_data = {
@@ -492,22 +682,7 @@ def update_queue_status(
         }
 
     try:
-        # Query for the document where file_path matches
-        query = collection_ref.where(
-            filter=FieldFilter("file_path", "==", file_path)
-        ).limit(
-            1
-        )  # Use limit(1) to get a single match
-
-        results = query.stream()  # Execute the query and get the results
-
-        # Iterate through the query results (should be 1 due to limit(1))
-        for doc in results:
-            # Reference the document to update
-            doc_ref = collection_ref.document(doc.id)
-
-            # Update the document
-            doc_ref.update(update_data)
+        update_queue_document(file_path, update_data)
 
     except Exception as e:
         print(f"Error updating queue status to {status} for {file_path}")
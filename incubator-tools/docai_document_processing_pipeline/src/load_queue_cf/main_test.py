@@ -0,0 +1,351 @@
+# Copyright 2024 Google LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests for counting the pages of PDFs stored in GCS and for queueing
+documents in Firestore"""
+
+import hashlib
+import io
+import random
+import tempfile
+from typing import Any, Dict, List, Optional, Set, Tuple
+import unittest
+from unittest.mock import patch
+
+from google.api_core.exceptions import NotFound
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.storage.fileio import BlobReader
+from PIL import Image
+
+# The module creates its Firestore, Pub/Sub and Storage clients on import
+with patch(
+    "google.auth.default", return_value=(AnonymousCredentials(), "test-project")
+):
+    import main
+
+PDF_URI = "gs://input/documents/scan.pdf"
+
+
+def make_pdf(pages: int, size: int = 300) -> bytes:
+    """Builds a PDF of noise images, which do not compress"""
+    rng = random.Random(0)
+    images = [
+        Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+        for _ in range(pages)
+    ]
+    with io.BytesIO() as pdf_file:
+        images[0].save(pdf_file, format="PDF", save_all=True, append_images=images[1:])
+        return pdf_file.getvalue()
+
+
+class FakeBlob:
+    """PDF served from memory through ranged reads, like a GCS object"""
+
+    def __init__(self, data: bytes, generation: int = 1, fail_open: bool = False):
+        self.data = data
+        self.size = len(data)
+        self.generation = generation
+        self.chunk_size = None
+        self.fail_open = fail_open
+        self.ranges: List[Tuple[int, Optional[int]]] = []
+        self.full_downloads = 0
+
+    def open(self, mode: str = "rb", chunk_size=None, **download_kwargs):
+        if self.fail_open:
+            raise ConnectionError("ranged read failed")
+        return BlobReader(self, chunk_size=chunk_size, **download_kwargs)
+
+    def download_as_bytes(self, start=None, end=None, **_) -> bytes:
+        # As in GCS, the end of a range is inclusive
+        self.ranges.append((start, end))
+        return self.data[start : None if end is None else end + 1]
+
+    def downloaded_size(self) -> int:
+        return sum(
+            len(self.data[start : None if end is None else end + 1])
+            for start, end in self.ranges
+        )
+
+    def download_to_filename(self, filename: str):
+        self.full_downloads += 1
+        with open(filename, "wb") as file:
+            file.write(self.data)
+
+
+class FakeBucket:
+    def __init__(self, blob: FakeBlob):
+        self.blob_ = blob
+
+    def get_blob(self, blob_name: str) -> FakeBlob:
+        return self.blob_
+
+    def blob(self, blob_name: str) -> FakeBlob:
+        return self.blob_
+
+
+class TestGetGcsPdfPageCount(unittest.TestCase):
+    """Tests for get_gcs_pdf_page_count"""
+
+    def setUp(self):
+        self.pdf = make_pdf(pages=12)
+        self.blob = FakeBlob(self.pdf)
+        bucket = FakeBucket(self.blob)
+        for target, name, value in (
+            (main.storage_client, "bucket", lambda _: bucket),
+            (main.storage_client, "get_bucket", lambda _: bucket),
+            (main, "PDF_PROBE_CHUNK_SIZE", 4096),
+            (main, "page_count_cache", {}),
+        ):
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_ranged_read_matches_full_download(self):
+        """The page count read through ranges is the one of the whole file, and
+        only part of the file is downloaded"""
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+            pdf_file.write(self.pdf)
+            pdf_file.flush()
+            expected_page_count = main.get_pdf_page_count(pdf_file.name)
+
+        self.assertEqual(expected_page_count, 12)
+        self.assertEqual(main.get_gcs_pdf_page_count(PDF_URI), expected_page_count)
+        self.assertEqual(self.blob.full_downloads, 0)
+        self.assertLess(self.blob.downloaded_size(), len(self.pdf) / 10)
+
+    def test_page_count_cached_by_generation(self):
+        """The PDF is read again only when the object generation changes"""
+        self.assertEqual(main.get_gcs_pdf_page_count(PDF_URI), 12)
+        reads = len(self.blob.ranges)
+
+        self.assertEqual(main.get_gcs_pdf_page_count(PDF_URI), 12)
+        self.assertEqual(len(self.blob.ranges), reads)
+        self.assertEqual(main.page_count_cache, {(PDF_URI, 1): 12})
+
+        self.blob.generation = 2
+        self.assertEqual(main.get_gcs_pdf_page_count(PDF_URI), 12)
+        self.assertGreater(len(self.blob.ranges), reads)
+
+    def test_small_file_read_at_once(self):
+        """A file that fits in a single read is not read through ranges"""
+        self.blob.data = make_pdf(pages=2, size=10)
+        self.blob.size = len(self.blob.data)
+
+        self.assertEqual(main.get_gcs_pdf_page_count(PDF_URI), 2)
+        self.assertEqual(self.blob.ranges, [(None, None)])
+
+    def test_full_download_when_ranged_read_fails(self):
+        """The file is downloaded if it cannot be read through ranges"""
+        self.blob.fail_open = True
+
+        self.assertEqual(main.get_gcs_pdf_page_count(PDF_URI), 12)
+        self.assertEqual(self.blob.full_downloads, 1)
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: "FakeDocumentReference"):
+        self.reference = reference
+        self.id = reference.id
+        self.data = reference.client.documents.get(reference.id)
+        self.exists = self.data is not None
+
+    def get(self, field_path: str) -> Any:
+        assert self.data is not None
+        return self.data[field_path]
+
+
+class FakeDocumentReference:
+    def __init__(self, client: "FakeFirestoreClient", document_id: str):
+        self.client = client
+        self.id = document_id
+
+    def update(self, data: Dict[str, Any]):
+        if self.id not in self.client.documents:
+            raise NotFound(f"No document to update: {self.id}")
+        self.client.documents[self.id].update(data)
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeFirestoreClient", file_path: str):
+        self.client = client
+        self.file_path = file_path
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self
+
+    def stream(self):
+        self.client.queries += 1
+        for document_id, data in self.client.documents.items():
+            if data.get("file_path") == self.file_path:
+                yield FakeDocumentSnapshot(
+                    FakeDocumentReference(self.client, document_id)
+                )
+
+
+class FakeCollection:
+    def __init__(self, client: "FakeFirestoreClient"):
+        self.client = client
+
+    def document(self, document_id: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self.client, document_id)
+
+    def where(self, *, filter) -> FakeQuery:
+        assert (filter.field_path, filter.op_string) == ("file_path", "==")
+        return FakeQuery(self.client, filter.value)
+
+
+class FakeTransaction:
+    def __init__(self, client: "FakeFirestoreClient"):
+        self.client = client
+        self.writes: List[Tuple[FakeDocumentReference, Dict[str, Any]]] = []
+
+    def get_all(self, references: List[FakeDocumentReference]):
+        return self.client.get_all(references)
+
+    def set(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self.writes.append((reference, data))
+
+    def commit(self):
+        commit = len(self.client.commits)
+        self.client.commits.append(len(self.writes))
+        if commit in self.client.failing_commits:
+            raise ConnectionError("commit failed")
+        for reference, data in self.writes:
+            self.client.documents[reference.id] = dict(data)
+
+
+class FakeFirestoreClient:
+    """Queue collection in memory, recording the size of each commit"""
+
+    def __init__(self):
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.commits: List[int] = []
+        self.failing_commits: Set[int] = set()
+        self.queries = 0
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self)
+
+    def get_all(self, references: List[FakeDocumentReference]):
+        return [FakeDocumentSnapshot(reference) for reference in references]
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+
+class TestQueue(unittest.TestCase):
+    """Tests for populate_queue and update_queue_document"""
+
+    def setUp(self):
+        self.client = FakeFirestoreClient()
+        # the function wrapped by firestore.transactional
+        queue_documents = main.queue_documents.to_wrap
+
+        def run_transaction(transaction: FakeTransaction, documents: Dict) -> int:
+            written = queue_documents(transaction, documents)
+            transaction.commit()
+            return written
+
+        for name, value in (
+            ("db", self.client),
+            ("FIRESTORE_COLLECTION", "queue"),
+            ("queue_documents", run_transaction),
+        ):
+            patcher = patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(main, "get_sync_batch", return_value="batch")
+        self.get_sync_batch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def file_paths(count: int) -> List[str]:
+        return [f"gs://input/documents/{index:04d}.pdf" for index in range(count)]
+
+    def test_document_id_is_sha256_of_path(self):
+        path = "gs://input/documents/scan.pdf"
+
+        self.assertEqual(
+            main.queue_document_id(path), hashlib.sha256(path.encode()).hexdigest()
+        )
+        self.assertNotEqual(
+            main.queue_document_id(path), main.queue_document_id(path + "x")
+        )
+
+    def test_writes_in_transactions_of_batch_size(self):
+        paths = self.file_paths(1201)
+
+        main.populate_queue(paths)
+
+        self.assertEqual(self.client.commits, [500, 500, 201])
+        self.assertEqual(len(self.client.documents), 1201)
+        for path in paths:
+            document = self.client.documents[main.queue_document_id(path)]
+            self.assertEqual(document["file_path"], path)
+            self.assertEqual(document["status"], "pending")
+            self.assertEqual(document["process_mode"], "batch")
+
+    def test_continues_after_failed_commit(self):
+        paths = self.file_paths(1201)
+        self.client.failing_commits = {1}
+
+        main.populate_queue(paths)
+
+        self.assertEqual(self.client.commits, [500, 500, 201])
+        self.assertEqual(
+            set(self.client.documents),
+            {main.queue_document_id(path) for path in paths[:500] + paths[1000:]},
+        )
+
+    def test_skips_files_still_queued(self):
+        pending, completed, new = self.file_paths(3)
+        for path, status in ((pending, "pending"), (completed, "completed")):
+            self.client.documents[main.queue_document_id(path)] = {
+                "file_path": path,
+                "status": status,
+                "batch_id": "previous",
+            }
+
+        main.populate_queue([pending, completed, new])
+
+        self.assertEqual(
+            self.client.documents[main.queue_document_id(pending)]["batch_id"],
+            "previous",
+        )
+        self.assertEqual(
+            self.client.documents[main.queue_document_id(completed)]["status"],
+            "pending",
+        )
+        self.assertIn(main.queue_document_id(new), self.client.documents)
+        # the page count of the pending file is not probed
+        self.assertEqual(
+            [call.args[0] for call in self.get_sync_batch.call_args_list],
+            [completed, new],
+        )
+
+    def test_update_by_document_id(self):
+        path = "gs://input/documents/scan.pdf"
+        self.client.documents[main.queue_document_id(path)] = {"file_path": path}
+
+        main.update_queue_document(path, {"status": "completed"})
+
+        self.assertEqual(
+            self.client.documents[main.queue_document_id(path)]["status"], "completed"
+        )
+        self.assertEqual(self.client.queries, 0)
+
+    def test_update_falls_back_to_file_path_query(self):
+        """Documents queued with generated IDs are found by their file_path"""
+        path = "gs://input/documents/scan.pdf"
+        self.client.documents["generated-id"] = {"file_path": path}
+        self.client.documents["other-id"] = {"file_path": path + "x"}
+
+        main.update_queue_document(path, {"status": "completed"})
+
+        self.assertEqual(self.client.queries, 1)
+        self.assertEqual(self.client.documents["generated-id"]["status"], "completed")
+        self.assertNotIn("status", self.client.documents["other-id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
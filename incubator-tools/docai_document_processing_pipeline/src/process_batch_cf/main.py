@@ -27,19 +27,33 @@ Environment Variables Required:
     GCS_OUTPUT_PREFIX: Prefix for output files (optional)
     GCS_FAILED_FILES_BUCKET: Bucket for failed document storage
     GCS_FAILED_FILES_PREFIX: Prefix for failed files
+    LEASE_TIMEOUT_SECONDS: Seconds a claimed document is leased to a worker before
+        it can be reclaimed (default: 86400)
+
+Queue items are claimed with a lease inside a Firestore transaction, so concurrent
+triggers never submit the same document twice. A lease that expires without the
+batch reporting back (e.g. the worker crashed) frees the slot and the document is
+claimed again by the next trigger. Documents in 'processing' state without a lease
+(claimed before leases were introduced) hold their slot until they complete or fail.
 """
 
 from datetime import datetime
+from datetime import timedelta
+import hashlib
 import os
-from typing import Optional, Union
+from typing import cast, Dict, List, Optional, Tuple, Union
+import uuid
 
 import functions_framework
 from google.api_core.client_options import ClientOptions
+from google.api_core.exceptions import NotFound
 from google.cloud import documentai_v1beta3 as documentai
 from google.cloud import firestore
 from google.cloud import pubsub_v1
 from google.cloud import storage
 from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.aggregation import AggregationQuery
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
 
 MAX_CONCURRENT_BATCHES = int(os.environ.get("MAX_CONCURRENT_BATCHES", "5"))
 FIRESTORE_COLLECTION = os.environ.get(
@@ -54,6 +68,10 @@ GCS_OUTPUT_BUCKET = os.environ.get("GCS_OUTPUT_BUCKET")
 GCS_OUTPUT_PREFIX = os.environ.get("GCS_OUTPUT_PREFIX", "")
 GCS_FAILED_FILES_BUCKET = os.environ.get("GCS_FAILED_FILES_BUCKET")
 GCS_FAILED_FILES_PREFIX = os.environ.get("GCS_FAILED_FILES_PREFIX")
+LEASE_TIMEOUT_SECONDS = int(os.environ.get("LEASE_TIMEOUT_SECONDS", "86400"))
+
+# Identifies the function instance holding a lease
+WORKER_ID = uuid.uuid4().hex
 
 # Initialize Firestore client
 db = firestore.Client(PROJECT_ID)
@@ -62,6 +80,62 @@ db = firestore.Client(PROJECT_ID)
 publisher = pubsub_v1.PublisherClient()
 
 
+def processing_batches_query() -> firestore.Query:
+    """
+    Builds the query of batch documents in 'processing' state.
+
+    Returns:
+        Query over the queue collection
+    """
+
+    return (
+        db.collection(FIRESTORE_COLLECTION)
+        .where(filter=FieldFilter("process_mode", "==", "batch"))
+        .where(filter=FieldFilter("status", "==", "processing"))
+    )
+
+
+def count_live_leases(
+    now: datetime, transaction: Optional[firestore.Transaction] = None
+) -> int:
+    """
+    Counts the batch documents in 'processing' state whose lease has not expired.
+
+    Args:
+        now: Reference time for lease expiry
+        transaction: Firestore transaction to read in, if any
+
+    Returns:
+        Number of processing documents without an expired lease
+
+    Note:
+        - Documents without lease_expires_at (claimed before leases were
+          introduced) count as live, they keep their slot until they complete
+          or fail
+        - Uses Firestore count aggregations, so no documents are transferred
+    """
+
+    processing_query = processing_batches_query()
+    expired_query = processing_query.where(
+        filter=FieldFilter("lease_expires_at", "<", now)
+    )
+
+    counts = []
+    for query in (processing_query, expired_query):
+        # Transaction.get only accepts documents and queries, aggregations run
+        # in the transaction through their own get. The casts work around
+        # Query.count being annotated as returning the class, and get as
+        # returning the aggregation results rather than one list per query.
+        aggregation_query = cast(AggregationQuery, query.count(alias="count"))
+        results = cast(
+            List[List[AggregationResult]],
+            aggregation_query.get(transaction=transaction),
+        )
+        counts.append(int(results[0][0].value))
+
+    return counts[0] - counts[1]
+
+
 def get_active_batches() -> int:
     """
     Retrieves the count of currently processing batch operations.
@@ -70,54 +144,151 @@ def get_active_batches() -> int:
         Number of active batch processes in 'processing' state
 
     Note:
-        Queries Firestore for documents with process_mode='batch' and status='processing'
+        - Documents with an expired lease are not counted, see count_live_leases
     """
 
-    # Reference to the collection
-    collection_ref = db.collection(FIRESTORE_COLLECTION)
+    return count_live_leases(datetime.utcnow())
 
-    # Query documents where status is 'processing'
-    query = collection_ref.where(
-        filter=FieldFilter("process_mode", "==", "batch")
-    ).where(filter=FieldFilter("status", "==", "processing"))
-    docs = query.stream()
 
-    # Count the number of documents in the query result
-    active_batches = sum(1 for _ in docs)
+@firestore.transactional
+def claim_pending_items(
+    transaction: firestore.Transaction, max_items: int
+) -> List[Tuple[firestore.DocumentReference, str]]:
+    """
+    Atomically leases up to max_items documents for batch processing.
 
-    return active_batches
+    Args:
+        transaction: Firestore transaction, supplied by the caller
+        max_items: Maximum number of concurrent batches
 
+    Returns:
+        List of (document reference, GCS URI) tuples claimed by this worker
 
-def get_next_item() -> Optional[str]:
+    Note:
+        - Live leases are counted with count_live_leases, as in get_active_batches
+        - Documents whose lease has expired are reclaimed before pending ones
+        - Pending documents are claimed in added_time order to maintain FIFO
+        - Conflicting claims from concurrent triggers are retried by Firestore
+        - Documents without a file_path are marked as failed instead of claimed
     """
-    Retrieves the next pending document for batch processing.
 
-    Returns:
-        GCS URI of the next document to process, or None if no documents are pending
+    now = datetime.utcnow()
+
+    # All reads must happen before the first write of the transaction
+    available_slots = max_items - count_live_leases(now, transaction)
+    if available_slots <= 0:
+        return []
+
+    expired_query = (
+        processing_batches_query()
+        .where(filter=FieldFilter("lease_expires_at", "<", now))
+        .order_by("lease_expires_at")
+        .limit(available_slots)
+    )
+    claimed_docs = list(transaction.get(expired_query))
+
+    if len(claimed_docs) < available_slots:
+        pending_query = (
+            db.collection(FIRESTORE_COLLECTION)
+            .where(filter=FieldFilter("process_mode", "==", "batch"))
+            .where(filter=FieldFilter("status", "==", "pending"))
+            .order_by("added_time")
+            .limit(available_slots - len(claimed_docs))
+        )
+        claimed_docs.extend(transaction.get(pending_query))
+
+    lease_data = {
+        "status": "processing",
+        "process_start_time": now,  # Firestore will handle Timestamp
+        "lease_owner": WORKER_ID,
+        "lease_expires_at": now + timedelta(seconds=LEASE_TIMEOUT_SECONDS),
+        "batch_id": None,
+    }
+
+    claimed = []
+    for doc in claimed_docs:
+        file_path = (doc.to_dict() or {}).get("file_path")
+        if not file_path:
+            # Nothing to submit, fail the document so that it frees its place
+            print(f"Queue document {doc.id} has no file_path")
+            transaction.update(
+                doc.reference,
+                {
+                    "status": "failed",
+                    "process_end_time": now,
+                    "error": "Missing file_path",
+                    "lease_expires_at": None,
+                },
+            )
+            continue
+        transaction.update(doc.reference, lease_data)
+        claimed.append((doc.reference, file_path))
+
+    return claimed
+
+
+def release_claim(doc_ref: firestore.DocumentReference) -> None:
+    """
+    Returns a claimed document to the pending queue.
+
+    Args:
+        doc_ref: Reference of the claimed queue document
 
     Note:
-        - Queries for documents with process_mode='batch' and status='pending'
-        - Orders by added_time to maintain FIFO processing
-        - Returns only one document at a time
+        Used when a batch could not be submitted for a claimed document
     """
 
-    # Reference to the collection
-    collection_ref = db.collection(FIRESTORE_COLLECTION)
+    try:
+        doc_ref.update(
+            {
+                "status": "pending",
+                "process_start_time": None,
+                "lease_owner": None,
+                "lease_expires_at": None,
+            }
+        )
+    except Exception as e:
+        print(f"Error releasing claim on {doc_ref.id}")
+        print(e)
 
-    # Query documents where status is 'pending', ordered by added_time, limit to 1
-    query = (
-        collection_ref.where(filter=FieldFilter("process_mode", "==", "batch"))
-        .where(filter=FieldFilter("status", "==", "pending"))
-        .order_by("added_time")
-        .limit(1)
-    )
-    docs = query.stream()
 
-    # Get the file_path from the first document if it exists
-    for doc in docs:
-        return doc.to_dict().get("file_path")
+def queue_document_id(file_path: str) -> str:
+    """
+    Derives the Firestore document ID of a queued file from its path.
+
+    Args:
+        file_path: GCS URI of the document
+
+    Returns:
+        Hex digest of the file path, the ID given to the document by load_queue
+    """
+
+    return hashlib.sha256(file_path.encode("utf-8")).hexdigest()
 
-    return None
+
+def update_queue_document(file_path: str, update_data: Dict) -> None:
+    """
+    Updates the queue document of a file.
+
+    Args:
+        file_path: GCS URI of the document
+        update_data: Fields to update
+
+    Note:
+        Addresses the document by its ID derived from file_path, and only queries
+        by file_path for files queued before IDs were derived from the path
+    """
+
+    collection_ref = db.collection(FIRESTORE_COLLECTION)
+    try:
+        collection_ref.document(queue_document_id(file_path)).update(update_data)
+    except NotFound:
+        # Query for the document where file_path matches
+        query = collection_ref.where(
+            filter=FieldFilter("file_path", "==", file_path)
+        ).limit(1)
+        for doc in query.stream():
+            doc.reference.update(update_data)
 
 
 def update_queue_status(
@@ -141,9 +312,6 @@ def update_queue_status(
         Updates timestamps and additional metadata based on status
     """
 
-    # Reference to the specific document
-    collection_ref = db.collection(FIRESTORE_COLLECTION)
-
     if status == "processing":
         # Prepare the update data
         update_data = {
@@ -157,6 +325,7 @@ def update_queue_status(
             "status": status,
             "process_end_time": datetime.utcnow(),
             "output_uri": output_uri,
+            "lease_expires_at": None,
         }
 
     elif status == "failed":
@@ -164,25 +333,11 @@ def update_queue_status(
             "status": status,
             "process_end_time": datetime.utcnow(),
             "error": error,
+            "lease_expires_at": None,
         }
 
     try:
-        # Query for the document where file_path matches
-        query = collection_ref.where(
-            filter=FieldFilter("file_path", "==", file_path)
-        ).limit(
-            1
-        )  # Use limit(1) to get a single match
-
-        results = query.stream()  # Execute the query and get the results
-
-        # Iterate through the query results (should be 1 due to limit(1))
-        for doc in results:
-            # Reference the document to update
-            doc_ref = collection_ref.document(doc.id)
-
-            # Update the document
-            doc_ref.update(update_data)
+        update_queue_document(file_path, update_data)
 
     except Exception as e:
         print(f"Error updating queue status to {status} for {file_path}")
@@ -340,9 +495,9 @@ def process_batch_documents() -> Union[str, tuple[str, int]]:
         or message indicating maximum concurrent batches reached
 
     Note:
-        - Checks for available processing slots
-        - Initiates new batch processes up to MAX_CONCURRENT_BATCHES
-        - Continues processing while slots are available and documents are pending
+        - Checks for available processing slots with a count aggregation
+        - Claims up to MAX_CONCURRENT_BATCHES documents in a single transaction
+        - Submits a batch process for every claimed document
     """
 
     active_batches = get_active_batches()
@@ -350,16 +505,18 @@ def process_batch_documents() -> Union[str, tuple[str, int]]:
     if active_batches >= MAX_CONCURRENT_BATCHES:
         return f"Already running {MAX_CONCURRENT_BATCHES} batches, the file will be processed once a slot is available"
 
-    while active_batches < MAX_CONCURRENT_BATCHES:
-        print(active_batches)
-        file_path = get_next_item()
-        if file_path:
-            print("Triggering batch for", file_path)
+    claimed = claim_pending_items(db.transaction(), MAX_CONCURRENT_BATCHES)
+
+    for doc_ref, file_path in claimed:
+        print("Triggering batch for", file_path)
+        try:
             batch_id = process_document(file_path)
-            update_queue_status(file_path, "processing", batch_id=batch_id)
-        else:
-            break
+        except Exception as e:
+            print(f"Error submitting batch for {file_path}", e)
+            release_claim(doc_ref)
+            continue
+        doc_ref.update({"batch_id": batch_id})
 
-        active_batches = get_active_batches()
+    active_batches = get_active_batches()
 
     return f"Batch triggered, Current active batches = {active_batches}", 200
@@ -0,0 +1,282 @@
+# Copyright 2024 Google LLC
+# SPDX-License-Identifier: Apache-2.0
+
+"""Unit tests for counting, claiming and releasing leases on the queue"""
+
+from datetime import datetime
+from datetime import timedelta
+import operator
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import unittest
+from unittest.mock import patch
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.firestore_v1.aggregation import AggregationQuery
+from google.cloud.firestore_v1.base_aggregation import AggregationResult
+
+# The module creates its Firestore and Pub/Sub clients on import
+with patch(
+    "google.auth.default", return_value=(AnonymousCredentials(), "test-project")
+):
+    import main
+
+
+class TestCountLiveLeases(unittest.TestCase):
+    """Tests for count_live_leases"""
+
+    def setUp(self):
+        patcher = patch.object(main, "FIRESTORE_COLLECTION", "queue")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Counts of all processing documents, then of those with an expired lease
+        patcher = patch.object(
+            AggregationQuery,
+            "get",
+            autospec=True,
+            side_effect=[
+                [[AggregationResult(alias="count", value=5)]],
+                [[AggregationResult(alias="count", value=2)]],
+            ],
+        )
+        self.aggregation_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_counts_outside_transaction(self):
+        self.assertEqual(main.count_live_leases(datetime.utcnow()), 3)
+        for call in self.aggregation_get.call_args_list:
+            self.assertIsNone(call.kwargs["transaction"])
+
+    def test_counts_in_transaction(self):
+        # Transaction.get rejects aggregation queries with a ValueError, so the
+        # counts must run through AggregationQuery.get
+        transaction = main.db.transaction()
+
+        self.assertEqual(main.count_live_leases(datetime.utcnow(), transaction), 3)
+        self.assertEqual(self.aggregation_get.call_count, 2)
+        for call in self.aggregation_get.call_args_list:
+            self.assertIs(call.kwargs["transaction"], transaction)
+
+
+class FakeDocumentReference:
+    def __init__(self, documents: Dict[str, Dict[str, Any]], document_id: str):
+        self.documents = documents
+        self.id = document_id
+
+    def update(self, data: Dict[str, Any]):
+        self.documents[self.id].update(data)
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self.reference = reference
+        self.id = reference.id
+        self.data = data
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.data)
+
+
+class FakeQuery:
+    """Query over an in-memory collection, with the operators used by main"""
+
+    OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+        "==": operator.eq,
+        "<": operator.lt,
+    }
+
+    def __init__(
+        self,
+        documents: Dict[str, Dict[str, Any]],
+        filters: Tuple = (),
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+    ):
+        self.documents = documents
+        self.filters = filters
+        self.order = order
+        self.limit_count = limit
+
+    def where(self, *, filter):
+        condition = (filter.field_path, filter.op_string, filter.value)
+        return FakeQuery(
+            self.documents, self.filters + (condition,), self.order, self.limit_count
+        )
+
+    def order_by(self, field_path: str):
+        return FakeQuery(self.documents, self.filters, field_path, self.limit_count)
+
+    def limit(self, count: int):
+        return FakeQuery(self.documents, self.filters, self.order, count)
+
+    def matches(self, data: Dict[str, Any]) -> bool:
+        # Like Firestore, documents missing a filtered or ordered field (or with
+        # a null value in an inequality) are left out
+        for field_path, op_string, value in self.filters:
+            field_value = data.get(field_path)
+            if field_path not in data or (op_string != "==" and field_value is None):
+                return False
+            if not self.OPERATORS[op_string](field_value, value):
+                return False
+        return self.order is None or data.get(self.order) is not None
+
+    def stream(self) -> List[FakeDocumentSnapshot]:
+        matches = [
+            (document_id, data)
+            for document_id, data in sorted(self.documents.items())
+            if self.matches(data)
+        ]
+        order = self.order
+        if order is not None:
+            matches.sort(key=lambda item: item[1][order])
+        return [
+            FakeDocumentSnapshot(FakeDocumentReference(self.documents, doc_id), data)
+            for doc_id, data in matches[: self.limit_count]
+        ]
+
+    def count(self, alias: str):
+        query = self
+
+        class FakeAggregationQuery:
+            def get(self, transaction=None):
+                count = len(query.stream())
+                return [[AggregationResult(alias=alias, value=count)]]
+
+        return FakeAggregationQuery()
+
+
+class FakeClient:
+    def __init__(self):
+        self.documents: Dict[str, Dict[str, Any]] = {}
+
+    def collection(self, name: str) -> FakeQuery:
+        return FakeQuery(self.documents)
+
+
+class FakeTransaction:
+    """Buffers updates until commit, and rejects reads after the first write"""
+
+    def __init__(self):
+        self.updates: List[Tuple[FakeDocumentReference, Dict[str, Any]]] = []
+
+    def get(self, query: FakeQuery) -> List[FakeDocumentSnapshot]:
+        assert not self.updates, "read after write"
+        return query.stream()
+
+    def update(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self.updates.append((reference, data))
+
+    def commit(self):
+        for reference, data in self.updates:
+            reference.update(data)
+
+
+class TestClaimPendingItems(unittest.TestCase):
+    """Tests for claim_pending_items and release_claim"""
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.now = datetime.utcnow()
+        for name, value in (
+            ("db", self.client),
+            ("FIRESTORE_COLLECTION", "queue"),
+            ("WORKER_ID", "worker"),
+            ("LEASE_TIMEOUT_SECONDS", 60),
+        ):
+            patcher = patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add(self, document_id: str, status: str, minutes: int = 0, **fields):
+        """Adds a batch document added `minutes` after now"""
+        self.client.documents[document_id] = {
+            "process_mode": "batch",
+            "status": status,
+            "file_path": f"gs://input/{document_id}.pdf",
+            "added_time": self.now + timedelta(minutes=minutes),
+            **fields,
+        }
+
+    def claim(self, max_items: int) -> List[str]:
+        transaction = FakeTransaction()
+        # the function wrapped by firestore.transactional
+        claimed = main.claim_pending_items.to_wrap(transaction, max_items)
+        transaction.commit()
+        for doc_ref, file_path in claimed:
+            self.assertEqual(file_path, f"gs://input/{doc_ref.id}.pdf")
+        return [doc_ref.id for doc_ref, _ in claimed]
+
+    def test_claims_pending_in_fifo_order(self):
+        self.add("third", "pending", 3)
+        self.add("first", "pending", 1)
+        self.add("second", "pending", 2)
+        self.add("online", "pending", 0, process_mode="online")
+
+        self.assertEqual(self.claim(max_items=2), ["first", "second"])
+
+        for document_id in ("first", "second"):
+            document = self.client.documents[document_id]
+            self.assertEqual(document["status"], "processing")
+            self.assertEqual(document["lease_owner"], "worker")
+            self.assertEqual(
+                document["lease_expires_at"],
+                document["process_start_time"] + timedelta(seconds=60),
+            )
+        self.assertEqual(self.client.documents["third"]["status"], "pending")
+        self.assertEqual(self.client.documents["online"]["status"], "pending")
+
+    def test_reclaims_expired_leases_first(self):
+        expired = self.now - timedelta(minutes=1)
+        self.add("live", "processing", lease_expires_at=self.now + timedelta(hours=1))
+        self.add("expired_late", "processing", lease_expires_at=expired)
+        self.add(
+            "expired_early", "processing", lease_expires_at=expired - timedelta(hours=1)
+        )
+        self.add("pending", "pending", 1)
+        self.add("pending_later", "pending", 2)
+
+        # 4 slots, 1 held by the live lease
+        self.assertEqual(
+            self.claim(max_items=4), ["expired_early", "expired_late", "pending"]
+        )
+        self.assertGreater(
+            self.client.documents["expired_early"]["lease_expires_at"], self.now
+        )
+        self.assertEqual(self.client.documents["pending_later"]["status"], "pending")
+
+    def test_does_not_claim_beyond_slots(self):
+        # Documents claimed before leases were introduced keep their slot
+        self.add("legacy", "processing")
+        self.add("live", "processing", lease_expires_at=self.now + timedelta(hours=1))
+        self.add("pending", "pending", 1)
+
+        self.assertEqual(self.claim(max_items=2), [])
+        self.assertEqual(self.client.documents["pending"]["status"], "pending")
+        self.assertEqual(self.claim(max_items=3), ["pending"])
+
+    def test_fails_documents_without_file_path(self):
+        self.add("missing", "pending", 1)
+        del self.client.documents["missing"]["file_path"]
+        self.add("pending", "pending", 2)
+
+        self.assertEqual(self.claim(max_items=2), ["pending"])
+        self.assertEqual(self.client.documents["missing"]["status"], "failed")
+        self.assertIsNone(self.client.documents["missing"]["lease_expires_at"])
+
+    def test_release_claim(self):
+        self.add("pending", "pending", 1)
+        transaction = FakeTransaction()
+        [(doc_ref, _)] = main.claim_pending_items.to_wrap(transaction, 1)
+        transaction.commit()
+
+        main.release_claim(doc_ref)
+
+        document = self.client.documents["pending"]
+        self.assertEqual(document["status"], "pending")
+        for field in ("process_start_time", "lease_owner", "lease_expires_at"):
+            self.assertIsNone(document[field])
+        # the released document is claimed again
+        self.assertEqual(self.claim(max_items=1), ["pending"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,12 +6,30 @@
 # pylint: disable=E1101
 """This file will compare two JSONS and uploads the xlsx file to GCS Bucket."""
 from collections import Counter
-from typing import Any, Dict, List
-
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import documentai_v1beta3 as documentai
 from google.cloud import storage
 import pandas as pd
 
+# Number of JSON files downloaded in parallel
+DOWNLOAD_WORKERS = 16
+# Directory where the entities extracted from each JSON file are cached, keyed by blob generation.
+# It keeps the latest entry of every blob ever read, delete it to reclaim the space
+JSON_CACHE_DIR = os.path.join(tempfile.gettempdir(), "test_harness_json_cache")
+# Version of the data extracted by extract_entity_data, part of the cache key: bump it when the extraction changes
+ENTITY_DATA_VERSION = 1
+
+# Number of cells per axis of the grid indexing bounding boxes over the normalized page
+BBOX_GRID_SIZE = 32
+
 
 def upload_xlsx_to_gcs(
     bucket_name: str, source_file_path: str, destination_blob_name: str
@@ -81,16 +99,201 @@ def calculate_bbox_overlap(box1: List[float], box2: List[float]) -> float:
     return iou * 100
 
 
+def bbox_grid_cells(box: List[float]) -> List[Tuple[int, int]]:
+    """
+    Returns the cells of the BBOX_GRID_SIZE x BBOX_GRID_SIZE grid covered by a bounding box.
+
+    Two boxes which intersect always share at least one cell. Coordinates outside
+    of the normalized page are clamped to the border cells.
+
+    Args:
+        box (List[float]): Normalized coordinates [x_min, y_min, x_max, y_max].
+
+    Returns:
+        List[Tuple[int, int]]: (column, row) of each covered cell.
+    """
+
+    def cell_range(low: float, high: float) -> range:
+        first = min(max(int(low * BBOX_GRID_SIZE), 0), BBOX_GRID_SIZE - 1)
+        last = min(max(int(high * BBOX_GRID_SIZE), 0), BBOX_GRID_SIZE - 1)
+        return range(first, last + 1)
+
+    return [
+        (column, row)
+        for column in cell_range(box[0], box[2])
+        for row in cell_range(box[1], box[3])
+    ]
+
+
+def extract_entity_data(json_bytes: bytes, filename: str) -> List[Dict[str, Any]]:
+    """
+    Parses a Document AI JSON output and extracts the entity information including bounding box coordinates.
+
+    Only the entities are parsed into a Document AI document, the pages are not needed for the comparison.
+
+    Args:
+        json_bytes (bytes): Content of the JSON file.
+        filename (str): The name of the JSON file.
+
+    Returns:
+        List[Dict[str, Any]]: A list of dictionaries containing extracted entity data, without folder_index.
+    """
+    entities = json.loads(json_bytes).get("entities", [])
+    json_data = documentai.Document.from_json(json.dumps({"entities": entities}))
+    data = []
+    for entity in json_data.entities:
+        if entity.properties == []:
+            entity_name = entity.type_
+            mention_text = entity.mention_text
+            if entity.page_anchor.page_refs:
+                page_number = entity.page_anchor.page_refs[0].page
+            else:
+                page_number = 0
+            if (
+                entity.page_anchor.page_refs
+                and "bounding_poly" in entity.page_anchor.page_refs[0]
+            ):
+                bounding_poly = entity.page_anchor.page_refs[
+                    0
+                ].bounding_poly.normalized_vertices
+            else:
+                bounding_poly = [0, 0, 0, 0]
+
+            x_cordinates = []
+            y_cordinates = []
+            bounding_box = [0, 0, 0, 0]
+
+            if bounding_poly != [0, 0, 0, 0]:
+                for xy in bounding_poly:
+                    x_cordinates.append(xy.x)
+                    y_cordinates.append(xy.y)
+
+                bounding_box = (
+                    [
+                        min(x_cordinates),
+                        min(y_cordinates),
+                        max(x_cordinates),
+                        max(y_cordinates),
+                    ]
+                    if len(bounding_poly) >= 4
+                    else [0, 0, 0, 0]
+                )
+
+            data.append(
+                {
+                    "filename": filename,
+                    "Entity_name": entity_name,
+                    "Text": mention_text,
+                    "Page_Number": page_number,
+                    "Bounding_Box": bounding_box,
+                }
+            )
+        else:
+            for child in entity.properties:
+                entity_name = entity.type_ + "/" + child.type_
+                mention_text = child.mention_text
+                page_number = child.page_anchor.page_refs[0].page
+                bounding_poly = child.page_anchor.page_refs[
+                    0
+                ].bounding_poly.normalized_vertices
+
+                x_cordinates = []
+                y_cordinates = []
+
+                for xy in bounding_poly:
+                    x_cordinates.append(xy.x)
+                    y_cordinates.append(xy.y)
+
+                bounding_box = (
+                    [
+                        min(x_cordinates),
+                        min(y_cordinates),
+                        max(x_cordinates),
+                        max(y_cordinates),
+                    ]
+                    if len(bounding_poly) >= 4
+                    else [0, 0, 0, 0]
+                )
+
+                data.append(
+                    {
+                        "filename": filename,
+                        "Entity_name": entity_name,
+                        "Text": mention_text,
+                        "Page_Number": page_number,
+                        "Bounding_Box": bounding_box,
+                    }
+                )
+    return data
+
+
+def read_blob_entity_data(
+    blob: storage.Blob, cache_dir: Optional[str]
+) -> List[Dict[str, Any]]:
+    """
+    Extracts the entity information of a JSON file in GCS, from the local cache when the blob is unchanged.
+    The cache is keyed by blob generation and by ENTITY_DATA_VERSION, and holds a single entry per blob:
+    writing a new entry removes the entries of the previous generations.
+
+    Args:
+        blob (storage.Blob): The listed JSON blob.
+        cache_dir (Optional[str]): Directory of the cache, None to always download the blob.
+
+    Returns:
+        List[Dict[str, Any]]: A list of dictionaries containing extracted entity data, without folder_index.
+    """
+    cache_file = None
+    if cache_dir is not None:
+        cache_key = hashlib.sha256(
+            f"{blob.bucket.name}/{blob.name}".encode("utf-8")
+        ).hexdigest()
+        cache_file = Path(
+            cache_dir, f"{cache_key}-{blob.generation}-v{ENTITY_DATA_VERSION}.json"
+        )
+        if cache_file.exists():
+            with open(cache_file, encoding="utf-8") as file:
+                return json.load(file)
+
+    try:
+        content = blob.download_as_bytes(if_generation_match=blob.generation)
+    except PreconditionFailed:
+        # the blob was overwritten since it was listed, read its current generation
+        blob.reload()
+        return read_blob_entity_data(blob, cache_dir)
+    data = extract_entity_data(content, blob.name.split("/")[-1])
+
+    if cache_file is not None:
+        # write to a temporary file first, so an interrupted run never leaves a partial cache entry
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_dir, suffix=".tmp", delete=False, encoding="utf-8"
+        ) as tmp_file:
+            json.dump(data, tmp_file)
+        os.replace(tmp_file.name, cache_file)
+        # drop the entries of older generations and versions, the cache keeps one entry per blob
+        for stale_file in cache_file.parent.glob(f"{cache_key}-*.json"):
+            if stale_file != cache_file:
+                stale_file.unlink(missing_ok=True)
+    return data
+
+
 def read_json_files_from_gcs(
-    bucket_name: str, folder_prefixes: List[str]
+    bucket_name: str,
+    folder_prefixes: List[str],
+    max_workers: int = DOWNLOAD_WORKERS,
+    cache_dir: Optional[str] = JSON_CACHE_DIR,
 ) -> List[Dict[str, Any]]:
     """
     Reads JSON files from a Google Cloud Storage (GCS) bucket, parses the data using Google Document AI,
     and extracts entity information including bounding box coordinates.
 
+    Files are downloaded in parallel, and the entity information of each file is cached locally
+    by blob generation, so only new or changed files are downloaded again by later runs.
+
     Args:
         bucket_name (str): The name of the GCS bucket.
         folder_prefixes (List[str]): List of folder prefixes to search for JSON files.
+        max_workers (int): Maximum number of files downloaded in parallel.
+        cache_dir (Optional[str]): Directory of the local cache, None to disable caching.
 
     Returns:
         List[Dict[str, Any]]: A list of dictionaries containing extracted entity data.
@@ -108,109 +311,47 @@ def read_json_files_from_gcs(
     """
     client = storage.Client()
     bucket = client.bucket(bucket_name)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    folder_blobs = []
+    for folder_index, folder_prefix in enumerate(folder_prefixes, start=1):
+        for blob in bucket.list_blobs(prefix=folder_prefix):
+            if blob.name.endswith(".json"):
+                folder_blobs.append((folder_index, blob))
 
     data = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        blob_data = executor.map(
+            lambda folder_blob: read_blob_entity_data(folder_blob[1], cache_dir),
+            folder_blobs,
+        )
+        for (folder_index, _), entities in zip(folder_blobs, blob_data):
+            for entity in entities:
+                data.append({"folder_index": folder_index, **entity})
 
-    for folder_index, folder_prefix in enumerate(folder_prefixes, start=1):
-        blobs = bucket.list_blobs(prefix=folder_prefix)
+    return data
 
-        for blob in blobs:
-            if blob.name.endswith(".json"):
-                # json_data = json.loads(blob.download_as_text())
-                json_data = documentai.Document.from_json(blob.download_as_bytes())
-                # json_data=documentai.Document.to_dict(doc)
-                # if hasattr(json_data, "entities") and isinstance(json_data.entities, list):
-                for entity in json_data.entities:
-                    if entity.properties == []:
-                        # print(entity.keys())
-                        entity_name = entity.type_
-                        mention_text = entity.mention_text
-                        if entity.page_anchor.page_refs:
-                            page_number = entity.page_anchor.page_refs[0].page
-                        else:
-                            page_number = 0
-                        # print(page_number)
-                        if (
-                            entity.page_anchor.page_refs
-                            and "bounding_poly" in entity.page_anchor.page_refs[0]
-                        ):
-                            bounding_poly = entity.page_anchor.page_refs[
-                                0
-                            ].bounding_poly.normalized_vertices
-                        else:
-                            bounding_poly = [0, 0, 0, 0]
-
-                        x_cordinates = []
-                        y_cordinates = []
-
-                        if bounding_poly != [0, 0, 0, 0]:
-                            for xy in bounding_poly:
-                                x_cordinates.append(xy.x)
-                                y_cordinates.append(xy.y)
-
-                            bounding_box = (
-                                [
-                                    min(x_cordinates),
-                                    min(y_cordinates),
-                                    max(x_cordinates),
-                                    max(y_cordinates),
-                                ]
-                                if len(bounding_poly) >= 4
-                                else [0, 0, 0, 0]
-                            )
-                        # print(blob.name.split('/')[-1])
-
-                        data.append(
-                            {
-                                "folder_index": folder_index,
-                                "filename": blob.name.split("/")[-1],
-                                "Entity_name": entity_name,
-                                "Text": mention_text,
-                                "Page_Number": page_number,
-                                "Bounding_Box": bounding_box,
-                            }
-                        )
-                    else:
-                        for child in entity.properties:
-                            entity_name = entity.type_ + "/" + child.type_
-                            mention_text = child.mention_text
-                            page_number = child.page_anchor.page_refs[0].page
-                            bounding_poly = child.page_anchor.page_refs[
-                                0
-                            ].bounding_poly.normalized_vertices
-
-                            x_cordinates = []
-                            y_cordinates = []
-
-                            for xy in bounding_poly:
-                                x_cordinates.append(xy.x)
-                                y_cordinates.append(xy.y)
-
-                            bounding_box = (
-                                [
-                                    min(x_cordinates),
-                                    min(y_cordinates),
-                                    max(x_cordinates),
-                                    max(y_cordinates),
-                                ]
-                                if len(bounding_poly) >= 4
-                                else [0, 0, 0, 0]
-                            )
-                            # print(blob.name.split('/')[-1])
-
-                            data.append(
-                                {
-                                    "folder_index": folder_index,
-                                    "filename": blob.name.split("/")[-1],
-                                    "Entity_name": entity_name,
-                                    "Text": mention_text,
-                                    "Page_Number": page_number,
-                                    "Bounding_Box": bounding_box,
-                                }
-                            )
-
-    # df = pd.DataFrame(data)
-    # df.to_csv("data.csv", index=False)
+
+def read_json_files_from_folders(folder_paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Reads JSON files from local folders and extracts entity information including bounding box coordinates.
+
+    Args:
+        folder_paths (List[str]): List of local folders containing the JSON files.
+
+    Returns:
+        List[Dict[str, Any]]: A list of dictionaries containing extracted entity data,
+        in the same format as read_json_files_from_gcs().
+
+    Example Usage:
+        data = read_json_files_from_folders(["output/iteration_1", "output/iteration_2"])
+    """
+    data = []
+    for folder_index, folder_path in enumerate(folder_paths, start=1):
+        for json_path in sorted(Path(folder_path).rglob("*.json")):
+            for entity in extract_entity_data(json_path.read_bytes(), json_path.name):
+                data.append({"folder_index": folder_index, **entity})
     return data
 
 
@@ -245,32 +386,38 @@ def calculate_consistency(
     Example:
         results = calculate_consistency(extracted_data, num_folders=3)
     """
-    grouped_data: dict[tuple[Any, str, Any, tuple[float, float, float, float]], Any] = {}
+    grouped_data: dict[
+        tuple[Any, str, Any, tuple[float, float, float, float]], Any
+    ] = {}
+    group_keys: List[tuple[Any, str, Any, tuple[float, float, float, float]]] = []
+    group_positions: Dict[
+        tuple[Any, str, Any, tuple[float, float, float, float]], int
+    ] = {}
+    # positions of the groups covering each grid cell, per entity name, page number and file.
+    # An overlap of 40 requires intersecting boxes, so only groups sharing a cell are compared
+    group_index: Dict[Tuple[Any, int, Any], Dict[Tuple[int, int], Set[int]]] = {}
 
     for entity in data:
-        # print(entity)
-        grouped = False
-        for key, dic_value in grouped_data.items():
-            # print(entity['Entity_name'],key[0],entity['Page_Number'],key[1],entity['filename'],key[2])
-            if (
-                entity["Entity_name"] == key[0]
-                and int(entity["Page_Number"]) == int(key[1])
-                and entity["filename"] == key[2]
+        cells = bbox_grid_cells(entity["Bounding_Box"])
+        page_index = group_index.setdefault(
+            (entity["Entity_name"], int(entity["Page_Number"]), entity["filename"]), {}
+        )
+        candidates = {
+            position for cell in cells for position in page_index.get(cell, ())
+        }
+        group_position = None
+        # the entity joins the first created group with a sufficiently overlapping entity
+        for position in sorted(candidates):
+            if any(
+                calculate_bbox_overlap(
+                    entity["Bounding_Box"], compare_entity["Bounding_Box"]
+                )
+                >= 40
+                for compare_entity in grouped_data[group_keys[position]]
             ):
-                # print(grouped_data[key])
-                for compare_entity in dic_value:
-                    overlap = calculate_bbox_overlap(
-                        entity["Bounding_Box"], compare_entity["Bounding_Box"]
-                    )
-                    # print(overlap)
-                    if overlap >= 40:
-                        dic_value.append(entity)
-                        grouped = True
-                        break
-                if grouped:
-                    break
-        if not grouped:
-            # print(entity['Page_Number'])
+                group_position = position
+                break
+        if group_position is None:
             key = (
                 entity["Entity_name"],
                 str(entity["Page_Number"]),
@@ -279,7 +426,12 @@ def calculate_consistency(
             )
             if key not in grouped_data:
                 grouped_data[key] = []
-            grouped_data[key].append(entity)
+                group_positions[key] = len(group_keys)
+                group_keys.append(key)
+            group_position = group_positions[key]
+        grouped_data[group_keys[group_position]].append(entity)
+        for cell in cells:
+            page_index.setdefault(cell, set()).add(group_position)
     # print(grouped_data)
     results = []
 
@@ -406,7 +558,7 @@ def main(
     Main function to process consistency data from Google Cloud Storage (GCS), calculate metrics, and save results.
 
     Args:
-        path (str): The GCS path where the input data is located.
+        path (str): The GCS path or local folder where the input data is located.
         iteration (int): The number of iterations to process.
         output_file_name (str): The base name for the output file.
         gcs_result_path (str): The GCS path where the result file will be uploaded.
@@ -415,15 +567,24 @@ def main(
     Returns:
         None
     """
-    gcs_input_path = path
-    bucket_name = gcs_input_path.split("/")[2]
-    folder_prefixes = [
-        "/".join(gcs_input_path.split("/")[3:]) + "iteration_" + str(i) + "/"
-        for i in range(1, int(iteration) + 1)
-    ]
-
-    # Read JSON files directly from GCS
-    data = read_json_files_from_gcs(bucket_name, folder_prefixes)
+    if path.startswith("gs://"):
+        gcs_input_path = path
+        bucket_name = gcs_input_path.split("/")[2]
+        folder_prefixes = [
+            "/".join(gcs_input_path.split("/")[3:]) + "iteration_" + str(i) + "/"
+            for i in range(1, int(iteration) + 1)
+        ]
+
+        # Read JSON files directly from GCS
+        data = read_json_files_from_gcs(bucket_name, folder_prefixes)
+    else:
+        folder_prefixes = [
+            os.path.join(path, "iteration_" + str(i))
+            for i in range(1, int(iteration) + 1)
+        ]
+
+        # Read JSON files from local folders
+        data = read_json_files_from_folders(folder_prefixes)
 
     # Calculate consistency metrics
     results = calculate_consistency(data, len(folder_prefixes))
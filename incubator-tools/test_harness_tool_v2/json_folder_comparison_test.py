@@ -0,0 +1,443 @@
+"""Unit tests for the entity grouping in json_folder_comparison"""
+
+from collections import Counter
+import json
+import os
+from pathlib import Path
+import random
+import tempfile
+from typing import Any, Dict, List, Optional
+import unittest
+from unittest.mock import patch
+
+from google.api_core.exceptions import PreconditionFailed
+
+import json_folder_comparison
+from json_folder_comparison import bbox_grid_cells
+from json_folder_comparison import BBOX_GRID_SIZE
+from json_folder_comparison import calculate_bbox_overlap
+from json_folder_comparison import calculate_consistency
+from json_folder_comparison import read_blob_entity_data
+from json_folder_comparison import read_json_files_from_folders
+from json_folder_comparison import read_json_files_from_gcs
+
+
+def reference_consistency(
+    data: List[Dict[str, Any]], num_folders: int
+) -> List[Dict[str, Any]]:
+    """
+    The previous implementation of calculate_consistency, comparing each entity
+    with every existing group.
+    """
+    grouped_data: Dict[Any, Any] = {}
+
+    for entity in data:
+        grouped = False
+        for key, dic_value in grouped_data.items():
+            if (
+                entity["Entity_name"] == key[0]
+                and int(entity["Page_Number"]) == int(key[1])
+                and entity["filename"] == key[2]
+            ):
+                for compare_entity in dic_value:
+                    overlap = calculate_bbox_overlap(
+                        entity["Bounding_Box"], compare_entity["Bounding_Box"]
+                    )
+                    if overlap >= 40:
+                        dic_value.append(entity)
+                        grouped = True
+                        break
+                if grouped:
+                    break
+        if not grouped:
+            key = (
+                entity["Entity_name"],
+                str(entity["Page_Number"]),
+                entity["filename"],
+                tuple(entity["Bounding_Box"]),
+            )
+            if key not in grouped_data:
+                grouped_data[key] = []
+            grouped_data[key].append(entity)
+    results = []
+
+    for key, entities in grouped_data.items():
+        mention_texts = [entity["Text"] for entity in entities]
+        mention_text_counter = Counter(mention_texts)
+        majority_text, majority_count = mention_text_counter.most_common(1)[0]
+        consistency_percentage = (majority_count / num_folders) * 100
+        result = {
+            "FileName": key[2],
+            "Entity_name": key[0],
+            "Page_Number": key[1],
+            "Majority_Text": majority_text,
+            "Consistency_Percentage": consistency_percentage,
+        }
+
+        for i in range(1, num_folders + 1):
+            result[f"Folder_{i}_Text"] = None
+            result[f"Folder_{i}_Bounding_Box"] = None
+            result[f"Folder_{i}_page_number"] = None
+
+        for entity in entities:
+            result[f'Folder_{entity["folder_index"]}_Text'] = entity["Text"]
+            result[f'Folder_{entity["folder_index"]}_Bounding_Box'] = entity[
+                "Bounding_Box"
+            ]
+            result[f'Folder_{entity["folder_index"]}_page_number'] = entity[
+                "Page_Number"
+            ]
+
+        results.append(result)
+
+    return results
+
+
+def random_box(rng: random.Random) -> List[float]:
+    """Returns a box, sometimes with zero area or outside of the page"""
+    kind = rng.random()
+    x_min = rng.uniform(0, 0.9)
+    y_min = rng.uniform(0, 0.9)
+    if kind < 0.1:
+        return [x_min, y_min, x_min, y_min]
+    if kind < 0.2:
+        return [x_min, y_min, x_min, y_min + rng.uniform(0, 0.1)]
+    if kind < 0.3:
+        x_min = rng.uniform(-0.5, 1.5)
+        y_min = rng.uniform(-0.5, 1.5)
+    return [
+        x_min,
+        y_min,
+        x_min + rng.uniform(0.01, 0.3),
+        y_min + rng.uniform(0.01, 0.3),
+    ]
+
+
+def random_data(seed: int, num_folders: int) -> List[Dict[str, Any]]:
+    """Returns dense entity data, with boxes repeated across folders and jittered"""
+    rng = random.Random(seed)
+    base: List[Dict[str, Any]] = [
+        {
+            "filename": f"doc_{rng.randrange(2)}.json",
+            "Entity_name": f"type_{rng.randrange(3)}",
+            "Page_Number": rng.randrange(2),
+            "Bounding_Box": random_box(rng),
+        }
+        for _ in range(60)
+    ]
+    data = []
+    for folder_index in range(1, num_folders + 1):
+        for entity in base:
+            box = list(entity["Bounding_Box"])
+            if rng.random() < 0.5:
+                box = [coordinate + rng.uniform(-0.02, 0.02) for coordinate in box]
+            data.append(
+                {
+                    **entity,
+                    "folder_index": folder_index,
+                    "Text": rng.choice(["a", "b"]),
+                    "Bounding_Box": box,
+                }
+            )
+        # duplicated boxes in the same folder
+        data.extend(dict(item) for item in rng.sample(data, 5))
+    rng.shuffle(data)
+    return data
+
+
+class TestBboxGridCells(unittest.TestCase):
+    def test_clamps_to_page(self):
+        self.assertEqual(bbox_grid_cells([-1.0, -1.0, -0.5, -0.5]), [(0, 0)])
+        last = BBOX_GRID_SIZE - 1
+        self.assertEqual(bbox_grid_cells([1.5, 1.5, 2.0, 2.0]), [(last, last)])
+
+    def test_intersecting_boxes_share_a_cell(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            box1 = random_box(rng)
+            box2 = random_box(rng)
+            if calculate_bbox_overlap(box1, box2) > 0:
+                self.assertTrue(set(bbox_grid_cells(box1)) & set(bbox_grid_cells(box2)))
+
+
+class TestCalculateConsistency(unittest.TestCase):
+    def test_matches_reference_on_random_data(self):
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                data = random_data(seed, num_folders=3)
+                self.assertEqual(
+                    calculate_consistency(data, 3), reference_consistency(data, 3)
+                )
+
+    def test_groups_overlapping_entities(self):
+        data = [
+            {
+                "folder_index": folder_index,
+                "filename": "doc.json",
+                "Entity_name": "total",
+                "Text": text,
+                "Page_Number": 0,
+                "Bounding_Box": box,
+            }
+            for folder_index, text, box in [
+                (1, "10", [0.1, 0.1, 0.3, 0.2]),
+                (2, "10", [0.11, 0.1, 0.3, 0.21]),
+                (3, "12", [0.6, 0.6, 0.7, 0.7]),
+            ]
+        ]
+
+        results = calculate_consistency(data, 3)
+
+        self.assertEqual(
+            [(r["Majority_Text"], r["Consistency_Percentage"]) for r in results],
+            [("10", 2 / 3 * 100), ("12", 1 / 3 * 100)],
+        )
+        self.assertEqual(results[0]["Folder_3_Text"], None)
+
+
+def document_json(mention_text: str) -> bytes:
+    """Returns a Document AI JSON output with a single entity"""
+    vertices = [{"x": 0.25, "y": 0.25}, {"x": 0.5, "y": 0.25}, {"x": 0.5, "y": 0.75}]
+    vertices.append({"x": 0.25, "y": 0.75})
+    document = {
+        "entities": [
+            {
+                "type": "total",
+                "mentionText": mention_text,
+                "pageAnchor": {
+                    "pageRefs": [
+                        {"page": "1", "boundingPoly": {"normalizedVertices": vertices}}
+                    ]
+                },
+            }
+        ],
+        "pages": [{"pageNumber": 1}],
+    }
+    return json.dumps(document).encode("utf-8")
+
+
+class FakeBucket:
+    def __init__(self, name: str, contents: Dict[str, bytes]):
+        self.name = name
+        self.contents = contents
+        self.generations = {blob_name: 1 for blob_name in contents}
+
+    def list_blobs(self, prefix: str) -> List["FakeBlob"]:
+        return [
+            FakeBlob(self, blob_name)
+            for blob_name in sorted(self.contents)
+            if blob_name.startswith(prefix)
+        ]
+
+    def overwrite(self, blob_name: str, content: bytes) -> None:
+        self.contents[blob_name] = content
+        self.generations[blob_name] += 1
+
+
+class FakeBlob:
+    def __init__(self, bucket: FakeBucket, name: str):
+        self.bucket = bucket
+        self.name = name
+        self.generation = bucket.generations[name]
+        self.downloads = 0
+
+    def download_as_bytes(self, if_generation_match: Optional[int] = None) -> bytes:
+        if if_generation_match != self.bucket.generations[self.name]:
+            raise PreconditionFailed("generation mismatch")
+        self.downloads += 1
+        return self.bucket.contents[self.name]
+
+    def reload(self) -> None:
+        self.generation = self.bucket.generations[self.name]
+
+
+class FakeStorageClient:
+    def __init__(self, bucket: FakeBucket):
+        self._bucket = bucket
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        assert bucket_name == self._bucket.name
+        return self._bucket
+
+
+class TestReadBlobEntityData(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = tmp_dir.name
+        self.bucket = FakeBucket(
+            "bucket", {"run/iteration_1/doc.json": document_json("10")}
+        )
+
+    def read(self) -> List[Dict[str, Any]]:
+        blob = FakeBlob(self.bucket, "run/iteration_1/doc.json")
+        data = read_blob_entity_data(blob, self.cache_dir)
+        self.downloads = blob.downloads
+        return data
+
+    def test_extracts_entities(self):
+        data = self.read()
+
+        self.assertEqual(
+            data,
+            [
+                {
+                    "filename": "doc.json",
+                    "Entity_name": "total",
+                    "Text": "10",
+                    "Page_Number": 1,
+                    "Bounding_Box": [0.25, 0.25, 0.5, 0.75],
+                }
+            ],
+        )
+
+    def test_reads_unchanged_blob_from_cache(self):
+        first = self.read()
+        second = self.read()
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.downloads, 0)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_replaces_entry_of_overwritten_blob(self):
+        self.read()
+        self.bucket.overwrite("run/iteration_1/doc.json", document_json("12"))
+
+        data = self.read()
+
+        self.assertEqual(data[0]["Text"], "12")
+        self.assertEqual(self.downloads, 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_reads_current_generation_of_blob_overwritten_after_listing(self):
+        blob = FakeBlob(self.bucket, "run/iteration_1/doc.json")
+        self.bucket.overwrite("run/iteration_1/doc.json", document_json("12"))
+
+        data = read_blob_entity_data(blob, self.cache_dir)
+
+        self.assertEqual(data[0]["Text"], "12")
+        self.assertEqual(blob.generation, 2)
+
+    def test_without_cache(self):
+        blob = FakeBlob(self.bucket, "run/iteration_1/doc.json")
+
+        read_blob_entity_data(blob, None)
+        read_blob_entity_data(blob, None)
+
+        self.assertEqual(blob.downloads, 2)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class TestReadJsonFiles(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def test_read_json_files_from_gcs(self):
+        bucket = FakeBucket(
+            "bucket",
+            {
+                "run/iteration_1/a.json": document_json("10"),
+                "run/iteration_1/notes.txt": b"",
+                "run/iteration_2/a.json": document_json("12"),
+            },
+        )
+        patcher = patch.object(
+            json_folder_comparison.storage,
+            "Client",
+            return_value=FakeStorageClient(bucket),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        data = read_json_files_from_gcs(
+            "bucket",
+            ["run/iteration_1/", "run/iteration_2/"],
+            cache_dir=os.path.join(self.tmp_dir, "cache"),
+        )
+
+        self.assertEqual(
+            [(row["folder_index"], row["filename"], row["Text"]) for row in data],
+            [(1, "a.json", "10"), (2, "a.json", "12")],
+        )
+
+    def test_read_json_files_from_folders(self):
+        for iteration, text in [(1, "10"), (2, "12")]:
+            folder = Path(self.tmp_dir, f"iteration_{iteration}", "nested")
+            folder.mkdir(parents=True)
+            Path(folder, "a.json").write_bytes(document_json(text))
+            Path(folder, "notes.txt").write_text("")
+
+        data = read_json_files_from_folders(
+            [
+                os.path.join(self.tmp_dir, "iteration_1"),
+                os.path.join(self.tmp_dir, "iteration_2"),
+            ]
+        )
+
+        self.assertEqual(
+            [(row["folder_index"], row["filename"], row["Text"]) for row in data],
+            [(1, "a.json", "10"), (2, "a.json", "12")],
+        )
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.mocks = {}
+        for name in [
+            "read_json_files_from_gcs",
+            "read_json_files_from_folders",
+            "save_to_xlsx",
+            "upload_xlsx_to_gcs",
+        ]:
+            patcher = patch.object(json_folder_comparison, name, return_value=[])
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.mocks["read_json_files_from_gcs"].return_value = [
+            {
+                "folder_index": 1,
+                "filename": "a.json",
+                "Entity_name": "total",
+                "Text": "10",
+                "Page_Number": 0,
+                "Bounding_Box": [0.1, 0.1, 0.2, 0.2],
+            }
+        ]
+        self.mocks["read_json_files_from_folders"].return_value = self.mocks[
+            "read_json_files_from_gcs"
+        ].return_value
+
+    def test_reads_gcs_path(self):
+        json_folder_comparison.main(
+            "gs://bucket/run/", 2, "report", "gs://results/out/", "2024-01-01"
+        )
+
+        self.mocks["read_json_files_from_gcs"].assert_called_once_with(
+            "bucket", ["run/iteration_1/", "run/iteration_2/"]
+        )
+        self.mocks["read_json_files_from_folders"].assert_not_called()
+        self.mocks["upload_xlsx_to_gcs"].assert_called_once_with(
+            "results",
+            "report_output.xlsx",
+            "out/consistency/report_output_2024-01-01.xlsx",
+        )
+
+    def test_reads_local_path(self):
+        json_folder_comparison.main(
+            "output", 2, "report", "gs://results/out/", "2024-01-01"
+        )
+
+        self.mocks["read_json_files_from_folders"].assert_called_once_with(
+            [
+                os.path.join("output", "iteration_1"),
+                os.path.join("output", "iteration_2"),
+            ]
+        )
+        self.mocks["read_json_files_from_gcs"].assert_not_called()
+        df = self.mocks["save_to_xlsx"].call_args[0][0]
+        self.assertEqual(list(df["Consistency_Percentage"]), [50.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
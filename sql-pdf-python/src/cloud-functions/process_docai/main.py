@@ -1,3 +1,4 @@
+from functools import lru_cache
 import json
 import re
 import urllib.request
@@ -43,6 +44,13 @@ project_number = get_project_number(project_id)
 storage_client = storage.Client()
 
 
+@lru_cache(maxsize=None)
+def get_docai_client(location: str) -> documentai.DocumentProcessorServiceClient:
+    """Return the Document AI client for the location, creating it on first use"""
+    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+    return documentai.DocumentProcessorServiceClient(client_options=opts)
+
+
 def get_doc(request):
     request_json = request.get_json(silent=True)
 
@@ -69,8 +77,7 @@ def get_doc(request):
             "image/webp",
             "image/bmp",
         }
-        opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-        docai_client = documentai.DocumentProcessorServiceClient(client_options=opts)
+        docai_client = get_docai_client(location)
         processor = docai_client.processor_path(project_number, location, processor_id)
 
         if content_type in accepted_file_types:
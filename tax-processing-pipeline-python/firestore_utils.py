@@ -14,16 +14,26 @@
 
 """Cloud Firestore Utility Functions"""
 
+from functools import lru_cache
+
 from google.cloud import firestore
 
 
+@lru_cache(maxsize=None)
+def get_firestore_client(project_id: str) -> firestore.Client:
+    """
+    Returns the Firestore client for the project, created on first use.
+    """
+    return firestore.Client(project_id)
+
+
 def save_to_firestore(
     project_id: str, collection: str, document_id: str, data: dict
 ) -> None:
     """
     Saves data to Firestore.
     """
-    firestore_client = firestore.Client(project_id)
+    firestore_client = get_firestore_client(project_id)
     doc_ref = firestore_client.collection(collection).document(document_id)
     doc_ref.set(data)
 
@@ -38,7 +48,7 @@ def read_collection(project_id: str, collection: str) -> dict:
         }
     }
     """
-    firestore_client = firestore.Client(project_id)
+    firestore_client = get_firestore_client(project_id)
     collection_ref = firestore_client.collection(collection)
     return {doc.id: doc.to_dict() for doc in collection_ref.stream()}
 
@@ -47,7 +57,7 @@ def delete_collection(project_id: str, collection: str):
     """
     Deletes all documents from a collection in Firestore.
     """
-    firestore_client = firestore.Client(project_id)
+    firestore_client = get_firestore_client(project_id)
     collection_ref = firestore_client.collection(collection)
 
     for doc in collection_ref.stream():
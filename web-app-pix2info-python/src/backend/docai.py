@@ -13,6 +13,7 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+from functools import cache
 from io import BytesIO
 import logging
 from mimetypes import guess_type
@@ -41,8 +42,9 @@ DocumentJson: TypeAlias = str
 DocumentData: TypeAlias = tuple[Document, DocumentJson]
 
 
+@cache
 def get_client(location: str) -> DocumentProcessorServiceClient:
-    """Return a Document AI client."""
+    """Return the Document AI client for the location, shared across requests."""
     client_options = dict(api_endpoint=f"{location}-documentai.googleapis.com")
     return DocumentProcessorServiceClient(client_options=client_options)
 
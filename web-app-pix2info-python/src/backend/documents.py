@@ -0,0 +1,95 @@
+"""
+Copyright 2023 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from dataclasses import field
+from hashlib import sha256
+from threading import Lock
+from typing import cast, TypeAlias
+
+from google.cloud.documentai_v1 import Document
+from PIL import Image
+
+# Parsed documents kept in memory (a document can weigh tens of MiB once parsed)
+DOCUMENT_CACHE_SIZE = 8
+
+DocumentId: TypeAlias = str
+PageIndex: TypeAlias = int
+TextHeights: TypeAlias = tuple[int, int]
+
+
+@dataclass
+class CachedDocument:
+    """Parsed document, with its page images and text metrics computed on first use."""
+
+    document: Document
+    page_images: dict[PageIndex, Image.Image] = field(default_factory=dict)
+    text_heights: dict[PageIndex, TextHeights] = field(default_factory=dict)
+
+
+class DocumentCache:
+    """Thread-safe LRU cache of parsed documents."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.documents: OrderedDict[DocumentId, CachedDocument] = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, document_id: DocumentId) -> CachedDocument | None:
+        with self.lock:
+            cached = self.documents.get(document_id)
+            if cached is not None:
+                self.documents.move_to_end(document_id)
+            return cached
+
+    def put(self, document_id: DocumentId, document: Document) -> CachedDocument:
+        with self.lock:
+            cached = self.documents.get(document_id)
+            if cached is None:
+                cached = CachedDocument(document)
+                self.documents[document_id] = cached
+            self.documents.move_to_end(document_id)
+            while self.max_size < len(self.documents):
+                self.documents.popitem(last=False)
+            return cached
+
+
+DOCUMENT_CACHE = DocumentCache(DOCUMENT_CACHE_SIZE)
+
+
+def document_id_for_json(document_json: str) -> DocumentId:
+    """Return a stable ID for the json serialization shared with the frontend."""
+    return sha256(document_json.encode("utf-8")).hexdigest()
+
+
+def cache_document(
+    document_json: str,
+    document: Document | None = None,
+) -> tuple[DocumentId, CachedDocument]:
+    """Return the cached document, parsing the json only if not cached yet."""
+    document_id = document_id_for_json(document_json)
+    cached = DOCUMENT_CACHE.get(document_id)
+    if cached is None:
+        if document is None:
+            document = cast(Document, Document.from_json(document_json))
+        cached = DOCUMENT_CACHE.put(document_id, document)
+
+    return document_id, cached
+
+
+def cached_document(document_id: DocumentId) -> CachedDocument | None:
+    """Return the document previously cached with cache_document() (if still cached)."""
+    return DOCUMENT_CACHE.get(document_id)
@@ -16,18 +16,25 @@ limitations under the License.
 from dataclasses import dataclass
 from dataclasses import field
 from dataclasses import InitVar
+from functools import cache
+from functools import lru_cache
 from io import BytesIO
+from itertools import combinations
 import os
 import statistics
 from typing import Any, cast, Iterable, Iterator, MutableSequence, Sequence, TypeAlias
 
 from google.cloud.documentai_v1 import BoundingPoly
 from google.cloud.documentai_v1 import Document
+from PIL import GifImagePlugin
 from PIL import Image
+from PIL import ImageChops
 from PIL import ImageColor
 from PIL import ImageDraw
 from PIL import ImageFont
 
+from .documents import cache_document
+from .documents import CachedDocument
 from .options import ImageFormat
 from .options import Options
 
@@ -49,6 +56,7 @@ PilColor: TypeAlias = str
 Vertex: TypeAlias = tuple[int, int]
 Vertices: TypeAlias = tuple[Vertex, ...]
 ImageIterator: TypeAlias = Iterator[PilImage]
+ImageChunks: TypeAlias = Iterator[bytes]
 Confidence: TypeAlias = float
 CalloutInfoBase: TypeAlias = tuple[Vertices | None, str, Confidence | None]
 BgColor: TypeAlias = PilColor
@@ -95,21 +103,57 @@ FONT_FAMILY_LINUX = "DejaVuSansMono-Bold.ttf"
 # Consolas is installed by default on Windows
 FONT_FAMILY_WIN = "consolab.ttf"
 FONT_FAMILY = FONT_FAMILY_WIN if os.name == "nt" else FONT_FAMILY_LINUX
+# GIF palette reference: base image sample size (max width/height), max number of
+# translucent overlays stacked on the same pixel, steps of the anti-aliasing ramps
+GIF_PALETTE_SAMPLE_SIZE = 128
+GIF_PALETTE_MAX_STACKED_OVERLAYS = 4
+GIF_PALETTE_RAMP_STEPS = 4
+GIF_PALETTE_SWATCH_SIZE = 4
+# Measured callout texts kept in memory (entity texts repeat across renders)
+TEXT_SIZE_CACHE_SIZE = 4096
 
 
 def render(document_json: str, options_json: str) -> tuple[BytesIO, str]:
     """Render the document current page and return the image and mimetype."""
-    demo = Demo(document_json, options_json)
+    _, cached = cache_document(document_json)
+
+    return render_cached(cached, options_json)
+
+
+def render_cached(cached: CachedDocument, options_json: str) -> tuple[BytesIO, str]:
+    """Render the cached document current page and return the image and mimetype."""
+    demo = Demo(cached, options_json)
     image_io = do_render(demo)
     mimetype = demo.options.format.mimetype()
 
     return image_io, mimetype
 
 
+def render_stream(document_json: str, options_json: str) -> tuple[ImageChunks, str]:
+    """Render the document current page and return the image chunks and mimetype."""
+    _, cached = cache_document(document_json)
+
+    return render_cached_stream(cached, options_json)
+
+
+def render_cached_stream(
+    cached: CachedDocument, options_json: str
+) -> tuple[ImageChunks, str]:
+    """Render the cached document current page and return the image chunks and mimetype.
+
+    Animated GIFs are encoded while iterating the chunks, frame by frame.
+    """
+    demo = Demo(cached, options_json)
+    image_chunks = do_render_stream(demo)
+    mimetype = demo.options.format.mimetype()
+
+    return image_chunks, mimetype
+
+
 @dataclass
 class Demo:
-    # Initialization data sent by the frontend
-    document_json: InitVar[str]
+    # Initialization data (document cached in the backend + options sent by the frontend)
+    cached: InitVar[CachedDocument]
     options_json: InitVar[str]
     # Data
     options: Options = field(init=False)
@@ -130,11 +174,11 @@ class Demo:
     text_padding: int = field(init=False)
     image: PilImage = field(init=False)
     draw: PilDraw = field(init=False)
-    rendering: bool = field(init=False)
+    callouts: list[CalloutInfo] = field(init=False)
     frame_count: int = field(init=False)
 
-    def __post_init__(self, document_json: str, options_json: str):
-        init_from_json(self, document_json, options_json)
+    def __post_init__(self, cached: CachedDocument, options_json: str):
+        init_from_cache(self, cached, options_json)
 
     @classmethod
     def blocks_sorted_by_reading_order(
@@ -182,12 +226,13 @@ def reading_order_key_for_text_anchor(
     return (start_index, end_index)
 
 
-def init_from_json(demo: Demo, document_json: str, options_json: str):
+def init_from_cache(demo: Demo, cached: CachedDocument, options_json: str):
     demo.options = Options.from_json(options_json)
-    demo.document = cast(Document, Document.from_json(document_json))
-    demo.page = demo.document.pages[demo.options.page - 1]
+    demo.document = cached.document
+    page_index = demo.options.page - 1
+    demo.page = demo.document.pages[page_index]
     init_confidence(demo)
-    init_rendering(demo)
+    init_rendering(demo, cached, page_index)
 
 
 def init_confidence(demo: Demo):
@@ -206,15 +251,26 @@ def init_confidence(demo: Demo):
     demo.show_confidence = options.confidence and can_show_confidence()
 
 
-def init_rendering(demo: Demo):
-    demo.image = normalize_image(BytesIO(demo.page.image.content))
+def base_image_for_page(cached: CachedDocument, page_index: int) -> PilImage:
+    """Return the decoded page image (shared: copy it before drawing)."""
+    image = cached.page_images.get(page_index)
+    if image is None:
+        page = cached.document.pages[page_index]
+        image = normalize_image(BytesIO(page.image.content))
+        image.load()
+        cached.page_images[page_index] = image
+
+    return image
+
+
+def init_rendering(demo: Demo, cached: CachedDocument, page_index: int):
+    demo.image = base_image_for_page(cached, page_index).copy()
     # Memorize original input dimensions (output image may be expanded)
     demo.input_width = demo.image.width
     demo.input_height = demo.image.height
     init_crop_boxes(demo)
-    init_font_and_image(demo)
+    init_font_and_image(demo, cached, page_index)
     demo.draw = ImageDraw.Draw(demo.image, mode="RGBA")
-    demo.rendering = True
     demo.frame_count = 1
 
 
@@ -241,8 +297,9 @@ def init_crop_boxes(demo: Demo):
     demo.image_crop_box = demo.page_crop_box
 
 
-def init_font_and_image(demo: Demo):
+def init_font_and_image(demo: Demo, cached: CachedDocument, page_index: int):
     demo.border_width = int(0.003 * demo.input_width)
+    demo.callouts = []
 
     options = demo.options
     expand_image = options.barcodes or options.entities
@@ -256,14 +313,11 @@ def init_font_and_image(demo: Demo):
         demo.text_padding = 0
         return
 
-    img_max_x, img_max_y = demo.input_width - 1, demo.input_height - 1
-    heights = [
-        layout_height(item.layout, img_max_x, img_max_y) for item in demo.page.tokens
-    ]
-    demo.text_height_min = min(heights)
-    demo.text_height_median = statistics.median_low(heights)
-    demo.font_min = ImageFont.truetype(FONT_FAMILY, size=demo.text_height_min)
-    demo.font_median = ImageFont.truetype(FONT_FAMILY, size=demo.text_height_median)
+    demo.text_height_min, demo.text_height_median = text_heights_for_page(
+        demo, cached, page_index
+    )
+    demo.font_min = load_font(FONT_FAMILY, demo.text_height_min)
+    demo.font_median = load_font(FONT_FAMILY, demo.text_height_median)
     text_outline_width = int(demo.text_height_median * TEXT_OUTLINE_HEIGHT_RATIO + 0.5)
     text_outline_width = max(text_outline_width, TEXT_OUTLINE_MIN_WIDTH)
     demo.text_outline_width = text_outline_width
@@ -272,7 +326,9 @@ def init_font_and_image(demo: Demo):
     # Image may need to be expanded to display additional information on the right side
     if not expand_image:
         return
-    coords = [(x, y) for _, _, (_, _, x, y), _, _, _ in callout_info(demo)]
+    # Callouts are laid out once and reused for frame planning and rendering
+    demo.callouts = list(callout_info(demo))
+    coords = [(x, y) for _, _, (_, _, x, y), _, _, _ in demo.callouts]
     if not coords:
         return
 
@@ -285,6 +341,7 @@ def init_font_and_image(demo: Demo):
     )
     max_x = demo.image_crop_box[2]
     max_y = demo.image_crop_box[3]
+    img_max_x, img_max_y = demo.input_width - 1, demo.input_height - 1
     pad_w, pad_h = max(0, max_x - img_max_x), max(0, max_y - img_max_y)
     if pad_w == 0 and pad_h == 0:
         return
@@ -298,6 +355,36 @@ def init_font_and_image(demo: Demo):
     demo.image = padded
 
 
+def text_heights_for_page(
+    demo: Demo, cached: CachedDocument, page_index: int
+) -> tuple[int, int]:
+    """Return the min and median token heights of the page (computed once per page)."""
+    text_heights = cached.text_heights.get(page_index)
+    if text_heights is None:
+        img_max_x, img_max_y = demo.input_width - 1, demo.input_height - 1
+        heights = [
+            layout_height(item.layout, img_max_x, img_max_y)
+            for item in demo.page.tokens
+        ]
+        text_heights = min(heights), statistics.median_low(heights)
+        cached.text_heights[page_index] = text_heights
+
+    return text_heights
+
+
+@cache
+def load_font(font_family: str, size: int) -> PilFont:
+    """Return the loaded font (shared across renders, fonts are not modified)."""
+    return ImageFont.truetype(font_family, size=size)
+
+
+@lru_cache(maxsize=TEXT_SIZE_CACHE_SIZE)
+def text_size(font: PilFont, text: str) -> tuple[int, int]:
+    """Return the (width, height) of the text, including its offset from the origin."""
+    _, _, right, bottom = font.getbbox(text)
+    return int(right), int(bottom)
+
+
 def layout_height(layout: Layout, max_x: int, max_y: int) -> int:
     top_right, bottom_right = layout.bounding_poly.normalized_vertices[1:3]
     dx = bottom_right.x - top_right.x
@@ -329,20 +416,28 @@ def tiff_container_for_images(images: Sequence[BytesIO]) -> tuple[BytesIO, str]:
 
 
 def do_render(demo: Demo) -> BytesIO:
-    image_io = do_render_pass1(demo)
-    image_io = do_render_pass2(demo, image_io)
+    image_io = BytesIO()
+    for chunk in do_render_stream(demo):
+        image_io.write(chunk)
+    image_io.seek(0)
     return image_io
 
 
-def do_render_pass1(demo: Demo) -> BytesIO:
-    next_frames = render_frames(demo)
+def do_render_stream(demo: Demo) -> ImageChunks:
+    copy_frame = prepare_rendering(demo)
+    if 1 < demo.frame_count and demo.options.format == ImageFormat.GIF:
+        return animated_gif_chunks(demo)
+    image_io = do_render_image(demo, copy_frame)
+    return iter((image_io.getvalue(),))
+
+
+def do_render_image(demo: Demo, copy_frame: bool) -> BytesIO:
+    next_frames = render_frames(demo, copy_frame)
     first_frame = next(next_frames)
     format = demo.options.format
 
     params: dict[str, Any] = dict()
     if 1 < demo.frame_count:
-        if format == ImageFormat.GIF:
-            format = ImageFormat.PNG  # Optimize as GIF in pass 2
         image_sequence = FrameSequence(format, next_frames)
         durations = animation_durations(demo)
         params.update(save_all=True, append_images=image_sequence, duration=durations)
@@ -355,21 +450,6 @@ def do_render_pass1(demo: Demo) -> BytesIO:
     return image_io
 
 
-def do_render_pass2(demo: Demo, input_io: BytesIO) -> BytesIO:
-    if demo.frame_count <= 1 or demo.options.format != ImageFormat.GIF:
-        return input_io
-
-    next_frames = gif_frames_gen(input_io)
-    first_frame = next(next_frames)
-    params = dict(format="GIF", save_all=True, append_images=next_frames)
-
-    image_io = BytesIO()
-    first_frame.save(image_io, **params)
-    image_io.seek(0)
-
-    return image_io
-
-
 class FrameSequence:
     """Optimization to support generators in PilImage.save(append_images=...).
     Reduces memory consumption by limiting frame copies (can reach XX GiB otherwise).
@@ -401,29 +481,125 @@ def animation_durations(demo: Demo) -> list[int]:
     return durations
 
 
-def gif_frames_gen(image_io: BytesIO) -> ImageIterator:
-    image = Image.open(image_io)
-    assert 1 < image.n_frames
-
-    # Build a paletted reference image with the most significant colors
-    # The animation is iterative, with layers building up upon the first frame
-    # Use first + last frames (some parts can gradually get hidden)
-    ref = Image.new(image.mode, (image.width, image.height * 2))
-    ref.paste(image, (0, 0))
-    image.seek(image.n_frames - 1)
-    ref.paste(image, (0, image.height))
+def animated_gif_chunks(demo: Demo) -> ImageChunks:
+    """Encode the animation as GIF in a single pass, yielding each frame once drawn.
 
+    All frames share a global palette built up front, and each frame only encodes
+    the region that changed since the previous one.
+    """
+    palette_ref = gif_palette_reference(demo)
     # Quantize all frames to 8bpp (base image was dithered in prepare_rendering)
     method = Image.Quantize.FASTOCTREE.value  # Best method for overlays
     dither = Image.Dither.NONE  # No dithering (fastest + no visual artefacts)
-    ref = ref.quantize(method=method, dither=dither)
-    for frame_index in range(image.n_frames):
-        image.seek(frame_index)
-        yield image.quantize(palette=ref, dither=dither, method=method)
+    durations = animation_durations(demo)
+
+    previous: PilImage | None = None
+    for frame_index, frame in enumerate(render_frames(demo, copy_frame=False)):
+        frame = frame.quantize(palette=palette_ref, dither=dither, method=method)
+        chunks: list[bytes] = []
+        bbox: tuple[int, int, int, int]
+        if previous is None:
+            header, _ = GifImagePlugin.getheader(frame, info=dict(loop=0))
+            chunks.extend(header)
+            bbox = (0, 0, frame.width, frame.height)
+        else:
+            changed_bbox = ImageChops.subtract_modulo(frame, previous).getbbox()
+            # An unchanged frame is still encoded for its duration
+            bbox = (0, 0, 1, 1) if changed_bbox is None else changed_bbox
+        offset = (bbox[0], bbox[1])
+        duration = durations[frame_index]
+        frame_data = GifImagePlugin.getdata(frame.crop(bbox), offset, duration=duration)
+        chunks.extend(frame_data)
+        yield b"".join(chunks)
+        previous = frame
+
+    yield b";"  # GIF trailer
+
+
+def gif_palette_reference(demo: Demo) -> PilImage:
+    """Return a paletted image with the most significant colors of the animation.
+
+    The animation is iterative, with layers building up upon the first frame. The
+    reference is derived up front from the base image and the planned overlay colors:
+    - base image blended with every stack of translucent overlays (highlights),
+    - ramps between opaque colors (anti-aliased text and outlines).
+    """
+    base = demo.image.crop(demo.image_crop_box) if demo.options.cropped else demo.image
+    sample = base.copy()
+    sample_size = (GIF_PALETTE_SAMPLE_SIZE, GIF_PALETTE_SAMPLE_SIZE)
+    sample.thumbnail(sample_size, Image.Resampling.NEAREST)  # Keep exact colors
+
+    translucent_colors: list[tuple[int, ...]] = []
+    opaque_colors: list[tuple[int, ...]] = []
+    for color in planned_overlay_colors(demo):
+        rgba = ImageColor.getrgb(color)
+        if len(rgba) == 4 and rgba[3] != 0xFF:
+            translucent_colors.append(rgba)
+        else:
+            opaque_colors.append(rgba[:3])
+
+    layers = [sample]
+    max_stacked = min(len(translucent_colors), GIF_PALETTE_MAX_STACKED_OVERLAYS)
+    for stacked in range(1, max_stacked + 1):
+        for overlays in combinations(translucent_colors, stacked):
+            layer = sample.copy()
+            draw = ImageDraw.Draw(layer, mode="RGBA")
+            for overlay in overlays:
+                draw.rectangle((0, 0, layer.width, layer.height), fill=overlay)
+            layers.append(layer)
+
+    swatches = list(opaque_colors)
+    steps = GIF_PALETTE_RAMP_STEPS
+    for rgb1, rgb2 in combinations(opaque_colors, 2):
+        for step in range(1, steps):
+            t = step / steps
+            swatches.append(
+                tuple(int(c1 * (1 - t) + c2 * t + 0.5) for c1, c2 in zip(rgb1, rgb2))
+            )
 
+    size = GIF_PALETTE_SWATCH_SIZE
+    width = max(sample.width, size * len(swatches))
+    height = sample.height * len(layers) + size
+    ref = Image.new(sample.mode, (width, height), PADDING_BG_COLOR)
+    for i, layer in enumerate(layers):
+        ref.paste(layer, (0, i * sample.height))
+    for i, rgb in enumerate(swatches):
+        ref.paste(rgb, (i * size, height - size, (i + 1) * size, height))
 
-def render_frames(demo: Demo) -> ImageIterator:
-    copy_frame = prepare_rendering(demo)
+    method = Image.Quantize.FASTOCTREE.value  # Best method for overlays
+    dither = Image.Dither.NONE
+    return ref.quantize(method=method, dither=dither)
+
+
+def planned_overlay_colors(demo: Demo) -> list[PilColor]:
+    """Return the colors drawn over the base image, in rendering order."""
+    options = demo.options
+    colors: list[PilColor] = []
+    for level, (enabled, items) in ocr_levels(demo).items():
+        if enabled and items:
+            colors.append(color_transparent_like_a_highlighter(OCR_LEVEL_COLOR[level]))
+    if options.tables and demo.page.tables:
+        colors.append(color_transparent_for_outlines(TABLE_OUTLINE_COLOR))
+    if options.fields and demo.page.form_fields:
+        colors.append(color_transparent_for_outlines(FORM_FIELD_NAME_COLOR))
+        colors.append(color_transparent_for_outlines(FORM_FIELD_VALUE_COLOR))
+        colors.append(CHECK_BOX_OUTLINE_COLOR)
+        colors.append(FORM_FIELD_VALUE_COLOR)
+    if demo.show_confidence:
+        colors.extend(
+            (CONFIDENCE_TEXT_COLOR, DEFAULT_BG_COLOR, LOW_CONFIDENCE_BG_COLOR)
+        )
+    for vertices, _, _, _, bg_color, fg_color in demo.callouts:
+        if vertices is not None:
+            colors.append(color_transparent_like_a_highlighter(fg_color))
+        colors.extend((bg_color, fg_color))
+    if demo.callouts:
+        colors.append(DEFAULT_TEXT_COLOR)
+
+    return list(dict.fromkeys(colors))  # Unique colors, in order
+
+
+def render_frames(demo: Demo, copy_frame: bool) -> ImageIterator:
     for frame in render_full_frames(demo):
         if demo.options.cropped:
             yield frame.crop(demo.image_crop_box)
@@ -432,9 +608,7 @@ def render_frames(demo: Demo) -> ImageIterator:
 
 
 def prepare_rendering(demo: Demo) -> bool:
-    demo.rendering = False
-    demo.frame_count = sum(1 for _ in render_full_frames(demo))
-    demo.rendering = True
+    demo.frame_count = planned_frame_count(demo)
     copy_frame = 1 < demo.frame_count and demo.options.format == ImageFormat.WEBP
 
     if demo.options.format == ImageFormat.GIF and 1 < demo.frame_count:
@@ -447,6 +621,37 @@ def prepare_rendering(demo: Demo) -> bool:
     return copy_frame
 
 
+def planned_frame_count(demo: Demo) -> int:
+    """Return the number of frames yielded by render_full_frames, without drawing.
+
+    Must be kept in sync with the render_* generators below.
+    """
+    if not demo.options.animated:
+        return 1  # Only the final image
+
+    options = demo.options
+    frame_count = 1  # Base image
+    for enabled, items in ocr_levels(demo).values():
+        if enabled:
+            frame_count += len(items)
+    if options.tables:
+        for table in demo.page.tables:
+            for row in (*table.header_rows, *table.body_rows):
+                frame_count += len(row.cells)
+    if options.fields:
+        # Field name + field value (+ confidence of the field name)
+        frames_per_field = 3 if demo.show_confidence else 2
+        for form_field in demo.page.form_fields:
+            frame_count += frames_per_field
+            if form_field.value_type in (FILLED_CHECKBOX, UNFILLED_CHECKBOX):
+                frame_count += 1
+    for vertices, *_ in demo.callouts:
+        # Reference item + path to the callout (if located) + callout
+        frame_count += 1 if vertices is None else 3
+
+    return frame_count
+
+
 def render_full_frames(demo: Demo) -> ImageIterator:
     yield from show_if_animated(demo)
 
@@ -468,20 +673,22 @@ def show_if_not_animated(demo: Demo) -> ImageIterator:
         yield demo.image
 
 
-def render_ocr_levels(demo: Demo) -> ImageIterator:
-    levels = dict(
+def ocr_levels(demo: Demo) -> dict[str, tuple[bool, Sequence]]:
+    return dict(
         blocks=(demo.options.blocks, demo.page.blocks),
         paragraphs=(demo.options.paragraphs, demo.page.paragraphs),
         lines=(demo.options.lines, demo.page.lines),
         tokens=(demo.options.tokens, demo.page.tokens),
     )
-    for level, (enabled, items) in levels.items():
+
+
+def render_ocr_levels(demo: Demo) -> ImageIterator:
+    for level, (enabled, items) in ocr_levels(demo).items():
         if not enabled:
             continue
         color = OCR_LEVEL_COLOR[level]
         for item in items:  # type: ignore
-            if demo.rendering:
-                render_layout(demo, item.layout, color)
+            render_layout(demo, item.layout, color)
             yield from show_if_animated(demo)
 
 
@@ -492,10 +699,9 @@ def render_tables(demo: Demo) -> ImageIterator:
     for table in demo.page.tables:
         for row in (*table.header_rows, *table.body_rows):
             for cell in row.cells:
-                if demo.rendering:
-                    xy = vertices_from_layout(demo, cell.layout)
-                    # Table cell bounding boxes are straight rectangles
-                    render_round_rectangle(demo, xy, color)
+                xy = vertices_from_layout(demo, cell.layout)
+                # Table cell bounding boxes are straight rectangles
+                render_round_rectangle(demo, xy, color)
                 yield from show_if_animated(demo)
 
 
@@ -512,10 +718,9 @@ def render_form_field(demo: Demo, form_field: FormField) -> ImageIterator:
     for i, layout in enumerate((form_field.field_name, form_field.field_value)):
         is_key = i == 0
         xy = vertices_from_layout(demo, layout)
-        if demo.rendering:
-            color = FORM_FIELD_NAME_COLOR if is_key else FORM_FIELD_VALUE_COLOR
-            # Form field bounding boxes are straight rectangles
-            render_round_rectangle(demo, xy, color)
+        color = FORM_FIELD_NAME_COLOR if is_key else FORM_FIELD_VALUE_COLOR
+        # Form field bounding boxes are straight rectangles
+        render_round_rectangle(demo, xy, color)
         yield from show_if_animated(demo)
 
         if is_key and render_confidence(demo, layout, xy):
@@ -523,37 +728,31 @@ def render_form_field(demo: Demo, form_field: FormField) -> ImageIterator:
 
     if xy is None or form_field.value_type not in (FILLED_CHECKBOX, UNFILLED_CHECKBOX):
         return
-    if demo.rendering:
-        checkbox_filled = form_field.value_type == FILLED_CHECKBOX
-        text = "[×]" if checkbox_filled else "[ ]"
-        center_xy = center_vertex(xy)
-        text_color = FORM_FIELD_VALUE_COLOR
-        outline_color = CHECK_BOX_OUTLINE_COLOR
-        render_centered_text(demo, text, center_xy, text_color, outline_color)
+    checkbox_filled = form_field.value_type == FILLED_CHECKBOX
+    text = "[×]" if checkbox_filled else "[ ]"
+    center_xy = center_vertex(xy)
+    text_color = FORM_FIELD_VALUE_COLOR
+    outline_color = CHECK_BOX_OUTLINE_COLOR
+    render_centered_text(demo, text, center_xy, text_color, outline_color)
     yield from show_if_animated(demo)
 
 
 def render_callout_info(demo: Demo) -> ImageIterator:
-    for vertices, text, r, text_xy, bg_color, fg_color in callout_info(demo):
+    for vertices, text, r, text_xy, bg_color, fg_color in demo.callouts:
         if vertices is not None:
-            if demo.rendering:
-                # Draw the reference item
-                render_vertices(demo, vertices, fg_color)
-                demo.draw.polygon(vertices, outline=fg_color, width=2)
+            # Draw the reference item
+            render_vertices(demo, vertices, fg_color)
+            demo.draw.polygon(vertices, outline=fg_color, width=2)
             yield from show_if_animated(demo)
 
             # Highlight the path from the item to its callout
-            if demo.rendering:
-                path_xy = (vertices[1], (r[0], r[1]), (r[0], r[3]), vertices[2])
-                render_vertices(demo, path_xy, fg_color)
+            path_xy = (vertices[1], (r[0], r[1]), (r[0], r[3]), vertices[2])
+            render_vertices(demo, path_xy, fg_color)
             yield from show_if_animated(demo)
 
         # Draw the callout
-        if demo.rendering:
-            demo.draw.rectangle(r, fill=bg_color, outline=fg_color, width=2)
-            demo.draw.text(
-                text_xy, text, fill=DEFAULT_TEXT_COLOR, font=demo.font_median
-            )
+        demo.draw.rectangle(r, fill=bg_color, outline=fg_color, width=2)
+        demo.draw.text(text_xy, text, fill=DEFAULT_TEXT_COLOR, font=demo.font_median)
         yield from show_if_animated(demo)
 
 
@@ -579,8 +778,8 @@ def callout_info(demo: Demo) -> Iterator[CalloutInfo]:
     for callout_info_gen in callout_info_gens:
         for vertices, text, confidence in callout_info_gen:
             text = text.replace("\n", "\\n")  # Show new line characters
-            text_size = font.getsize(text)
-            box_w, box_h = text_size[0] + box_padding, text_size[1] + box_padding
+            text_w, text_h = text_size(font, text)
+            box_w, box_h = text_w + box_padding, text_h + box_padding
             rect = (box_x, box_y, box_x + box_w, box_y + box_h)
             text_xy = (box_x + demo.text_padding, box_y + demo.text_padding)
             box_y += offset_y
@@ -777,8 +976,6 @@ def render_vertices(demo: Demo, xy: Vertices, color: PilColor):
 def render_confidence(demo: Demo, layout: Layout, xy: Vertices) -> bool:
     if not demo.show_confidence:
         return False
-    if not demo.rendering:
-        return True
 
     text = f"{layout.confidence:.0%}"
     center_xy = center_vertex(xy)
@@ -0,0 +1,195 @@
+"""
+Copyright 2023 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import base64
+from io import BytesIO
+import json
+import unittest
+
+from PIL import Image
+
+from backend import render
+from backend.documents import cache_document
+
+PAGE_WIDTH = 400
+PAGE_HEIGHT = 300
+WORDS = ["Invoice", "1234", "Total", "56.78", "Paid"]
+
+
+def layout(text_index: int, box: tuple[float, float, float, float]) -> dict:
+    x_min, y_min, x_max, y_max = box
+    start_index = sum(len(word) + 1 for word in WORDS[:text_index])
+    return {
+        "textAnchor": {
+            "textSegments": [
+                {
+                    "startIndex": str(start_index),
+                    "endIndex": str(start_index + len(WORDS[text_index])),
+                }
+            ]
+        },
+        "confidence": 0.9,
+        "boundingPoly": {
+            "normalizedVertices": [
+                {"x": x_min, "y": y_min},
+                {"x": x_max, "y": y_min},
+                {"x": x_max, "y": y_max},
+                {"x": x_min, "y": y_max},
+            ]
+        },
+    }
+
+
+def small_document_json() -> str:
+    """A single page with tokens, lines, a block, a table, form fields and entities."""
+    image = Image.new("RGB", (PAGE_WIDTH, PAGE_HEIGHT), "white")
+    image_io = BytesIO()
+    image.save(image_io, format="PNG")
+
+    boxes = [
+        (0.1 + 0.15 * i, 0.1 + 0.15 * i, 0.22 + 0.15 * i, 0.18 + 0.15 * i)
+        for i in range(len(WORDS))
+    ]
+    tokens = [{"layout": layout(i, box)} for i, box in enumerate(boxes)]
+    page = {
+        "pageNumber": 1,
+        "dimension": {"width": PAGE_WIDTH, "height": PAGE_HEIGHT, "unit": "pixels"},
+        "image": {
+            "content": base64.b64encode(image_io.getvalue()).decode("ascii"),
+            "mimeType": "image/png",
+            "width": PAGE_WIDTH,
+            "height": PAGE_HEIGHT,
+        },
+        "layout": layout(0, (0.0, 0.0, 1.0, 1.0)),
+        "blocks": [{"layout": layout(0, (0.1, 0.1, 0.9, 0.9))}],
+        "lines": [{"layout": layout(i, box)} for i, box in enumerate(boxes[:3])],
+        "tokens": tokens,
+        "tables": [
+            {
+                "headerRows": [{"cells": [{"layout": layout(0, boxes[0])}]}],
+                "bodyRows": [
+                    {
+                        "cells": [
+                            {"layout": layout(1, boxes[1])},
+                            {"layout": layout(2, boxes[2])},
+                        ]
+                    }
+                ],
+            }
+        ],
+        "formFields": [
+            {
+                "fieldName": layout(2, boxes[2]),
+                "fieldValue": layout(3, boxes[3]),
+                "valueType": "text",
+            },
+            {
+                "fieldName": layout(4, boxes[4]),
+                "fieldValue": layout(4, boxes[4]),
+                "valueType": render.FILLED_CHECKBOX,
+            },
+        ],
+    }
+    entities = [
+        {
+            "type": "total_amount",
+            "mentionText": WORDS[3],
+            "confidence": 0.95,
+            "textAnchor": layout(3, boxes[3])["textAnchor"],
+            "pageAnchor": {
+                "pageRefs": [
+                    {"page": "0", "boundingPoly": layout(3, boxes[3])["boundingPoly"]}
+                ]
+            },
+        },
+        {"type": "currency", "mentionText": "USD", "confidence": 0.8},
+    ]
+    document = {
+        "mimeType": "image/png",
+        "text": " ".join(WORDS) + "\n",
+        "pages": [page],
+        "entities": entities,
+    }
+    return json.dumps(document)
+
+
+def options_json(**changes) -> str:
+    options = {
+        "page": 1,
+        "blocks": True,
+        "paragraphs": False,
+        "lines": True,
+        "tokens": True,
+        "tables": True,
+        "barcodes": False,
+        "fields": True,
+        "entities": True,
+        "animated": True,
+        "cropped": False,
+        "confidence": True,
+        "normalized": False,
+        "format": "gif",
+    }
+    options.update(changes)
+    return json.dumps(options)
+
+
+class TestAnimatedGif(unittest.TestCase):
+    def setUp(self):
+        _, self.cached = cache_document(small_document_json())
+
+    def test_planned_frame_count_matches_drawn_frames(self):
+        for changes in [{}, {"confidence": False}, {"cropped": True}]:
+            with self.subTest(**changes):
+                demo = render.Demo(self.cached, options_json(**changes))
+                planned = render.planned_frame_count(demo)
+
+                frames = sum(1 for _ in render.render_full_frames(demo))
+
+                self.assertEqual(planned, frames)
+
+    def test_streamed_gif_decodes_with_every_planned_frame(self):
+        for changes in [{}, {"cropped": True}]:
+            with self.subTest(**changes):
+                demo = render.Demo(self.cached, options_json(**changes))
+                chunks = list(render.do_render_stream(demo))
+
+                self.assertEqual(len(chunks) - 1, demo.frame_count)  # + GIF trailer
+                self.assertGreater(demo.frame_count, 1)
+                image = Image.open(BytesIO(b"".join(chunks)))
+                self.assertEqual(image.format, "GIF")
+                self.assertEqual(image.n_frames, demo.frame_count)
+                for frame_index in range(image.n_frames):
+                    image.seek(frame_index)
+                    image.load()
+                if demo.options.cropped:
+                    expected_size = demo.image.crop(demo.image_crop_box).size
+                else:
+                    expected_size = demo.image.size
+                self.assertEqual(image.size, expected_size)
+
+    def test_render_stream_returns_gif_chunks(self):
+        image_chunks, mimetype = render.render_cached_stream(
+            self.cached, options_json()
+        )
+
+        self.assertEqual(mimetype, "image/gif")
+        gif = b"".join(image_chunks)
+        self.assertTrue(gif.startswith(b"GIF89a"))
+        self.assertTrue(gif.endswith(b";"))
+
+
+if __name__ == "__main__":
+    unittest.main()
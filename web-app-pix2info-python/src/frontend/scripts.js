@@ -31,6 +31,8 @@ const CAPTURE_CONSTRAINTS = {
     // aspectRatio might be interesting (to match the proportions of a sheet of paper)
 }
 
+const HTTP_NOT_FOUND = 404
+
 const PDF = 'application/pdf'
 const SUPPORTED_TYPES = [
     PDF,
@@ -76,6 +78,8 @@ const gData = {
     // Output structured document (sent to the backend for the rendering)
     documentJson: null,
     documentSummary: null,
+    // ID of the parsed document cached by the backend (renders pages without documentJson)
+    documentId: null,
     // Drop effect for ondragover event
     dropEffect: 'none',
 }
@@ -101,7 +105,8 @@ class Sample {
 
 // Backend API
 
-async function callApi(url, formData = null) {
+// Responses with a status in handledStatuses are returned to the caller
+async function callApi(url, formData = null, handledStatuses = []) {
     const init = formData
         ? { method: 'POST', body: formData }
         : { method: 'GET' }
@@ -109,6 +114,7 @@ async function callApi(url, formData = null) {
         const t1 = performance.now()
 
         const response = await fetch(url, init)
+        if (handledStatuses.includes(response.status)) return response
         if (response.status != 200) {
             console.error(await response.text())
             return null
@@ -166,10 +172,17 @@ async function getProcessorAnalysis() {
 }
 
 async function renderDocument() {
-    const url = '/api/document/render'
     const formData = new FormData()
-    if (!addDocument(formData)) return null
     addOptions(formData)
+    if (gData.documentId) {
+        const url = `/api/document/${gData.documentId}/render`
+        const response = await callApi(url, formData, [HTTP_NOT_FOUND])
+        if (!response) return null
+        if (response.status != HTTP_NOT_FOUND) return response.blob()
+        // Document no longer cached by the backend: send it again
+    }
+    const url = '/api/document/render'
+    if (!addDocument(formData)) return null
     return blobFromApi(url, formData)
 }
 
@@ -456,6 +469,7 @@ async function onNewAnalysis(analysis) {
 
     gData.documentJson = analysis.json
     gData.documentSummary = analysis.summary
+    gData.documentId = analysis.document_id
 
     await renderOutputImage()
     updateOutputCard()
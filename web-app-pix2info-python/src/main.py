@@ -19,13 +19,14 @@ import logging
 from pathlib import Path
 
 from backend import docai
+from backend import documents
 from backend import processors
 from backend import render
 from backend import samples
 from flask import Flask
 from flask import jsonify
 from flask import request
-from flask import send_file
+from flask import Response
 from flask import send_from_directory
 from google.api_core.exceptions import BadRequest
 from google.api_core.exceptions import ClientError
@@ -89,11 +90,31 @@ def api_post_request(func):
     return wrapper_api_request
 
 
+def image_response(image_chunks: render.ImageChunks, mimetype: str) -> Response:
+    # Encode the first chunk (GIF header + first frame) before responding: errors
+    # while preparing the rendering are still reported by api_post_request
+    first_chunk = next(image_chunks, b"")
+
+    def stream_chunks():
+        yield first_chunk
+        try:
+            yield from image_chunks
+        except Exception:
+            # Status already sent: log and re-raise so the server drops the connection
+            # and the frontend gets a failed request rather than a truncated image
+            logging.exception("Rendering failed while streaming the image")
+            raise
+
+    return Response(stream_chunks(), mimetype=mimetype)
+
+
 def analysis_request(document_data: docai.DocumentData):
     document, json = document_data
     summary = dict(counts=docai.summary_counts_for_document(document))
+    # Keep the parsed document so the frontend can render pages by ID
+    document_id, _ = documents.cache_document(json, document)
 
-    return jsonify(json=json, summary=summary)
+    return jsonify(json=json, summary=summary, document_id=document_id)
 
 
 @app.post("/api/analysis/sample/<string:processor_name>/<string:sample_name>")
@@ -143,9 +164,26 @@ def render_document():
     if not options_json:
         raise BadRequest('Missing "options_json"')
 
-    image_io, mimetype = render.render(document_json, options_json)
+    # Animated GIFs are streamed while their frames are encoded
+    image_chunks, mimetype = render.render_stream(document_json, options_json)
+
+    return image_response(image_chunks, mimetype)
+
+
+@app.post("/api/document/<string:document_id>/render")
+@api_post_request
+def render_cached_document(document_id: str):
+    options_json = request.form.get("options_json", "")
+    if not options_json:
+        raise BadRequest('Missing "options_json"')
+    cached = documents.cached_document(document_id)
+    if cached is None:
+        # Evicted or cached by another instance: the frontend will send the full json
+        return f"Unknown document: {document_id}", 404
+
+    image_chunks, mimetype = render.render_cached_stream(cached, options_json)
 
-    return send_file(image_io, mimetype)
+    return image_response(image_chunks, mimetype)
 
 
 @app.get("/admin/processors/setup")